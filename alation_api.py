@@ -1,7 +1,198 @@
 # alation_api.py
+import functools
+import json
+import threading
+import time
+
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+try:
+    import orjson  # Optional; parses bytes directly and is several times faster than json on large pages.
+except ImportError:
+    orjson = None
+
+import app_logging
+import instrumentation
+
+logger = app_logging.get_logger("alation_api")
+
+DEFAULT_POOL_SIZE = 10
+DEFAULT_TIMEOUT = (5, 60)  # (connect, read) seconds
+DEFAULT_RETRIES = 3
+DEFAULT_BACKOFF_FACTOR = 0.5
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+DEFAULT_PAGE_SIZE = 250
+NEXT_PAGE_HEADER = 'X-Next-Page'
+MODIFIED_SINCE_PARAM = 'ts_updated__gt'  # v2 folder/document filter used by incremental syncs
+# Fields kept from paged folder/document records; everything else is dropped as each page is decoded.
+FOLDER_FIELDS = ('id', 'title', 'document_hub_id', 'parent_folder_id', 'ts_updated')
+DOCUMENT_FIELDS = ('id', 'title', 'template_id', 'document_hub_id', 'folder_ids', 'parent_folder_id', 'ts_updated')
+
+# (instance URL, user ID or None) -> AlationClient; each keeps its own token, so several instances, and several
+# users of one instance, can be used at once. A user ID of None is the active connection's client.
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+class AlationAPIError(Exception):
+    """Raised by the paginated fetchers when a page cannot be retrieved."""
+
+
+class AlationClient:
+    """
+    Owns a pooled, keep-alive requests.Session for one Alation instance.
+    Idempotent requests are retried with backoff on 429/5xx, and a 401 triggers a single
+    token refresh followed by a replay of the original request.
+    """
+
+    def __init__(self, alation_url, user_id=None, refresh_token=None, access_token=None,
+                 pool_size=DEFAULT_POOL_SIZE, timeout=DEFAULT_TIMEOUT, retries=DEFAULT_RETRIES,
+                 backoff_factor=DEFAULT_BACKOFF_FACTOR):
+        self.alation_url = alation_url.rstrip('/')
+        self.user_id = user_id
+        self.refresh_token = refresh_token
+        self.timeout = tuple(timeout) if isinstance(timeout, list) else timeout  # config.json stores lists
+        self.access_token = None
+        self.paging = PagingHints()
+        self._token_lock = threading.Lock()
+
+        retry = Retry(total=retries, backoff_factor=backoff_factor, status_forcelist=RETRY_STATUS_CODES,
+                      allowed_methods=frozenset(['GET', 'HEAD', 'OPTIONS']), raise_on_status=False,
+                      respect_retry_after_header=True)
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        if access_token:
+            self.set_access_token(access_token)
+
+    def set_access_token(self, access_token):
+        self.access_token = access_token
+        if access_token:
+            self.session.headers['Token'] = access_token
+        else:
+            self.session.headers.pop('Token', None)
+
+    def refresh_access_token(self, stale_token=None):
+        """
+        Exchanges the refresh token for a new API access token.
+        When stale_token is given and another thread has already replaced it, the refresh is skipped.
+        """
+        with self._token_lock:
+            if stale_token is not None and self.access_token and self.access_token != stale_token:
+                return True
+            if not (self.user_id and self.refresh_token):
+                logger.error("No refresh token configured. Cannot refresh API Access Token.")
+                return False
+            api_url = f"{self.alation_url}/integration/v1/createAPIAccessToken/"
+            body = {"refresh_token": self.refresh_token, "user_id": int(self.user_id)}
+            try:
+                logger.info("Attempting to refresh API Access Token...")
+                response = self._timed("POST", api_url, self.session.post, json=body, timeout=self.timeout)
+                if response.status_code == 201:
+                    self.set_access_token(response.json()['api_access_token'])
+                    logger.info("Successfully refreshed API Access Token.")
+                    return True
+                else:
+                    logger.error(f"Failed to refresh access token. Status: {response.status_code}, Response: {response.text}")
+                    self.set_access_token(None)
+                    return False
+            except requests.exceptions.RequestException as e:
+                logger.error(f"Network error during token refresh: {e}")
+                return False
+
+    def request(self, method, path, **kwargs):
+        """
+        Sends a request relative to the instance URL, refreshing the token once on a 401.
+        Raises requests.exceptions.RequestException on network failure.
+        """
+        url = path if path.startswith('http') else f"{self.alation_url}{path}"
+        kwargs.setdefault('timeout', self.timeout)
+        sent_token = self.access_token
+        response = self._timed(method, url, functools.partial(self.session.request, method), **kwargs)
+        if response.status_code == 401 and self.refresh_token:
+            logger.info("API Access Token rejected (401). Refreshing and retrying once...")
+            if self.refresh_access_token(stale_token=sent_token):
+                response = self._timed(method, url, functools.partial(self.session.request, method), replay=True,
+                                       **kwargs)
+        return response
+
+    @staticmethod
+    def _timed(method, url, send, replay=False, **kwargs):
+        """Calls send(url, **kwargs) and records it in instrumentation.registry; a 401 replay counts as a retry."""
+        started = time.perf_counter()
+        try:
+            response = send(url, **kwargs)
+        except requests.exceptions.RequestException:
+            instrumentation.record_failure(method, url, time.perf_counter() - started, extra_retries=int(replay))
+            raise
+        instrumentation.record_response(method, url, response, time.perf_counter() - started,
+                                        extra_retries=int(replay))
+        return response
+
+    def get(self, path, **kwargs):
+        return self.request('GET', path, **kwargs)
+
+    def post(self, path, **kwargs):
+        return self.request('POST', path, **kwargs)
+
+    def put(self, path, **kwargs):
+        return self.request('PUT', path, **kwargs)
+
+    def close(self):
+        self.session.close()
+
 
-current_api_access_token = None
+def _client_key(alation_url, user_id=None):
+    return alation_url.rstrip('/'), str(user_id) if user_id is not None else None
+
+
+def configure_client(alation_url, **client_options):
+    """
+    Replaces the active connection's client for alation_url with one built from client_options (pool_size,
+    timeout, retries, backoff_factor), keeping its credentials and access token.
+    """
+    key = _client_key(alation_url)
+    with _clients_lock:
+        old = _clients.pop(key, None)
+        client = _clients[key] = AlationClient(alation_url, access_token=old.access_token if old else None,
+                                               **client_options)
+        if old is not None:
+            client.user_id, client.refresh_token = old.user_id, old.refresh_token
+            old.close()
+        return client
+
+
+def get_client(alation_url, user_id=None, **client_options):
+    """
+    Returns the client for alation_url and user_id (None: the active connection's), creating (and pooling) it
+    on first use. Clients for different instances and users live side by side, each with its own session and
+    token. alation_url may also be an AlationClient, which is returned as is: every function in this module
+    takes one in place of a URL, so a profile can point them at its own client.
+    """
+    if isinstance(alation_url, AlationClient): return alation_url
+    key = _client_key(alation_url, user_id)
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = _clients[key] = AlationClient(alation_url, **client_options)
+        return client
+
+
+def close_client(alation_url, user_id=None):
+    """Closes and forgets the client for alation_url and user_id, if any."""
+    with _clients_lock:
+        client = _clients.pop(_client_key(alation_url, user_id), None)
+    if client is not None: client.close()
+
+
+def has_access_token(alation_url):
+    if isinstance(alation_url, AlationClient): return bool(alation_url.access_token)
+    with _clients_lock:
+        client = _clients.get(_client_key(alation_url))
+    return bool(client and client.access_token)
 
 
 def validate_api_token(alation_url, user_id, access_token):
@@ -9,105 +200,218 @@ def validate_api_token(alation_url, user_id, access_token):
     Validates the current API access token by attempting to fetch the user's own profile.
     """
     if not access_token:
-        print("LOG: No API Access Token present to validate.")
+        logger.info("No API Access Token present to validate.")
         return False
 
     headers = {'Token': access_token}
-    api_url = f"{alation_url}/integration/v2/user/{user_id}/"
+    api_url = f"/integration/v2/user/{user_id}/"
 
     try:
-        response = requests.get(api_url, headers=headers)
+        # Sent straight through the session so a 401 is reported rather than refreshed away.
+        client = get_client(alation_url)
+        response = client.session.get(f"{client.alation_url}{api_url}", headers=headers, timeout=client.timeout)
         if response.status_code == 200:
-            print("LOG: API Access Token is valid.")
+            logger.info("API Access Token is valid.")
             return True
         else:
-            print(f"LOG: API Access Token is invalid or expired. Status: {response.status_code}")
+            logger.info(f"API Access Token is invalid or expired. Status: {response.status_code}")
             return False
     except requests.exceptions.RequestException as e:
-        print(f"ERROR: Network error during token validation: {e}")
+        logger.error(f"Network error during token validation: {e}")
         return False
 
 
 def refresh_api_token(alation_url, user_id, refresh_token):
     """
     Refreshes the API access token using the refresh token.
+    The credentials are kept on the instance's client so later 401s can be refreshed transparently.
     """
-    global current_api_access_token
-    api_url = f"{alation_url}/integration/v1/createAPIAccessToken/"
-    body = {"refresh_token": refresh_token, "user_id": int(user_id)}
-    try:
-        print("LOG: Attempting to refresh API Access Token...")
-        response = requests.post(api_url, json=body)
-        if response.status_code == 201:
-            new_token_data = response.json()
-            current_api_access_token = new_token_data['api_access_token']
-            print("LOG: Successfully refreshed API Access Token.")
-            return True
+    client = get_client(alation_url)
+    client.user_id, client.refresh_token = user_id, refresh_token
+    return client.refresh_access_token()
+
+
+def decode_json(body):
+    """Parses a JSON response body (bytes) with orjson when installed, otherwise the standard library."""
+    return orjson.loads(body) if orjson is not None else json.loads(body)
+
+
+def project(records, fields):
+    """Keeps only the given fields of each record dict (fields a record lacks stay absent)."""
+    return [{field: record[field] for field in fields if field in record} for record in records]
+
+
+class PagingHints:
+    """
+    What the paged fetches of one instance have learned about its paging: whether it sends the next-page header,
+    and how large a full page is. A later fetch uses them to stop on its last page instead of asking for an
+    empty one.
+    """
+    __slots__ = ('next_header', 'full_limit', 'page_cap')
+
+    def __init__(self):
+        self.next_header = False  # The server has sent NEXT_PAGE_HEADER, so its absence marks a last page.
+        self.full_limit = 0  # The largest limit the server has been seen to fill.
+        self.page_cap = None  # The server's page size cap, once a short page has been followed by more records.
+
+    def full_page_size(self, limit):
+        """Returns how many records a non-final page of the given limit holds, or None if not yet known."""
+        if self.page_cap is not None: return min(limit, self.page_cap)
+        return limit if limit <= self.full_limit else None
+
+
+class PageCursor:
+    """
+    The paging rules shared by AlationClient and the async client for one limit/skip paginated v2 fetch.
+    next_url/next_params is the request to send next (next_url is None once the fetch is over), and read()
+    turns each response into its page.
+    Follows the server's next-page header when present, and stops on a response without it once the server
+    is known to send it. A server that never sends the header is paged by advancing skip by the number of
+    records received, so a server-side page cap cannot truncate results; a page shorter than a full page
+    (as learned in hints) ends the fetch, otherwise an empty page does. A page identical to the previous one
+    (a server ignoring skip) or a next-page link back to the same URL also ends it.
+    """
+
+    def __init__(self, path, params, page_size, hints):
+        self.path = path
+        self.base_params = dict(params or {})
+        self.skip = int(self.base_params.pop('skip', 0))
+        self.base_params['limit'] = self.page_size = page_size
+        self.hints = hints
+        self.next_url, self.next_params = path, dict(self.base_params, skip=self.skip)
+        self._previous_body = None
+        self._previous_size = None
+
+    def read(self, response):
+        """
+        Returns the decoded page of a response (None or [] once the fetch is over) and moves on to the next
+        request. Raises AlationAPIError on an error status.
+        """
+        requested_url, self.next_url = self.next_url, None
+        if response.status_code != 200:
+            raise AlationAPIError(
+                f"Failed to fetch {self.path}. Status: {response.status_code}, Response: {response.text}")
+        if response.content == self._previous_body:
+            logger.warning(f"{self.path} returned the same page again at skip {self.skip}; stopping.")
+            return None
+        self._previous_body = response.content
+        page = decode_json(response.content)
+        if not page:
+            return page
+        hints, size = self.hints, len(page)
+        if self._previous_size is not None and self._previous_size < self.page_size:
+            hints.page_cap = self._previous_size  # A short page was followed by more: that is the server's cap.
+        if size >= self.page_size:
+            hints.full_limit = max(hints.full_limit, self.page_size)
+        self._previous_size = size
+        self.skip += size
+        next_header = response.headers.get(NEXT_PAGE_HEADER)
+        if next_header:
+            hints.next_header = True
+            if hints.page_cap is None and size < self.page_size: hints.page_cap = size
+            if next_header == requested_url:
+                logger.warning(f"{self.path} links its next page to the page just read; stopping.")
+            else:
+                self.next_url, self.next_params = next_header, None
+        elif hints.next_header:
+            pass  # The server pages with the header, so its absence marks the last page.
+        elif size < (hints.full_page_size(self.page_size) or 0):
+            pass  # A short page after full ones is the last.
         else:
-            print(f"ERROR: Failed to refresh access token. Status: {response.status_code}, Response: {response.text}")
-            current_api_access_token = None
-            return False
-    except requests.exceptions.RequestException as e:
-        print(f"ERROR: Network error during token refresh: {e}")
-        return False
+            self.next_url, self.next_params = self.path, dict(self.base_params, skip=self.skip)
+        return page
 
 
-def get_folders(alation_url, params=None):
+def _iter_pages(client, path, params, page_size, fields=None, rate_limiter=None):
     """
-    Generic function to fetch folders from the Alation API.
+    Yields successive pages (lists) from a limit/skip paginated v2 endpoint, paged as described in PageCursor.
+    Each page body is decoded on its own and, if fields is given, projected before the next request,
+    so only the projected records outlive a page. rate_limiter, if given, is acquired before every request.
     """
-    if not current_api_access_token: print("ERROR: No valid API Access Token. Cannot fetch folders."); return None
-    headers = {'Token': current_api_access_token}
-    api_url = f"{alation_url}/integration/v2/folder/"
+    cursor = PageCursor(path, params, page_size, client.paging)
+    while cursor.next_url:
+        if rate_limiter: rate_limiter.acquire()
+        page = cursor.read(client.get(cursor.next_url, params=cursor.next_params))
+        if page: yield project(page, fields) if fields else page
+
+
+def iter_folder_pages(alation_url, params=None, page_size=DEFAULT_PAGE_SIZE, fields=FOLDER_FIELDS):
+    """
+    Generator over pages of folders, projected to fields (None keeps whole records).
+    Raises AlationAPIError or requests.exceptions.RequestException.
+    """
+    if not has_access_token(alation_url):
+        raise AlationAPIError("No valid API Access Token. Cannot fetch folders.")
+    logger.info(f"Fetching folders with params: {params} (page size {page_size})")
+    yield from _iter_pages(get_client(alation_url), "/integration/v2/folder/", params, page_size, fields)
+
+
+def iter_document_pages(alation_url, hub_id=None, folder_id=None, params=None, page_size=DEFAULT_PAGE_SIZE,
+                        fields=DOCUMENT_FIELDS, rate_limiter=None):
+    """
+    Generator over pages of documents, optionally filtered by hub and parent folder, projected to fields.
+    rate_limiter, if given, is acquired before each page request.
+    """
+    if not has_access_token(alation_url):
+        raise AlationAPIError("No valid API Access Token. Cannot fetch documents.")
+    params = dict(params or {})
+    if hub_id is not None: params['document_hub_id'] = hub_id
+    if folder_id is not None: params['parent_folder_id'] = folder_id
+    logger.debug(f"Fetching documents with params: {params} (page size {page_size})")
+    yield from _iter_pages(get_client(alation_url), "/integration/v2/document/", params, page_size, fields,
+                           rate_limiter)
+
+
+def get_folders(alation_url, params=None, fields=FOLDER_FIELDS):
+    """
+    Generic function to fetch folders from the Alation API, projected to fields (None keeps whole records).
+    All pages are collected; use iter_folder_pages to process them as they arrive.
+    """
+    if not has_access_token(alation_url): logger.error("No valid API Access Token. Cannot fetch folders."); return None
     try:
-        print(f"LOG: Fetching folders with params: {params}")
-        response = requests.get(api_url, headers=headers, params=params)
-        if response.status_code == 200:
-            return response.json()
-        else:
-            print(
-                f"ERROR: Failed to fetch folders. Status: {response.status_code}, Response: {response.text}"); return None
+        folders = []
+        for page in iter_folder_pages(alation_url, params, fields=fields):
+            folders.extend(page)
+        return folders
+    except AlationAPIError as e:
+        logger.error(f"{e}"); return None
     except requests.exceptions.RequestException as e:
-        print(f"ERROR: Network error while fetching folders: {e}");
+        logger.error(f"Network error while fetching folders: {e}");
         return None
 
 
-def get_documents(alation_url, hub_id, folder_id):
+def get_documents(alation_url, hub_id, folder_id, fields=DOCUMENT_FIELDS, rate_limiter=None):
     """
-    Fetches documents from a specific folder within a specific hub.
+    Fetches documents from a specific folder within a specific hub, projected to fields.
+    rate_limiter, if given, is acquired before each page request.
     """
-    if not current_api_access_token: print("ERROR: No valid API Access Token. Cannot fetch documents."); return None
-    headers = {'Token': current_api_access_token}
-    api_url = f"{alation_url}/integration/v2/document/"
-    params = {'document_hub_id': hub_id, 'parent_folder_id': folder_id}
+    if not has_access_token(alation_url): logger.error("No valid API Access Token. Cannot fetch documents."); return None
     try:
-        print(f"LOG: Fetching documents with params: {params}")
-        response = requests.get(api_url, headers=headers, params=params)
-        if response.status_code == 200:
-            return response.json()
-        else:
-            print(
-                f"ERROR: Failed to fetch documents. Status: {response.status_code}, Response: {response.text}"); return None
+        documents = []
+        for page in iter_document_pages(alation_url, hub_id, folder_id, fields=fields, rate_limiter=rate_limiter):
+            documents.extend(page)
+        return documents
+    except AlationAPIError as e:
+        logger.error(f"{e}"); return None
     except requests.exceptions.RequestException as e:
-        print(f"ERROR: Network error while fetching documents: {e}"); return None
+        logger.error(f"Network error while fetching documents: {e}"); return None
 
 
 def get_template_name(alation_url, template_id):
     """
     Gets the title/name of a template from its ID using the visual_config endpoint.
     """
-    if not current_api_access_token: print("ERROR: No valid API Access Token."); return None
-    headers = {'Token': current_api_access_token}
-    api_url = f"{alation_url}/integration/visual_config/{template_id}/"
+    if not has_access_token(alation_url): logger.error("No valid API Access Token."); return None
+    client = get_client(alation_url)
     try:
-        response = requests.get(api_url, headers=headers)
+        response = client.get(f"/integration/visual_config/{template_id}/")
         if response.status_code == 200:
             return response.json().get('title', f"ID: {template_id}")
         else:
-            print(f"WARN: Could not get title for template ID {template_id}. Status: {response.status_code}")
+            logger.warning(f"Could not get title for template ID {template_id}. Status: {response.status_code}")
             return f"ID: {template_id}"
     except requests.exceptions.RequestException as e:
-        print(f"ERROR: Network error getting template name: {e}");
+        logger.error(f"Network error getting template name: {e}");
         return f"ID: {template_id}"
 
 
@@ -115,17 +419,66 @@ def get_template_details(alation_url, template_id):
     """
     Fetches the details and fields for a specific custom template.
     """
-    if not current_api_access_token: print(
-        "ERROR: No valid API Access Token. Cannot fetch template details."); return None
-    headers = {'Token': current_api_access_token}
-    api_url = f"{alation_url}/integration/v1/custom_template/{template_id}/"
+    if not has_access_token(alation_url): logger.error(
+        "No valid API Access Token. Cannot fetch template details."); return None
+    client = get_client(alation_url)
     try:
-        print(f"LOG: Fetching details for template ID: {template_id}")
-        response = requests.get(api_url, headers=headers)
+        logger.info(f"Fetching details for template ID: {template_id}")
+        response = client.get(f"/integration/v1/custom_template/{template_id}/")
         if response.status_code == 200:
             return response.json()
         else:
-            print(
-                f"ERROR: Failed to fetch template details. Status: {response.status_code}, Response: {response.text}"); return None
+            logger.error(
+                f"Failed to fetch template details. Status: {response.status_code}, Response: {response.text}"); return None
+    except requests.exceptions.RequestException as e:
+        logger.error(f"Network error while fetching template details: {e}"); return None
+
+
+def get_json_conditional(alation_url, path, etag=None, last_modified=None, params=None):
+    """
+    GETs an endpoint with If-None-Match/If-Modified-Since validators from a previous response.
+    Returns (status_code, payload, etag, last_modified); payload is None on a 304 or an error status.
+    Returns None on a network error.
+    """
+    if not has_access_token(alation_url): logger.error("No valid API Access Token."); return None
+    client = get_client(alation_url)
+    headers = {}
+    if etag: headers['If-None-Match'] = etag
+    if last_modified: headers['If-Modified-Since'] = last_modified
+    try:
+        response = client.get(path, params=params, headers=headers)
+        payload = decode_json(response.content) if response.status_code == 200 else None
+        return (response.status_code, payload, response.headers.get('ETag', etag),
+                response.headers.get('Last-Modified', last_modified))
     except requests.exceptions.RequestException as e:
-        print(f"ERROR: Network error while fetching template details: {e}"); return None
\ No newline at end of file
+        logger.error(f"Network error while fetching {path}: {e}"); return None
+
+
+def get_job_status(alation_url, job_id):
+    """
+    Fetches the state of an asynchronous bulk job, such as a document upload answered with 202.
+    Returns the job dict ({'status': 'running' | 'successful' | 'failed', 'msg': ..., 'result': ...}) or None.
+    """
+    if not has_access_token(alation_url): logger.error("No valid API Access Token."); return None
+    client = get_client(alation_url)
+    try:
+        response = client.get("/api/v1/bulk_metadata/job/", params={'id': job_id})
+        if response.status_code == 200:
+            return decode_json(response.content)
+        logger.warning(f"Could not get the status of job {job_id}. Status: {response.status_code}")
+        return None
+    except requests.exceptions.RequestException as e:
+        logger.error(f"Network error getting the status of job {job_id}: {e}"); return None
+
+
+def send_documents(alation_url, documents, update=False):
+    """
+    Creates (POST) or updates (PUT) a batch of documents through the v2 document API.
+    Returns the requests.Response so callers can act on 429/5xx; raises requests.exceptions.RequestException
+    on network failure. Token expiry is handled by the client's refresh_api_token-style 401 retry.
+    """
+    if not has_access_token(alation_url):
+        raise AlationAPIError("No valid API Access Token. Cannot upload documents.")
+    client = get_client(alation_url)
+    response = (client.put if update else client.post)("/integration/v2/document/", json=documents)
+    return response
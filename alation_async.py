@@ -0,0 +1,276 @@
+# alation_async.py
+"""
+asyncio variant of the alation_api client for large crawls. One httpx.AsyncClient per instance shares a
+keep-alive pool, a semaphore caps requests in flight, and a 401 triggers a single token refresh that every
+task which hit it awaits. httpx is optional (pip install httpx); without it available() is False and
+services keeps using the requests-based client.
+"""
+import asyncio
+import time
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+import alation_api
+import app_logging
+import instrumentation
+
+logger = app_logging.get_logger("alation_async")
+
+# Requests in flight per crawl. Crawling a 200-folder hub of the benchmarks mock at 50 ms latency took 1.58 s at 16
+# against 3.11 s at 8 and 2.18 s at 50; at zero latency 16 costs 1.30 s against 0.63 s at 1 (httpcore's pool scan).
+DEFAULT_CONCURRENCY = 16
+IDEMPOTENT_METHODS = frozenset(['GET', 'HEAD', 'OPTIONS'])
+
+
+def available():
+    return httpx is not None
+
+
+class AsyncRateLimiter:
+    """
+    Spaces calls at least 1/rate seconds apart across all tasks; the asyncio counterpart of
+    document_uploader.RateLimiter.
+    """
+
+    def __init__(self, rate_per_second):
+        self.interval = 1.0 / rate_per_second if rate_per_second else 0
+        self._next_slot = 0.0
+
+    async def acquire(self):
+        if not self.interval: return
+        now = time.monotonic()
+        wait_for = self._next_slot - now
+        self._next_slot = max(now, self._next_slot) + self.interval
+        if wait_for > 0:
+            await asyncio.sleep(wait_for)
+
+
+class AsyncAlationClient:
+    """
+    The asyncio counterpart of alation_api.AlationClient: same retry, 401-refresh and pagination behaviour,
+    with at most `concurrency` requests in flight. Use as `async with AsyncAlationClient(...) as client:`.
+    """
+
+    def __init__(self, alation_url, user_id=None, refresh_token=None, access_token=None,
+                 concurrency=DEFAULT_CONCURRENCY, timeout=alation_api.DEFAULT_TIMEOUT,
+                 retries=alation_api.DEFAULT_RETRIES, backoff_factor=alation_api.DEFAULT_BACKOFF_FACTOR,
+                 paging=None, transport=None):
+        if httpx is None: raise RuntimeError("The async Alation client needs httpx (pip install httpx).")
+        self.alation_url = alation_url.rstrip('/')
+        self.user_id = user_id
+        self.refresh_token = refresh_token
+        self.access_token = access_token
+        self.concurrency = concurrency
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        self.paging = paging or alation_api.PagingHints()
+        connect_timeout, read_timeout = timeout if isinstance(timeout, (tuple, list)) else (timeout, timeout)
+        self._http = httpx.AsyncClient(timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+                                       limits=httpx.Limits(max_connections=concurrency,
+                                                           max_keepalive_connections=concurrency),
+                                       transport=transport)
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._refresh = None  # The in-flight token refresh, shared by every task that needs it.
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+
+    async def aclose(self):
+        await self._http.aclose()
+
+    # --- Token ---
+
+    async def refresh_access_token(self, stale_token=None):
+        """
+        Exchanges the refresh token for a new API access token. Concurrent callers share one refresh,
+        and a caller whose stale_token has already been replaced returns at once.
+        """
+        if stale_token is not None and self.access_token and self.access_token != stale_token:
+            return True
+        if self._refresh is None:
+            self._refresh = asyncio.ensure_future(self._exchange_refresh_token())
+            self._refresh.add_done_callback(lambda _: setattr(self, '_refresh', None))
+        return await asyncio.shield(self._refresh)
+
+    async def _exchange_refresh_token(self):
+        # Not under the semaphore: the tasks waiting for this refresh may hold every slot.
+        if not (self.user_id and self.refresh_token):
+            logger.error("No refresh token configured. Cannot refresh API Access Token.")
+            return False
+        api_url = f"{self.alation_url}/integration/v1/createAPIAccessToken/"
+        body = {"refresh_token": self.refresh_token, "user_id": int(self.user_id)}
+        try:
+            logger.info("Attempting to refresh API Access Token...")
+            response = await self._send("POST", api_url, json=body)
+        except httpx.HTTPError as e:
+            logger.error(f"Network error during token refresh: {e}")
+            return False
+        if response.status_code == 201:
+            self.access_token = response.json()['api_access_token']
+            logger.info("Successfully refreshed API Access Token.")
+            return True
+        logger.error(f"Failed to refresh access token. Status: {response.status_code}, Response: {response.text}")
+        self.access_token = None
+        return False
+
+    # --- Requests ---
+
+    async def request(self, method, path, **kwargs):
+        """
+        Sends a request relative to the instance URL once a concurrency slot is free, refreshing the token
+        once on a 401. Raises httpx.HTTPError on network failure.
+        """
+        url = path if path.startswith('http') else f"{self.alation_url}{path}"
+        async with self._semaphore:
+            sent_token = self.access_token
+            response = await self._send(method, url, **kwargs)
+            if response.status_code == 401 and self.refresh_token:
+                logger.info("API Access Token rejected (401). Refreshing and retrying once...")
+                if await self.refresh_access_token(stale_token=sent_token):
+                    response = await self._send(method, url, replay=True, **kwargs)
+        return response
+
+    async def _send(self, method, url, replay=False, headers=None, **kwargs):
+        """
+        Sends one request with the current token, retrying idempotent methods on RETRY_STATUS_CODES and
+        network errors with exponential backoff (or Retry-After). Records the outcome in instrumentation.
+        """
+        retries = self.retries if method.upper() in IDEMPOTENT_METHODS else 0
+        started = time.perf_counter()
+        for attempt in range(retries + 1):
+            request_headers = dict(headers or {})
+            if self.access_token: request_headers['Token'] = self.access_token
+            response = None
+            try:
+                response = await self._http.request(method, url, headers=request_headers, **kwargs)
+            except httpx.TransportError:
+                if attempt == retries:
+                    instrumentation.record_failure(method, url, time.perf_counter() - started,
+                                                   extra_retries=attempt + int(replay))
+                    raise
+            if response is not None and (response.status_code not in alation_api.RETRY_STATUS_CODES
+                                         or attempt == retries):
+                instrumentation.registry.record(method, url, response.status_code, time.perf_counter() - started,
+                                                len(response.content), attempt + int(replay))
+                return response
+            await asyncio.sleep(self._backoff(attempt, response))
+
+    def _backoff(self, attempt, response):
+        retry_after = response.headers.get('Retry-After') if response is not None else None
+        try:
+            return float(retry_after)
+        except (TypeError, ValueError):
+            return self.backoff_factor * 2 ** attempt
+
+    async def get(self, path, **kwargs):
+        return await self.request('GET', path, **kwargs)
+
+    # --- Operations ---
+
+    async def iter_pages(self, path, params=None, page_size=alation_api.DEFAULT_PAGE_SIZE, fields=None,
+                         rate_limiter=None):
+        """
+        Async generator over the pages of a limit/skip paginated v2 endpoint, paged by alation_api.PageCursor
+        like the synchronous client. rate_limiter, if given, is awaited before every request.
+        Raises alation_api.AlationAPIError on an error status.
+        """
+        cursor = alation_api.PageCursor(path, params, page_size, self.paging)
+        while cursor.next_url:
+            if rate_limiter: await rate_limiter.acquire()
+            page = cursor.read(await self.get(cursor.next_url, params=cursor.next_params))
+            if page: yield alation_api.project(page, fields) if fields else page
+
+    async def get_folders(self, params=None, fields=alation_api.FOLDER_FIELDS):
+        return [folder async for page in self.iter_pages("/integration/v2/folder/", params, fields=fields)
+                for folder in page]
+
+    async def get_documents(self, hub_id=None, folder_id=None, params=None, fields=alation_api.DOCUMENT_FIELDS,
+                            rate_limiter=None):
+        params = dict(params or {})
+        if hub_id is not None: params['document_hub_id'] = hub_id
+        if folder_id is not None: params['parent_folder_id'] = folder_id
+        pages = self.iter_pages("/integration/v2/document/", params, fields=fields, rate_limiter=rate_limiter)
+        return [document async for page in pages for document in page]
+
+    async def get_template_name(self, template_id):
+        """Returns the template's title, or None if it cannot be fetched."""
+        response = await self.get(f"/integration/visual_config/{template_id}/")
+        if response.status_code != 200:
+            logger.warning(f"Could not get title for template ID {template_id}. Status: {response.status_code}")
+            return None
+        return alation_api.decode_json(response.content).get('title')
+
+    async def get_template_details(self, template_id):
+        response = await self.get(f"/integration/v1/custom_template/{template_id}/")
+        if response.status_code != 200:
+            logger.error(f"Failed to fetch template details. Status: {response.status_code}, Response: {response.text}")
+            return None
+        return alation_api.decode_json(response.content)
+
+    async def send_documents(self, documents, update=False):
+        """Creates (POST) or updates (PUT) a batch of documents. Returns the httpx.Response."""
+        return await self.request('PUT' if update else 'POST', "/integration/v2/document/", json=documents)
+
+
+# --- Bulk jobs ---
+
+async def gather_limited(fn, items, limit, on_result=None, should_stop=None):
+    """
+    Runs fn(item) for every item as tasks, at most limit at a time, and returns {item: result}; an item whose
+    call raised maps to None. on_result(item, result) follows each one. should_stop() is checked as each call
+    gets its turn, so a stop skips everything not yet started.
+    """
+    results = {}
+    slots = asyncio.Semaphore(limit)
+
+    async def run(item):
+        async with slots:
+            if should_stop and should_stop(): return
+            try:
+                result = await fn(item)
+            except Exception as e:
+                logger.error(f"Request for {item} failed: {e}")
+                result = None
+        results[item] = result
+        if on_result: on_result(item, result)
+
+    await asyncio.gather(*(run(item) for item in items))
+    return results
+
+
+async def crawl_folder_documents(client, hub_id, folder_ids, rate_limit=None, on_result=None, should_stop=None):
+    """
+    Fetches the documents of many folders at once. Returns {folder_id: documents or None}.
+    rate_limit (requests per second) is charged for every page request, not once per folder.
+    """
+    rate_limiter = AsyncRateLimiter(rate_limit)
+    return await gather_limited(lambda folder_id: client.get_documents(hub_id, folder_id, rate_limiter=rate_limiter),
+                                folder_ids, client.concurrency, on_result, should_stop)
+
+
+async def fetch_template_names(client, template_ids, on_result=None, should_stop=None):
+    """Fetches the titles of many templates at once. Returns {template_id: title or None}."""
+    return await gather_limited(client.get_template_name, template_ids, client.concurrency, on_result, should_stop)
+
+
+async def fetch_template_details(client, template_ids, on_result=None, should_stop=None):
+    """Fetches custom_template details for many templates at once. Returns {template_id: details or None}."""
+    return await gather_limited(client.get_template_details, template_ids, client.concurrency, on_result,
+                                should_stop)
+
+
+def client_for(alation_url, concurrency=DEFAULT_CONCURRENCY, **options):
+    """
+    Builds an async client that starts from the credentials, token and paging hints of the synchronous client
+    for the instance (or of the AlationClient given), so a crawl needs no extra login. Must be called inside the event loop that will use it.
+    """
+    sync_client = alation_api.get_client(alation_url)
+    return AsyncAlationClient(sync_client.alation_url, sync_client.user_id, sync_client.refresh_token, sync_client.access_token,
+                              concurrency=concurrency, timeout=sync_client.timeout, paging=sync_client.paging,
+                              **options)
@@ -0,0 +1,68 @@
+# app_logging.py
+"""
+Logging setup shared by the GUI and the CLI. Modules log through get_logger(__name__); the GUI
+attaches a queue that its log pane drains in batches, the CLI logs to stderr and optionally a rotating file.
+"""
+import logging
+import logging.handlers
+import queue
+
+ROOT_LOGGER = "apt2"
+LOG_FORMAT = "%(levelname)s: %(message)s"
+FILE_LOG_FORMAT = "%(asctime)s %(levelname)s [%(threadName)s] %(name)s: %(message)s"
+DEFAULT_MAX_BYTES = 5 * 1024 * 1024
+DEFAULT_BACKUP_COUNT = 3
+DRAIN_BATCH = 500  # Most records the GUI log pane takes per tick.
+
+
+def get_logger(name):
+    return logging.getLogger(f"{ROOT_LOGGER}.{name}")
+
+
+def configure(level=logging.INFO, stream=None, log_file=None, max_bytes=DEFAULT_MAX_BYTES,
+              backup_count=DEFAULT_BACKUP_COUNT):
+    """
+    Replaces the apt2 handlers with a console handler (if stream is given) and a rotating file handler
+    (if log_file is given). Returns the apt2 root logger.
+    """
+    root = logging.getLogger(ROOT_LOGGER)
+    root.setLevel(level)
+    root.propagate = False
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+        handler.close()
+    if stream is not None:
+        handler = logging.StreamHandler(stream)
+        handler.setFormatter(logging.Formatter(LOG_FORMAT))
+        root.addHandler(handler)
+    if log_file:
+        handler = logging.handlers.RotatingFileHandler(log_file, maxBytes=max_bytes, backupCount=backup_count,
+                                                       encoding='utf-8')
+        handler.setFormatter(logging.Formatter(FILE_LOG_FORMAT))
+        root.addHandler(handler)
+    return root
+
+
+def attach_queue(log_queue=None):
+    """
+    Adds a QueueHandler to the apt2 logger so any thread can log without touching Tk.
+    Returns the queue of LogRecords for the GUI to drain.
+    """
+    log_queue = log_queue or queue.Queue()
+    handler = logging.handlers.QueueHandler(log_queue)
+    logging.getLogger(ROOT_LOGGER).addHandler(handler)
+    return log_queue
+
+
+def drain(log_queue, max_records=DRAIN_BATCH, formatter=None):
+    """
+    Takes up to max_records LogRecords off the queue without blocking and returns them as formatted lines.
+    """
+    formatter = formatter or logging.Formatter(LOG_FORMAT)
+    lines = []
+    try:
+        while len(lines) < max_records:
+            lines.append(formatter.format(log_queue.get_nowait()))
+    except queue.Empty:
+        pass
+    return lines
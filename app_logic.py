@@ -1,121 +1,363 @@
 # app_logic.py
-import json
-import alation_api
+"""
+Tk event handlers. All data access goes through services, which the headless CLI shares.
+"""
+import app_logging
+import instrumentation
+import services
+import template_generator
 
-CONFIG_FILE = "config.json"
-app_settings = {}
+logger = app_logging.get_logger("app_logic")
 
 
-# --- CORRECTED CLASS DEFINITION ---
-class AppData:
-    def __init__(self):
-        self.all_folders = []
-        self.id_to_title_map = {}
-        self.doc_hubs = {}
-        self.template_title_to_id_map = {}  # This attribute is now correctly included
+@instrumentation.profiled
+def initialize_app(main_window_ref):
+    logger.info("Application starting...");
+    if not services.prepare_connection(): logger.info("Initialization complete."); return
+    logger.info("Credentials loaded. Attempting to authenticate...")
+    cached_folders_shown = load_cached_folders(main_window_ref)
+
+    def authenticated(auth_success):
+        if auth_success:
+            logger.info("Authentication successful. Application is ready.");
+            main_window_ref.btn_refetch_cache.config(state="normal")
+            if not cached_folders_shown:
+                logger.info("Automatically fetching initial data...");
+                refetch_cache(main_window_ref)
+            elif not services.cache.folders_are_fresh():
+                logger.info("Cached folders are stale. Refreshing in the background...")
+                revalidate_folders_in_background(main_window_ref)
+        else:
+            logger.info("Authentication failed. Please check credentials in Settings or network connection.");
+            main_window_ref.btn_refetch_cache.config(state="disabled")
+        logger.info("Initialization complete.")
 
+    main_window_ref.jobs.submit(lambda job: services.authenticate(), key="auth", on_success=authenticated)
 
-app_data = AppData()
 
+def _publish_hubs(main_window_ref, hub_ids):
+    """Shows the given hub IDs (any iterable, e.g. services.app_data.doc_hubs) in the hub combobox."""
+    main_window_ref.hub_combobox['values'] = sorted(hub_ids)
+    main_window_ref.hub_combobox.config(state="readonly")
 
-def save_settings(url, token, user_id):
-    settings_to_save = {"alation_url": url, "refresh_token": token, "user_id": user_id}
-    try:
-        with open(CONFIG_FILE, 'w') as f:
-            json.dump(settings_to_save, f, indent=4)
-        print(f"LOG: Settings successfully saved to {CONFIG_FILE}");
-        global app_settings;
-        app_settings = settings_to_save
-        return True
-    except Exception as e:
-        print(f"ERROR: Could not save settings to {CONFIG_FILE}. Error: {e}"); return False
 
+def load_cached_folders(main_window_ref):
+    """
+    Renders hubs from the on-disk cache. Returns True if any cached folders were found.
+    """
+    folder_count = services.load_cached_folders()
+    if not folder_count: return False
+    _publish_hubs(main_window_ref, services.app_data.doc_hubs)
+    logger.info(f"Loaded {folder_count} folders and {len(services.app_data.doc_hubs)} Document Hubs from the local cache.")
+    return True
 
-def load_settings():
-    try:
-        with open(CONFIG_FILE, 'r') as f:
-            settings = json.load(f); print(f"LOG: Settings loaded from {CONFIG_FILE}"); return settings
-    except FileNotFoundError:
-        print(f"LOG: {CONFIG_FILE} not found. No settings loaded."); return None
-    except Exception as e:
-        print(f"ERROR: Could not load settings from {CONFIG_FILE}. Error: {e}"); return None
 
+def _fetch_all_folders(job, url, profile, on_page=None):
+    """
+    Worker: fetches every folder into profile's cache, posting each page to on_page on the Tk thread.
+    """
+    return services.fetch_all_folders(url, on_page=(lambda page: job.post(on_page, page)) if on_page else None,
+                                      should_stop=lambda: job.cancelled, profile=profile)
 
-def initialize_app(main_window_ref):
-    print("LOG: Application starting...");
-    global app_settings;
-    app_settings = load_settings()
-    if not app_settings: print("LOG: No saved credentials found. Please configure via File -> Settings."); print(
-        "LOG: Initialization complete."); return
-    print("LOG: Credentials loaded. Attempting to authenticate...")
-    url, user_id, refresh_token = app_settings.get("alation_url"), app_settings.get("user_id"), app_settings.get(
-        "refresh_token")
-    if not all([url, user_id, refresh_token]): print(
-        "ERROR: Incomplete settings in config.json. Please save settings again."); print(
-        "LOG: Initialization complete."); return
-    auth_success = alation_api.refresh_api_token(url, user_id, refresh_token)
-    if auth_success:
-        print("LOG: Authentication successful. Application is ready.");
-        main_window_ref.btn_refetch_cache.config(state="normal")
-        print("LOG: Automatically fetching initial data...");
-        refetch_cache(main_window_ref)
-    else:
-        print("LOG: Authentication failed. Please check credentials in Settings or network connection.");
-        main_window_ref.btn_refetch_cache.config(state="disabled")
-    print("LOG: Initialization complete.")
-
-
-def refetch_cache(main_window_ref):
-    print("LOG: User clicked 'Re-fetch Cache'.")
-    url = app_settings.get("alation_url")
-    if not url: print("ERROR: Alation URL not configured."); return
+
+@instrumentation.profiled
+def refetch_cache(main_window_ref, full=False):
+    logger.info("User clicked 'Re-fetch Cache'." if not full else "User clicked 'Full Re-fetch'.")
+    url = services.app_settings.get("alation_url")
+    if not url: logger.error("Alation URL not configured."); return
+    if not full and services.app_data.folder_count and services.can_sync_incrementally():
+        sync_folders_in_background(main_window_ref)
+        return
     main_window_ref.hub_combobox['values'] = [];
     main_window_ref.folder_tree.delete(*main_window_ref.folder_tree.get_children())
     main_window_ref.template_combobox['values'] = [];
-    global app_data;
-    app_data = AppData()
-    app_data.all_folders = alation_api.get_folders(url, params=None)
-    if not app_data.all_folders: print("LOG: Could not fetch folder data. Aborting."); return
-    app_data.id_to_title_map = {folder['id']: folder.get('title') or 'Untitled Folder' for folder in
-                                app_data.all_folders}
-    hub_ids = sorted(list(set(f['document_hub_id'] for f in app_data.all_folders if f.get('document_hub_id'))))
-    app_data.doc_hubs = {hub_id: f"Hub ID: {hub_id}" for hub_id in hub_ids}
-    if hub_ids:
-        main_window_ref.hub_combobox['values'] = hub_ids;
-        main_window_ref.hub_combobox.config(state="readonly")
-        print(f"LOG: Found and populated {len(hub_ids)} Document Hubs.")
-    else:
-        print("LOG: No Document Hubs could be identified.")
+    app_data = services.reset_app_data()
+
+    def page_arrived(page):
+        if app_data.add_folders(page):
+            # Publish hubs as soon as they are seen so the user can start before the last page lands.
+            _publish_hubs(main_window_ref, app_data.doc_hubs)
+
+    def finished(folders):
+        logger.info(f"Loaded {app_data.folder_count} folders.")
+        if app_data.doc_hubs:
+            logger.info(f"Found and populated {len(app_data.doc_hubs)} Document Hubs.")
+        else:
+            logger.info("No Document Hubs could be identified.")
+
+    def failed(error):
+        logger.error(f"Folder fetch stopped early: {error}")
+        if not app_data.folder_count: logger.info("Could not fetch folder data. Aborting.")
+
+    main_window_ref.jobs.submit(_fetch_all_folders, url, services.current_profile(), page_arrived, key="folders",
+                                on_success=finished, on_error=failed)
+
+
+def revalidate_folders_in_background(main_window_ref):
+    """
+    Brings the cached folders up to date on a worker thread while they stay on screen: an incremental
+    sync when the cache has sync marks, otherwise a full download that is swapped in once complete.
+    """
+    if services.can_sync_incrementally():
+        sync_folders_in_background(main_window_ref)
+        return
+    url = services.app_settings.get("alation_url")
+
+    def apply(folders):
+        app_data = services.reset_app_data(folders, keep_template_map=True)
+        _publish_hubs(main_window_ref, app_data.doc_hubs)
+        logger.info(f"Background refresh complete: {len(folders)} folders in {len(app_data.doc_hubs)} Document Hubs. "
+                    f"Reselect a hub to see folder changes.")
+
+    def failed(error):
+        logger.error(f"Background folder refresh failed; keeping cached data. Error: {error}")
+
+    main_window_ref.jobs.submit(_fetch_all_folders, url, services.current_profile(), key="folders", on_success=apply,
+                                on_error=failed)
+
+
+def sync_folders_in_background(main_window_ref):
+    """
+    Fetches only the folders and documents changed since the last sync, then patches the indexes,
+    the hub list and the open folder tree in place.
+    """
+    url = services.app_settings.get("alation_url")
+    sweep_deletions = bool(services.app_settings.get("sync_sweep_deletions"))
+    profile = services.current_profile()
+
+    def fetch_changes(job):
+        return services.fetch_folder_changes(url, sweep_deletions, should_stop=lambda: job.cancelled, profile=profile)
+
+    def apply(changes):
+        if changes is None: return
+        diff = services.apply_folder_changes(changes)
+        if diff['new_hub_ids'] or diff['removed_hub_ids']:
+            _publish_hubs(main_window_ref, services.app_data.doc_hubs)
+        hub_text = main_window_ref.hub_combobox.get()
+        if hub_text and int(hub_text) in diff['removed_hub_ids']:
+            main_window_ref.hub_combobox.set('')
+            main_window_ref.folder_tree.delete(*main_window_ref.folder_tree.get_children())
+        elif hub_text:
+            patch_folder_tree(main_window_ref.folder_tree, int(hub_text), diff)
+        counts = diff['counts']
+        logger.info(f"Incremental sync complete: {counts['added']} folders added, {counts['updated']} updated, "
+                    f"{counts['deleted']} deleted; {counts['documents_changed']} changed documents "
+                    f"({counts['document_lists_invalidated']} folder document lists refreshed on next use).")
 
+    def failed(error):
+        logger.error(f"Incremental folder sync failed; keeping cached data. Error: {error}")
 
+    main_window_ref.jobs.submit(fetch_changes, key="folders", on_success=apply, on_error=failed)
+
+
+PROFILE_JOB_KEYS = ("auth", "folders", "hub_crawl", "folder_templates")  # Jobs bound to the active instance.
+
+
+@instrumentation.profiled
+def switch_profile(main_window_ref, name):
+    """
+    Makes name the active connection profile (remembered in config.json) and reloads the window from its cache.
+    """
+    if name == services.active_profile: return
+    logger.info(f"Switching to connection profile '{name}'...")
+    if not services.save_active_profile(name): return
+    for key in PROFILE_JOB_KEYS:
+        main_window_ref.jobs.cancel(key)
+    main_window_ref.hub_combobox['values'] = [];
+    main_window_ref.hub_combobox.set('')
+    main_window_ref.folder_tree.delete(*main_window_ref.folder_tree.get_children())
+    main_window_ref.template_combobox['values'] = [];
+    main_window_ref.template_combobox.set('')
+    main_window_ref.template_combobox.config(state="disabled")
+    main_window_ref.btn_refetch_cache.config(state="disabled")
+    initialize_app(main_window_ref)
+
+
+@instrumentation.profiled
+def refresh_all_profiles(main_window_ref):
+    """
+    Refreshes every other profile's cache concurrently in the background, and the active one in place,
+    so switching instances afterwards is instant.
+    """
+    others = [name for name in services.profile_names(services.load_settings() or {})
+              if name != services.active_profile]
+    if services.active_profile: refetch_cache(main_window_ref)
+    if not others: return
+
+    def finished(results):
+        for name, result in results.items():
+            if 'error' in result:
+                logger.error(f"Profile '{name}' could not be refreshed: {result['error']}")
+        logger.info(f"Refreshed {sum('error' not in result for result in results.values())} of {len(results)} "
+                    f"other profiles.")
+
+    main_window_ref.jobs.submit(lambda job: services.refresh_profiles(others), key="refresh_profiles",
+                                on_success=finished)
+
+
+@instrumentation.profiled
 def on_hub_selected(main_window_ref, event):
     selected_hub_id = int(main_window_ref.hub_combobox.get());
-    print(f"LOG: User selected Hub ID: {selected_hub_id}")
+    logger.info(f"User selected Hub ID: {selected_hub_id}")
+    main_window_ref.jobs.cancel("folder_templates")
     tree = main_window_ref.folder_tree;
     tree.delete(*tree.get_children())
     main_window_ref.template_combobox['values'] = [];
     main_window_ref.template_combobox.set('')
-    folders_in_hub = [f for f in app_data.all_folders if f.get('document_hub_id') == selected_hub_id]
-    folders_by_parent = {};
-    for folder in folders_in_hub:
-        parent_id = folder.get('parent_folder_id')
-        if parent_id not in folders_by_parent: folders_by_parent[parent_id] = []
-        folders_by_parent[parent_id].append(folder)
-    build_folder_tree(tree, '', folders_by_parent, None)
+    build_folder_tree(tree, '', selected_hub_id, None)
+    main_window_ref.btn_export_hub.config(state="normal")
+    main_window_ref.btn_export_folder.config(state="disabled")
     main_window_ref.template_combobox.config(state="disabled");
-    print(f"LOG: Built folder tree for Hub ID {selected_hub_id}.")
+    logger.info(f"Built folder tree for Hub ID {selected_hub_id}.")
+    if services.app_settings.get("prefetch_hub_templates", services.PREFETCH_HUB_TEMPLATES):
+        prefetch_hub_templates(main_window_ref, selected_hub_id)
+
+
+def prefetch_hub_templates(main_window_ref, hub_id):
+    """
+    Crawls the documents of every folder in the hub in the background so folder clicks can be answered
+    from memory. Selecting another hub cancels the crawl.
+    """
+    url = services.app_settings.get("alation_url")
+    if not url: return
+    options = {'max_workers': services.app_settings.get("prefetch_concurrency", services.PREFETCH_CONCURRENCY),
+               'rate_limit': services.app_settings.get("prefetch_rate_limit", services.PREFETCH_RATE_LIMIT),
+               'profile': services.current_profile()}
+
+    def crawl(job):
+        def progress(done, total):
+            if done == total or done % max(total // 10, 1) == 0:
+                logger.info(f"Indexing templates in Hub ID {hub_id}: {done} of {total} folders...")
+
+        return services.crawl_hub_templates(url, hub_id, on_progress=progress, should_stop=lambda: job.cancelled,
+                                            **options)
+
+    def finished(result):
+        if result is None: return
+        logger.info(f"Indexed {result['folders']} folders in Hub ID {hub_id}: {result['templates']} templates in use.")
+        if result['failed']:
+            logger.warning(f"Could not index {len(result['failed'])} folders; they are fetched when clicked.")
+
+    main_window_ref.jobs.submit(crawl, key="hub_crawl", on_success=finished)
+
+
+PLACEHOLDER_PREFIX = "placeholder-"
+_search_state = {'hub_id': None, 'query': None, 'app_data': None, 'version': None, 'matches': [], 'position': -1}
 
 
-def build_folder_tree(tree, parent_item, folders_by_parent, parent_id):
-    children = folders_by_parent.get(parent_id, [])
-    for folder in children:
-        folder_id = folder['id'];
-        display_text = f"{(folder.get('title') or 'Untitled Folder')} (ID: {folder_id})"
-        item_id = tree.insert(parent_item, 'end', iid=folder_id, text=display_text)
-        if folder_id in folders_by_parent:
-            build_folder_tree(tree, item_id, folders_by_parent, folder_id)
+def _folder_label(folder):
+    return f"{folder.title} (ID: {folder.id})"
 
 
+def _insert_folder_item(tree, parent_item, hub_id, folder):
+    item_id = tree.insert(parent_item, 'end', iid=folder.id, text=_folder_label(folder))
+    if services.app_data.children(hub_id, folder.id):
+        tree.insert(item_id, 'end', iid=f"{PLACEHOLDER_PREFIX}{folder.id}", text="Loading...")
+
+
+def build_folder_tree(tree, parent_item, hub_id, parent_id):
+    """
+    Inserts one level of folders. Folders with children get a placeholder child so they can be
+    expanded; their own children are inserted on <<TreeviewOpen>> (see on_folder_opened).
+    """
+    for folder in services.app_data.children(hub_id, parent_id):
+        _insert_folder_item(tree, parent_item, hub_id, folder)
+
+
+def patch_folder_tree(tree, hub_id, diff):
+    """
+    Applies an AppData.apply_changes diff to the tree of hub_id in place. Only levels that are already
+    materialised are touched; collapsed levels pick the changes up when they are first expanded.
+    """
+    placed = list(diff['added'])
+    for old, new in diff['updated']:
+        if tree.exists(old.id) and (old.hub_id, old.parent_id) == (new.hub_id, new.parent_id):
+            tree.item(old.id, text=_folder_label(new))
+        else:
+            placed.append(new)
+    for folder in diff['deleted'] + [old for old, new in diff['updated'] if new in placed]:
+        if tree.exists(folder.id): tree.delete(folder.id)
+        placeholder = f"{PLACEHOLDER_PREFIX}{folder.parent_id}"
+        if tree.exists(placeholder) and not services.app_data.children(hub_id, folder.parent_id):
+            tree.delete(placeholder)
+    for folder in placed:
+        if folder.hub_id != hub_id or tree.exists(folder.id): continue
+        parent_item = '' if folder.parent_id is None else folder.parent_id
+        if parent_item != '' and (not tree.exists(parent_item) or tree.exists(f"{PLACEHOLDER_PREFIX}{parent_item}")):
+            continue  # Parent not expanded yet; build_folder_tree will include this folder.
+        _insert_folder_item(tree, parent_item, hub_id, folder)
+
+
+def _expand_folder_item(tree, hub_id, folder_id):
+    placeholder = f"{PLACEHOLDER_PREFIX}{folder_id}"
+    if tree.exists(placeholder):
+        tree.delete(placeholder)
+        build_folder_tree(tree, folder_id, hub_id, folder_id)
+
+
+@instrumentation.profiled
+def on_folder_opened(main_window_ref, event):
+    tree = main_window_ref.folder_tree
+    item = tree.focus()
+    if not item or item.startswith(PLACEHOLDER_PREFIX): return
+    _expand_folder_item(tree, int(main_window_ref.hub_combobox.get()), int(item))
+
+
+def reveal_folder(main_window_ref, folder_id):
+    """
+    Materialises only the ancestors of folder_id, then selects and scrolls to it.
+    """
+    tree = main_window_ref.folder_tree
+    folder = services.app_data.folders_by_id[folder_id]
+    ancestors, seen = [], {folder_id}
+    parent_id = folder.parent_id
+    while parent_id is not None and parent_id in services.app_data.folders_by_id and parent_id not in seen:
+        ancestors.append(parent_id)
+        seen.add(parent_id)
+        parent_id = services.app_data.folders_by_id[parent_id].parent_id
+    for ancestor_id in reversed(ancestors):
+        _expand_folder_item(tree, folder.hub_id, ancestor_id)
+        tree.item(ancestor_id, open=True)
+    if not tree.exists(folder_id):
+        logger.warning(f"Folder {folder_id} is not reachable from the top of its hub."); return
+    tree.selection_set(folder_id)
+    tree.focus(folder_id)
+    tree.see(folder_id)
+
+
+@instrumentation.profiled
+def find_folder(main_window_ref):
+    """
+    Jumps to the next folder in the selected hub whose title contains the search text, or to a folder ID
+    (switching hubs if needed). Repeating the same search cycles through the matches.
+    """
+    query = main_window_ref.folder_search_entry.get().strip()
+    if not query: return
+    hub_text = main_window_ref.hub_combobox.get()
+    hub_id = int(hub_text) if hub_text else None
+    app_data = services.app_data
+    state = _search_state
+    if (state['query'], state['hub_id'], state['app_data'], state['version']) != \
+            (query, hub_id, app_data, app_data.version):
+        # New search, or the folders were replaced (refetch, profile switch) or patched (sync) since.
+        state.update(hub_id=hub_id, query=query, app_data=app_data, version=app_data.version,
+                     matches=app_data.find_folders(hub_id, query), position=-1)
+    state['matches'] = [f_id for f_id in state['matches'] if f_id in app_data.folders_by_id]
+    if not state['matches']:
+        logger.info(f"No folder matches '{query}'" + (f" in Hub ID {hub_id}." if hub_id else ". Select a hub first."))
+        return
+    state['position'] = (state['position'] + 1) % len(state['matches'])
+    folder_id = state['matches'][state['position']]
+    folder_hub_id = app_data.folders_by_id[folder_id].hub_id
+    if folder_hub_id != hub_id:
+        main_window_ref.hub_combobox.set(folder_hub_id)
+        on_hub_selected(main_window_ref, None)
+        state['hub_id'] = folder_hub_id
+    logger.info(f"Match {state['position'] + 1} of {len(state['matches'])}: '{app_data.id_to_title_map[folder_id]}'")
+    reveal_folder(main_window_ref, folder_id)
+
+
+@instrumentation.profiled
 def on_folder_selected(main_window_ref, event):
     """
     Event handler for when a user selects a folder in the Treeview.
@@ -125,67 +367,190 @@ def on_folder_selected(main_window_ref, event):
     if not selected_items:
         return
 
+    if selected_items[0].startswith(PLACEHOLDER_PREFIX):
+        return
     selected_folder_id = int(selected_items[0])
-    selected_title = app_data.id_to_title_map.get(selected_folder_id, "Unknown")
-    print(f"LOG: User selected Folder: '{selected_title}'")
+    selected_title = services.app_data.id_to_title_map.get(selected_folder_id, "Unknown")
+    logger.info(f"User selected Folder: '{selected_title}'")
 
     # Clear subsequent dropdown and reset the map
     main_window_ref.template_combobox['values'] = []
     main_window_ref.template_combobox.set('')
-    app_data.template_title_to_id_map = {}  # The unnecessary 'global' keyword is removed.
+    services.app_data.template_title_to_id_map = {}
 
-    url = app_settings.get("alation_url")
+    url = services.app_settings.get("alation_url")
     hub_id = int(main_window_ref.hub_combobox.get())
+    main_window_ref.template_combobox.config(state="disabled")
+    main_window_ref.btn_export_folder.config(state="disabled")
+    profile = services.current_profile()
+
+    def fetch_templates(job):
+        return services.folder_templates(url, hub_id, selected_folder_id, should_stop=lambda: job.cancelled,
+                                         profile=profile)
 
-    documents = alation_api.get_documents(url, hub_id, selected_folder_id)
-
-    if documents:
-        template_ids = set()
-        for doc in documents:
-            if doc.get('template_id'):
-                template_ids.add(doc.get('template_id'))
-
-        if template_ids:
-            print(f"LOG: Found {len(template_ids)} unique template IDs from documents.")
-            template_names = []
-            for t_id in template_ids:
-                # Use the new get_template_name function
-                name = alation_api.get_template_name(url, t_id)
-                app_data.template_title_to_id_map[name] = t_id
-                template_names.append(name)
-
-            main_window_ref.template_combobox['values'] = sorted(template_names)
-            main_window_ref.template_combobox.config(state="readonly")
+    def show_templates(result):
+        documents, templates = result
+        _log_subtree_templates(hub_id, selected_folder_id)
+        if documents:
+            if templates:
+                template_names = []
+                for t_id, name in templates:
+                    services.app_data.template_title_to_id_map[name] = t_id
+                    template_names.append(name)
+
+                main_window_ref.template_combobox['values'] = sorted(template_names)
+                main_window_ref.template_combobox.config(state="readonly")
+                main_window_ref.btn_export_folder.config(state="normal")
+            else:
+                logger.info("Documents in this folder do not have any associated templates.")
         else:
-            main_window_ref.template_combobox.config(state="disabled")
-            print("LOG: Documents in this folder do not have any associated templates.")
-    else:
-        main_window_ref.template_combobox.config(state="disabled")
-        print("LOG: No documents found in this folder.")
+            logger.info("No documents found in this folder.")
+
+    indexed = services.indexed_folder_templates(selected_folder_id)
+    if indexed is not None:
+        # The hub crawl already indexed this folder; no documents need to be fetched.
+        main_window_ref.jobs.cancel("folder_templates")
+        show_templates(indexed)
+        return
+    # Clicking another folder before this finishes cancels it and drops its result.
+    main_window_ref.jobs.submit(fetch_templates, key="folder_templates", on_success=show_templates)
 
 
+def _log_subtree_templates(hub_id, folder_id):
+    """Logs template usage beneath a folder when it differs from the folder's own, i.e. subfolders add to it."""
+    usage = services.app_data.template_usage(hub_id, folder_id)
+    own_usage = services.app_data.template_usage_by_folder.get(folder_id, {})
+    if not usage or usage == {t_id: n for t_id, n in own_usage.items() if t_id is not None}: return
+    names = dict(services.memoized_template_names(usage) or [])
+    summary = ", ".join(f"{names.get(t_id, f'ID: {t_id}')} ({count})"
+                        for t_id, count in sorted(usage.items(), key=lambda item: -item[1]))
+    logger.info(f"Templates used at or below this folder (document counts): {summary}")
+
+
+@instrumentation.profiled
 def on_template_selected(main_window_ref, event):
     selected_template = main_window_ref.template_combobox.get()
-    print(f"LOG: User selected Template: '{selected_template}'")
+    logger.info(f"User selected Template: '{selected_template}'")
     if main_window_ref.folder_tree.selection():
         main_window_ref.btn_generate.config(state="normal")
+        main_window_ref.btn_upload.config(state="normal")
+
+
+def _export_job(job, url, template_ids, output_dir, profile):
+    def progress(done, total):
+        if done % 10 == 0 or done == total:
+            logger.info(f"Exported {done} of {total} templates...")
+
+    return services.export_templates(url, template_ids, output_dir, on_progress=progress,
+                                     should_stop=lambda: job.cancelled, profile=profile)
+
+
+def _start_export(main_window_ref, url, template_ids, output_dir, profile=None):
+    def finished(result):
+        logger.info(f"Wrote {len(result['written'])} template files to {output_dir} "
+                    f"(field manifest: {template_generator.MANIFEST_FILE}).")
+        if result['failed']:
+            logger.warning(f"Could not fetch details for template IDs: {', '.join(map(str, result['failed']))}")
 
+    main_window_ref.jobs.submit(_export_job, url, template_ids, output_dir, profile or services.current_profile(),
+                                key="export", on_success=finished)
 
+
+@instrumentation.profiled
 def generate_template(main_window_ref):
-    print("LOG: User clicked 'Generate Template'.")
-    url = app_settings.get("alation_url")
+    logger.info("User clicked 'Generate Template'.")
+    url = services.app_settings.get("alation_url")
     selected_template_name = main_window_ref.template_combobox.get()
-    selected_template_id = app_data.template_title_to_id_map.get(selected_template_name)
+    selected_template_id = services.app_data.template_title_to_id_map.get(selected_template_name)
     if not url or not selected_template_id:
-        print("ERROR: URL or Template not selected correctly.");
+        logger.error("URL or Template not selected correctly.");
         return
-    template_details = alation_api.get_template_details(url, selected_template_id)
-    if template_details and 'fields' in template_details:
-        all_fields = [{'name_singular': 'Title', 'field_type': 'TEXT'}]
-        all_fields.extend(template_details['fields'])
-        print(f"--- Fields for Template ID: {selected_template_id} ('{selected_template_name}') ---")
-        for field in all_fields:
-            print(f"  - Field Name: {field.get('name_singular')}, Type: {field.get('field_type')}")
-        print("---------------------------------------")
-    else:
-        print("LOG: Could not fetch template details or template has no fields.")
\ No newline at end of file
+    output_dir = main_window_ref.ask_output_directory()
+    if not output_dir: return
+    _start_export(main_window_ref, url, [selected_template_id], output_dir)
+
+
+@instrumentation.profiled
+def export_folder_templates(main_window_ref):
+    """
+    Exports upload templates for every template listed for the selected folder.
+    """
+    url = services.app_settings.get("alation_url")
+    template_ids = sorted(set(services.app_data.template_title_to_id_map.values()))
+    if not url or not template_ids:
+        logger.error("Select a folder with templates first."); return
+    output_dir = main_window_ref.ask_output_directory()
+    if not output_dir: return
+    logger.info(f"Exporting {len(template_ids)} templates from the selected folder...")
+    _start_export(main_window_ref, url, template_ids, output_dir)
+
+
+@instrumentation.profiled
+def export_hub_templates(main_window_ref):
+    """
+    Finds every template used by documents in the selected hub, then exports them all.
+    """
+    url = services.app_settings.get("alation_url")
+    hub_text = main_window_ref.hub_combobox.get()
+    if not url or not hub_text:
+        logger.error("Select a Document Hub first."); return
+    hub_id = int(hub_text)
+    output_dir = main_window_ref.ask_output_directory()
+    if not output_dir: return
+    profile = services.current_profile()
+
+    def hub_template_ids(job):
+        return services.hub_template_ids(url, hub_id, should_stop=lambda: job.cancelled, profile=profile)
+
+    def found(template_ids):
+        if not template_ids:
+            logger.info(f"No templates are used in Hub ID {hub_id}."); return
+        logger.info(f"Exporting {len(template_ids)} templates used in Hub ID {hub_id}...")
+        _start_export(main_window_ref, url, template_ids, output_dir, profile)
+
+    logger.info(f"Scanning documents in Hub ID {hub_id} for templates...")
+    main_window_ref.jobs.submit(hub_template_ids, key="export", on_success=found)
+
+
+@instrumentation.profiled
+def upload_documents(main_window_ref):
+    """
+    Uploads a filled-in CSV/XLSX template into the selected folder as documents of the selected template.
+    Re-running with the same file resumes from its journal.
+    """
+    url = services.app_settings.get("alation_url")
+    template_id = services.app_data.template_title_to_id_map.get(main_window_ref.template_combobox.get())
+    selection = main_window_ref.folder_tree.selection()
+    if not url or not template_id or not selection:
+        logger.error("Select a folder and a template before uploading."); return
+    folder_id, hub_id = int(selection[0]), int(main_window_ref.hub_combobox.get())
+    path = main_window_ref.ask_upload_file()
+    if not path: return
+    profile = services.current_profile()
+
+    def upload(job):
+        def progress(summary):
+            logger.info(f"Upload progress: {summary['committed']} batches committed, "
+                        f"{summary['skipped']} already done, {len(summary['failed'])} failed.")
+
+        return services.upload_documents(url, path, template_id, folder_id, hub_id, on_progress=progress,
+                                         should_stop=lambda: job.cancelled, profile=profile)
+
+    def finished(summary):
+        logger.info(f"Upload finished: {summary['documents']} documents in {summary['committed']} new batches; "
+                    f"{summary['skipped']} batches were already committed.")
+        if summary['failed']:
+            logger.warning(f"{len(summary['failed'])} batches failed ({', '.join(summary['failed'])}). "
+                           f"Upload the same file again to retry them.")
+        if summary['pending']:
+            logger.warning(f"{len(summary['pending'])} batches are still being processed by Alation. "
+                           f"Upload the same file again to check on them.")
+        if summary['invalid_rows']:
+            logger.warning(f"{len(summary['invalid_rows'])} rows were left out (rows "
+                           f"{', '.join(str(row) for row, _ in summary['invalid_rows'])}); see the log above.")
+
+    def failed(error):
+        logger.error(f"Upload stopped: {error}")
+
+    logger.info(f"Uploading {path} into folder {folder_id}...")
+    main_window_ref.jobs.submit(upload, key="upload", on_success=finished, on_error=failed)
@@ -0,0 +1,200 @@
+# apt2.py
+"""
+Headless entry point for batch jobs: python -m apt2 refresh|hubs|export|usage|upload|profiles|refresh-all|compare ...
+Never imports tkinter, so it runs on cron/CI hosts without a display. Each command prints one
+JSON object to stdout; log lines go to stderr and, with --log-file, to a rotating file.
+"""
+import argparse
+import json
+import sys
+
+import app_logging
+import instrumentation
+import services
+import template_generator
+
+EXIT_OK, EXIT_FAILED, EXIT_NOT_CONFIGURED = 0, 1, 2
+
+
+def cmd_refresh(args):
+    url = services.app_settings["alation_url"]
+    refreshed = services.refresh_folders(url, force=args.force, full=args.full, sweep_deletions=args.sweep_deletions)
+    app_data = services.app_data
+    result = {'folders': app_data.folder_count, 'hubs': sorted(app_data.doc_hubs), 'mode': refreshed['mode'],
+              'from_cache': refreshed['mode'] == "cache"}
+    if refreshed['delta'] is not None: result['delta'] = refreshed['delta']
+    return result
+
+
+def cmd_hubs(args):
+    if not services.load_cached_folders():
+        if not services.authenticate(): raise RuntimeError("Authentication failed.")
+        cmd_refresh(argparse.Namespace(force=True, full=True, sweep_deletions=False))
+    app_data = services.app_data
+    return {'hubs': [{'id': hub_id, 'folders': len(app_data.folders_by_hub[hub_id])}
+                     for hub_id in sorted(app_data.folders_by_hub)]}
+
+
+def cmd_export(args):
+    url = services.app_settings["alation_url"]
+    if args.template_id:
+        template_ids = args.template_id
+    elif args.folder_id is not None:
+        if args.hub_id is None: raise ValueError("--folder-id needs --hub-id")
+        template_ids = [t_id for t_id, _ in services.folder_templates(url, args.hub_id, args.folder_id)[1]]
+    elif args.hub_id is not None:
+        template_ids = services.hub_template_ids(url, args.hub_id)
+    else:
+        raise ValueError("export needs --template-id, --hub-id or --folder-id")
+    result = services.export_templates(url, template_ids, args.output, formats=args.format)
+    return {'templates': len(template_ids), 'written': result['written'], 'failed': result['failed']}
+
+
+def cmd_usage(args):
+    url = services.app_settings["alation_url"]
+    if not services.load_cached_folders():
+        services.reset_app_data(services.fetch_all_folders(url))
+    options = {key: services.app_settings[setting] for key, setting in
+               (("max_workers", "prefetch_concurrency"), ("rate_limit", "prefetch_rate_limit"))
+               if setting in services.app_settings}
+    crawl = services.crawl_hub_templates(url, args.hub_id, **options)
+    usage = services.app_data.template_usage(args.hub_id, args.folder_id)
+    names = dict(services.resolve_template_names(url, usage))
+    return {'hub_id': args.hub_id, 'folder_id': args.folder_id, 'folders_indexed': crawl['folders'],
+            'failed': crawl['failed'],
+            'templates': [{'id': t_id, 'title': names[t_id], 'documents': count}
+                          for t_id, count in sorted(usage.items(), key=lambda item: (-item[1], item[0]))]}
+
+
+def cmd_upload(args):
+    url = services.app_settings["alation_url"]
+    summary = services.upload_documents(url, args.file, args.template_id, args.folder_id, args.hub_id,
+                                        batch_size=args.batch_size, concurrency=args.concurrency,
+                                        rate_limit=args.rate_limit, journal_path=args.journal)
+    return summary
+
+
+def cmd_profiles(args):
+    settings = services.load_settings()
+    return {'active': services.active_profile,
+            'profiles': [{'name': name, 'alation_url': services.profile_settings(settings, name).get("alation_url")}
+                         for name in services.profile_names(settings)]}
+
+
+def cmd_refresh_all(args):
+    results = services.refresh_profiles(args.only, force=args.force, full=args.full,
+                                        sweep_deletions=args.sweep_deletions)
+    return {'profiles': results, 'failed': sorted(name for name, result in results.items() if 'error' in result)}
+
+
+def cmd_compare(args):
+    result = services.compare_templates(args.template_id, args.only)
+    return dict(result, failed=sorted(result['errors']))
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="apt2", description="Alation Power Tools (headless)")
+    parser.add_argument("--config", default=services.CONFIG_FILE, help="Path to config.json")
+    parser.add_argument("--connection", metavar="PROFILE",
+                        help="Connection profile from config.json (default: its active_profile)")
+    parser.add_argument("--log-file", help="Also write log lines to this rotating file")
+    parser.add_argument("--log-level", default="INFO", choices=["DEBUG", "INFO", "WARNING", "ERROR"])
+    parser.add_argument("--metrics", choices=["json", "prometheus"],
+                        help="After the command, dump per-endpoint API metrics in this format")
+    parser.add_argument("--metrics-out", help="Write --metrics here instead of stderr")
+    parser.add_argument("--profile", metavar="DIR", help="cProfile the command into DIR/<command>.prof")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    refresh = commands.add_parser("refresh", help="Refresh the local folder cache")
+    refresh.add_argument("--force", action="store_true", help="Refresh even if the cache is fresh")
+    refresh.add_argument("--full", action="store_true", help="Re-download every folder instead of syncing changes")
+    refresh.add_argument("--sweep-deletions", action="store_true",
+                         help="Page the full folder list during an incremental sync to detect deletions")
+    refresh.set_defaults(handler=cmd_refresh, needs_auth=True)
+
+    hubs = commands.add_parser("hubs", help="List Document Hubs from the local cache")
+    hubs.set_defaults(handler=cmd_hubs, needs_auth=False)
+
+    export = commands.add_parser("export", help="Write CSV/XLSX upload templates")
+    export.add_argument("--template-id", type=int, action="append", help="Template to export (repeatable)")
+    export.add_argument("--hub-id", type=int, help="Export every template used in this hub")
+    export.add_argument("--folder-id", type=int, help="Export the templates used in this folder (needs --hub-id)")
+    export.add_argument("--output", required=True, help="Output directory")
+    export.add_argument("--format", action="append", choices=template_generator.FORMATS,
+                        help="File format (repeatable; default: all)")
+    export.set_defaults(handler=cmd_export, needs_auth=True)
+
+    usage = commands.add_parser("usage", help="Crawl a hub and count documents per template")
+    usage.add_argument("--hub-id", type=int, required=True)
+    usage.add_argument("--folder-id", type=int, help="Only count this folder and its subfolders")
+    usage.set_defaults(handler=cmd_usage, needs_auth=True)
+
+    upload = commands.add_parser("upload", help="Create/update documents from a filled-in template")
+    upload.add_argument("file", help="Filled-in CSV or XLSX upload template")
+    upload.add_argument("--template-id", type=int, required=True)
+    upload.add_argument("--folder-id", type=int, required=True)
+    upload.add_argument("--hub-id", type=int, required=True)
+    upload.add_argument("--batch-size", type=int)
+    upload.add_argument("--concurrency", type=int)
+    upload.add_argument("--rate-limit", type=float, help="Batch requests per second")
+    upload.add_argument("--journal", help="Checkpoint journal path (default: FILE.journal)")
+    upload.set_defaults(handler=cmd_upload, needs_auth=True)
+
+    profiles = commands.add_parser("profiles", help="List the connection profiles in config.json")
+    profiles.set_defaults(handler=cmd_profiles, needs_auth=False)
+
+    refresh_all = commands.add_parser("refresh-all", help="Refresh the folder caches of several profiles concurrently")
+    refresh_all.add_argument("--only", metavar="PROFILE", action="append",
+                             help="Profile to refresh (repeatable; default: all)")
+    refresh_all.add_argument("--force", action="store_true", help="Refresh even if a cache is fresh")
+    refresh_all.add_argument("--full", action="store_true", help="Re-download every folder instead of syncing changes")
+    refresh_all.add_argument("--sweep-deletions", action="store_true",
+                             help="Page the full folder lists during incremental syncs to detect deletions")
+    refresh_all.set_defaults(handler=cmd_refresh_all, needs_auth=False)
+
+    compare = commands.add_parser("compare", help="Diff template fields across profiles")
+    compare.add_argument("--template-id", type=int, action="append", required=True, help="Template (repeatable)")
+    compare.add_argument("--only", metavar="PROFILE", action="append",
+                         help="Profile to compare (repeatable; default: all)")
+    compare.set_defaults(handler=cmd_compare, needs_auth=False)
+    return parser
+
+
+def write_metrics(metrics_format, path=None):
+    text = instrumentation.dump(metrics_format)
+    if path:
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(text)
+    else:
+        sys.stderr.write(text)
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if getattr(args, 'format', None) is None and args.command == "export":
+        args.format = list(template_generator.FORMATS)
+    app_logging.configure(level=args.log_level, stream=sys.stderr, log_file=args.log_file)
+    try:
+        services.CONFIG_FILE = args.config
+        if not services.prepare_connection(args.connection):
+            result, exit_code = {'error': f"{args.config} is missing or incomplete."}, EXIT_NOT_CONFIGURED
+        elif args.needs_auth and not services.authenticate():
+            result, exit_code = {'error': "Authentication failed."}, EXIT_FAILED
+        else:
+            instrumentation.enable_profiling(args.profile, what=f"command {args.command}")
+            try:
+                result = instrumentation.profiled(args.handler, name=args.command)(args)
+            finally:
+                instrumentation.enable_profiling(None)
+            exit_code = EXIT_FAILED if result.get('failed') else EXIT_OK
+    except Exception as e:
+        result, exit_code = {'error': f"{type(e).__name__}: {e}"}, EXIT_FAILED
+    if args.metrics:
+        write_metrics(args.metrics, args.metrics_out)
+    json.dump(dict(result, command=args.command), sys.stdout)
+    sys.stdout.write("\n")
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,249 @@
+# benchmarks/mock_alation.py
+"""
+Local stand-in for the Alation endpoints APT uses, serving synthetic folders, documents and templates
+computed on the fly (so 500k folders cost no memory), with optional latency and error injection.
+
+    python -m benchmarks.mock_alation --folders 100000 --port 8080
+
+then point config.json at http://127.0.0.1:8080 (any user_id/refresh_token works).
+"""
+import argparse
+import json
+import random
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+BASE_TIMESTAMP = "2026-01-01T00:00:00+00:00"
+DEFAULT_PAGE_CAP = 1000  # Largest page the mock returns, whatever limit is asked for.
+
+
+class MockAlation:
+    """
+    Synthetic instance layout. Folder IDs 1..folders are dealt round-robin to hubs; within a hub the k-th
+    folder's parent is the ((k - 1) // fanout)-th, giving a balanced tree. Each folder holds
+    documents_per_folder documents whose template IDs cycle through 1..templates.
+    """
+
+    def __init__(self, folders=1000, hubs=10, fanout=10, documents_per_folder=3, templates=20,
+                 fields_per_template=15, latency=0.0, jitter=0.0, error_rate=0.0, error_status=503,
+                 page_cap=DEFAULT_PAGE_CAP, next_page_header=False, description_bytes=0, seed=0):
+        self.folders = folders
+        self.hubs = min(hubs, folders) or 1
+        self.fanout = fanout
+        self.documents_per_folder = documents_per_folder
+        self.templates = templates
+        self.fields_per_template = fields_per_template
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.page_cap = page_cap
+        self.next_page_header = next_page_header
+        self.description = "x" * description_bytes  # Pads records towards the size of real API objects.
+        self.modified = {}  # folder_id -> ts_updated, for folders touched after BASE_TIMESTAMP
+        self.requests = {}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = None
+
+    # --- Synthetic data ---
+
+    def folder(self, folder_id):
+        hub_id = (folder_id - 1) % self.hubs + 1
+        position = (folder_id - 1) // self.hubs
+        parent_id = ((position - 1) // self.fanout) * self.hubs + hub_id if position else None
+        return {'id': folder_id, 'title': f"Folder {folder_id}", 'document_hub_id': hub_id,
+                'parent_folder_id': parent_id, 'ts_updated': self.modified.get(folder_id, BASE_TIMESTAMP),
+                'description': self.description}
+
+    def hub_folder_ids(self, hub_id):
+        return range(hub_id, self.folders + 1, self.hubs)
+
+    def document(self, folder_id, index):
+        return {'id': (folder_id - 1) * self.documents_per_folder + index + 1, 'title': f"Document {index}",
+                'template_id': (folder_id + index) % self.templates + 1 if self.templates else None,
+                'document_hub_id': (folder_id - 1) % self.hubs + 1, 'folder_ids': [folder_id],
+                'ts_updated': self.modified.get(folder_id, BASE_TIMESTAMP), 'description': self.description}
+
+    def touch(self, folder_ids, timestamp):
+        """Marks folders (and their documents) as modified at timestamp, for incremental sync runs."""
+        for folder_id in folder_ids:
+            self.modified[folder_id] = timestamp
+
+    def template(self, template_id):
+        fields = [{'id': template_id * 1000 + i, 'name_singular': f"Field {i}", 'field_type': "RICH_TEXT"}
+                  for i in range(self.fields_per_template)]
+        return {'id': template_id, 'title': f"Template {template_id}", 'fields': fields}
+
+    def _folder_ids(self, query):
+        hub_id = _int_param(query, 'document_hub_id')
+        folder_ids = self.hub_folder_ids(hub_id) if hub_id else range(1, self.folders + 1)
+        since = query.get('ts_updated__gt', [None])[0]
+        if since is not None:
+            folder_ids = [f_id for f_id in sorted(self.modified) if f_id in folder_ids and self.modified[f_id] > since]
+        return folder_ids
+
+    def folder_page(self, query, skip, limit):
+        folder_ids = self._folder_ids(query)
+        return [self.folder(folder_id) for folder_id in folder_ids[skip:skip + limit]], len(folder_ids)
+
+    def document_page(self, query, skip, limit):
+        parent_id = _int_param(query, 'parent_folder_id')
+        folder_ids = [parent_id] if parent_id else self._folder_ids(query)
+        per_folder = self.documents_per_folder
+        total = len(folder_ids) * per_folder
+        page = [self.document(folder_ids[i // per_folder], i % per_folder)
+                for i in range(skip, min(skip + limit, total))]
+        return page, total
+
+    # --- Bookkeeping ---
+
+    def count(self, endpoint):
+        with self._lock:
+            self.requests[endpoint] = self.requests.get(endpoint, 0) + 1
+
+    def should_fail(self):
+        with self._lock:
+            return self.error_rate and self._random.random() < self.error_rate
+
+    def delay(self):
+        with self._lock:
+            extra = self._random.uniform(0, self.jitter) if self.jitter else 0
+        if self.latency or extra: time.sleep(self.latency + extra)
+
+    # --- Server ---
+
+    def start(self, host="127.0.0.1", port=0):
+        handler = type("Handler", (_Handler,), {'mock': self})
+        self._server = ThreadingHTTPServer((host, port), handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name="mock-alation", daemon=True).start()
+        return self.url
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def _int_param(query, name):
+    value = query.get(name, [None])[0]
+    return int(value) if value not in (None, '') else None
+
+
+class _Handler(BaseHTTPRequestHandler):
+    mock = None
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True  # Headers and body are written separately; avoid 40 ms delayed-ACK stalls.
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, payload=None, headers=None):
+        body = json.dumps(payload).encode() if payload is not None else b''
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _route(self, method):
+        url = urlparse(self.path)
+        parts = [part for part in url.path.split('/') if part]
+        query = parse_qs(url.query)
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        mock = self.mock
+        endpoint = '/'.join(part if not part.isdigit() else '{id}' for part in parts)
+        mock.count(f"{method} {endpoint}")
+        mock.delay()
+        if endpoint == "integration/v1/createAPIAccessToken" and method == "POST":
+            return self._send(201, {'api_access_token': f"mock-token-{int(time.time() * 1000)}"})
+        if not self.headers.get('Token'):
+            return self._send(401, {'detail': "Authentication credentials were not provided."})
+        if mock.should_fail():
+            return self._send(mock.error_status, {'detail': "Injected error"}, {'Retry-After': '0'})
+        if endpoint == "integration/v2/user/{id}":
+            return self._send(200, {'id': int(parts[-1])})
+        if endpoint in ("integration/v2/folder", "integration/v2/document") and method == "GET":
+            return self._send_page(endpoint, query)
+        if endpoint == "integration/v2/document" and method in ("POST", "PUT"):
+            return self._send(202, {'job_id': len(json.loads(body or b'[]'))})
+        if endpoint == "api/v1/bulk_metadata/job" and method == "GET":
+            return self._send(200, {'status': "successful", 'msg': "Job finished", 'result': []})
+        if endpoint == "integration/visual_config/{id}":
+            return self._send_validated({'id': int(parts[-1]), 'title': f"Template {parts[-1]}"})
+        if endpoint == "integration/v1/custom_template/{id}":
+            return self._send_validated(mock.template(int(parts[-1])))
+        return self._send(404, {'detail': "Not found."})
+
+    def _send_page(self, endpoint, query):
+        mock = self.mock
+        skip = _int_param(query, 'skip') or 0
+        limit = min(_int_param(query, 'limit') or 100, mock.page_cap)
+        page_of = mock.folder_page if endpoint.endswith("folder") else mock.document_page
+        page, total = page_of(query, skip, limit)
+        headers = {}
+        if mock.next_page_header and skip + len(page) < total:
+            next_query = {key: values[0] for key, values in query.items()}
+            next_query.update(skip=skip + len(page), limit=limit)
+            headers['X-Next-Page'] = f"/{endpoint}/?" + '&'.join(f"{k}={v}" for k, v in next_query.items())
+        self._send(200, page, headers)
+
+    def _send_validated(self, payload):
+        etag = f'"{zlib.crc32(json.dumps(payload, sort_keys=True).encode()):x}"'
+        if self.headers.get('If-None-Match') == etag:
+            return self._send(304, headers={'ETag': etag})
+        self._send(200, payload, {'ETag': etag})
+
+    def do_GET(self):
+        self._route("GET")
+
+    def do_POST(self):
+        self._route("POST")
+
+    def do_PUT(self):
+        self._route("PUT")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve a synthetic Alation instance for local testing")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--folders", type=int, default=10000)
+    parser.add_argument("--hubs", type=int, default=10)
+    parser.add_argument("--documents-per-folder", type=int, default=3)
+    parser.add_argument("--templates", type=int, default=20)
+    parser.add_argument("--record-bytes", type=int, default=0, help="Padding per folder/document record")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every response")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with 503")
+    args = parser.parse_args(argv)
+    mock = MockAlation(folders=args.folders, hubs=args.hubs, documents_per_folder=args.documents_per_folder,
+                       templates=args.templates, latency=args.latency, error_rate=args.error_rate,
+                       description_bytes=args.record_bytes)
+    print(f"Serving {args.folders} folders at {mock.start(port=args.port)} (Ctrl+C to stop)")
+    try:
+        while True: time.sleep(3600)
+    except KeyboardInterrupt:
+        mock.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,264 @@
+# benchmarks/run.py
+"""
+Times the main APT workflows against the mock Alation server and writes the results as JSON.
+
+    python -m benchmarks.run --folders 100000 --output results.json
+    python -m benchmarks.run --folders 100000 --compare baseline.json
+
+Scenarios: refresh (full folder download and indexing), delta_sync (incremental re-fetch), hub_switch
+(top level of a hub's folder tree), folder_click_cold/folder_click_warm (templates of a folder from the
+network/from the hub crawl index), hub_crawl_threads/hub_crawl_async (indexing a whole hub with the thread
+pool/the asyncio client; the latter only when httpx is installed), template_export (CSV+XLSX upload templates),
+and decode_page/decode_page_baseline (one folder page through alation_api's decoder vs. plain json of the whole
+records).
+With --compare, exits 1 if any scenario's p50 is slower than the baseline by more than --tolerance.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+try:
+    import resource  # Unix only; used for the peak RSS figure.
+except ImportError:
+    resource = None
+
+import alation_api
+import alation_async
+import app_logging
+import app_logic
+import services
+from benchmarks.mock_alation import MockAlation
+
+RESULTS_VERSION = 1
+EXIT_OK, EXIT_REGRESSION = 0, 1
+
+
+class FakeTree:
+    """The slice of ttk.Treeview that app_logic.build_folder_tree uses, without a display."""
+
+    def __init__(self):
+        self.children = {'': []}
+
+    def insert(self, parent, index, iid, text):
+        iid = str(iid)
+        self.children[iid] = []
+        self.children[str(parent)].append(iid)
+        return iid
+
+    def exists(self, item):
+        return str(item) in self.children
+
+    def get_children(self, item=''):
+        return self.children[str(item)]
+
+    def delete(self, *items):
+        for item in items:
+            for child in self.children.pop(str(item), []):
+                self.delete(child)
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values: return None
+    index = max(0, min(len(sorted_values) - 1, round(fraction * len(sorted_values) + 0.5) - 1))
+    return sorted_values[index]
+
+
+def summarize(durations, items=None, unit=None):
+    """
+    Turns per-run durations (seconds) into latency percentiles in milliseconds, plus throughput
+    (items per second over all runs) when items processed per run is given.
+    """
+    values = sorted(durations)
+    result = {'runs': len(values), 'p50_ms': percentile(values, 0.50) * 1000,
+              'p90_ms': percentile(values, 0.90) * 1000, 'p99_ms': percentile(values, 0.99) * 1000,
+              'max_ms': values[-1] * 1000, 'mean_ms': sum(values) / len(values) * 1000}
+    if items:
+        result['throughput'] = items * len(values) / sum(values)
+        result['unit'] = unit
+    return {key: round(value, 3) if isinstance(value, float) else value for key, value in result.items()}
+
+
+def timed(fn, *args):
+    started = time.perf_counter()
+    result = fn(*args)
+    return time.perf_counter() - started, result
+
+
+def connect(url, workdir):
+    services.CONFIG_FILE = os.path.join(workdir, "config.json")
+    services.app_settings = {"alation_url": url, "user_id": "1", "refresh_token": "benchmark"}
+    alation_api.configure_client(url)
+    if not services.authenticate(): raise RuntimeError(f"Could not authenticate against {url}")
+
+
+def reset_cache(url):
+    if services.cache is not None: services.cache.clear()
+    services.registry.clear()
+    services.open_cache(url)
+
+
+def bench_refresh(url, folders, repeat):
+    durations = []
+    for _ in range(repeat):
+        reset_cache(url)
+        duration, _ = timed(lambda: services.reset_app_data(services.fetch_all_folders(url)))
+        durations.append(duration)
+    return summarize(durations, folders, "folders/s")
+
+
+def bench_delta_sync(mock, url, repeat, changed):
+    durations = []
+    folder_ids = random.Random(1).sample(range(1, mock.folders + 1), min(changed, mock.folders))
+    for _ in range(repeat):
+        mock.touch(folder_ids, datetime.now(timezone.utc).isoformat(timespec='seconds'))
+        durations.append(timed(services.sync_folders, url)[0])
+    return summarize(durations, len(folder_ids), "changed folders/s")
+
+
+def bench_hub_switch(hub_ids):
+    durations = []
+    for hub_id in hub_ids:
+        tree = FakeTree()
+        durations.append(timed(app_logic.build_folder_tree, tree, '', hub_id, None)[0])
+    return summarize(durations)
+
+
+def bench_folder_clicks(url, hub_id, clicks):
+    folder_ids = list(services.app_data.folders_by_hub[hub_id])[:clicks]
+    services.app_data.template_usage_by_folder.clear()
+    services.registry.clear()
+    cold = [timed(services.folder_templates, url, hub_id, folder_id)[0] for folder_id in folder_ids]
+    services.crawl_hub_templates(url, hub_id, rate_limit=None)
+    warm = [timed(services.indexed_folder_templates, folder_id)[0] for folder_id in folder_ids]
+    return summarize(cold), summarize(warm)
+
+
+def bench_hub_crawl(url, hub_id, repeat, use_async):
+    """Indexes a whole hub from an empty document cache, without a rate limit."""
+    durations = []
+    folders = len(services.app_data.folders_by_hub[hub_id])
+    for _ in range(repeat):
+        reset_cache(url)
+        services.app_data.template_usage_by_folder.clear()
+        durations.append(timed(lambda: services.crawl_hub_templates(url, hub_id, rate_limit=None,
+                                                                    use_async=use_async))[0])
+    return summarize(durations, folders, "folders/s")
+
+
+def bench_template_export(url, templates, workdir, repeat):
+    durations = []
+    for run in range(repeat):
+        reset_cache(url)
+        output_dir = os.path.join(workdir, f"export-{run}")
+        durations.append(timed(services.export_templates, url, range(1, templates + 1), output_dir)[0])
+    return summarize(durations, templates, "templates/s")
+
+
+def bench_decode(mock, page_size, repeat):
+    """Decodes one synthetic folder page body repeatedly, with projection and as the old full-record path."""
+    body = json.dumps([mock.folder(folder_id) for folder_id in range(1, page_size + 1)]).encode()
+    megabytes = len(body) / 1e6
+    decode = lambda: alation_api.project(alation_api.decode_json(body), alation_api.FOLDER_FIELDS)
+    baseline = lambda: json.loads(body.decode('utf-8'))
+    return (summarize([timed(decode)[0] for _ in range(repeat)], megabytes, "MB/s"),
+            summarize([timed(baseline)[0] for _ in range(repeat)], megabytes, "MB/s"))
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def run(args):
+    mock = MockAlation(folders=args.folders, hubs=args.hubs, documents_per_folder=args.documents_per_folder,
+                       templates=args.templates, latency=args.latency, error_rate=args.error_rate,
+                       description_bytes=args.record_bytes)
+    started_at = datetime.now(timezone.utc).isoformat(timespec='seconds')
+    results = {}
+    with mock, tempfile.TemporaryDirectory() as workdir:
+        url = mock.url
+        connect(url, workdir)
+        results['refresh'] = bench_refresh(url, args.folders, args.repeat)
+        results['delta_sync'] = bench_delta_sync(mock, url, args.repeat, args.changed)
+        hub_ids = sorted(services.app_data.folders_by_hub)
+        results['hub_switch'] = bench_hub_switch(hub_ids)
+        results['folder_click_cold'], results['folder_click_warm'] = bench_folder_clicks(url, hub_ids[0], args.clicks)
+        results['hub_crawl_threads'] = bench_hub_crawl(url, hub_ids[0], args.repeat, use_async=False)
+        if alation_async.available():
+            results['hub_crawl_async'] = bench_hub_crawl(url, hub_ids[0], args.repeat, use_async=True)
+        results['template_export'] = bench_template_export(url, args.templates, workdir, args.repeat)
+        results['decode_page'], results['decode_page_baseline'] = bench_decode(mock, alation_api.DEFAULT_PAGE_SIZE,
+                                                                               args.repeat * 10)
+        if services.cache is not None: services.cache.close()
+        services.cache = None
+        requests_served = dict(sorted(mock.requests.items()))
+    return {'version': RESULTS_VERSION, 'revision': git_revision(), 'python': platform.python_version(),
+            'platform': platform.platform(), 'started_at': started_at,
+            'parameters': {key: value for key, value in vars(args).items() if key not in ('output', 'compare',
+                                                                                        'tolerance')},
+            'results': results, 'requests': requests_served,
+            'max_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss if resource else None}
+
+
+def compare(report, baseline, tolerance):
+    """
+    Returns the scenarios whose p50 latency regressed by more than tolerance (a fraction) against the baseline.
+    """
+    regressions = []
+    for name, result in report['results'].items():
+        before = baseline.get('results', {}).get(name)
+        if before and before['p50_ms'] and result['p50_ms'] > before['p50_ms'] * (1 + tolerance):
+            regressions.append({'scenario': name, 'baseline_p50_ms': before['p50_ms'], 'p50_ms': result['p50_ms']})
+    return regressions
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="benchmarks.run", description="Benchmark APT against a mock Alation")
+    parser.add_argument("--folders", type=int, default=10000, help="Synthetic folders (1k-500k is sensible)")
+    parser.add_argument("--hubs", type=int, default=10)
+    parser.add_argument("--documents-per-folder", type=int, default=3)
+    parser.add_argument("--templates", type=int, default=20)
+    parser.add_argument("--record-bytes", type=int, default=500,
+                        help="Padding per folder/document record, to approach real API object sizes")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds the mock adds to every response")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests failing with 503")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs of each whole-dataset scenario")
+    parser.add_argument("--clicks", type=int, default=50, help="Folder clicks to time")
+    parser.add_argument("--changed", type=int, default=100, help="Folders touched before each delta sync")
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    parser.add_argument("--compare", help="Baseline JSON report to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed p50 slowdown (0.2 = 20%%)")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    app_logging.configure(level="WARNING", stream=sys.stderr)
+    report = run(args)
+    exit_code = EXIT_OK
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            report['regressions'] = compare(report, json.load(f), args.tolerance)
+        if report['regressions']: exit_code = EXIT_REGRESSION
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1 +1,448 @@
-#/document_uploader.py
\ No newline at end of file
+#/document_uploader.py
+import csv
+import hashlib
+import json
+import os
+import threading
+import time
+import zipfile
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+import app_logging
+import alation_api
+import jobs
+
+logger = app_logging.get_logger("document_uploader")
+
+DEFAULT_BATCH_SIZE = 100
+DEFAULT_CONCURRENCY = 4
+DEFAULT_RATE_LIMIT = 5.0  # batch requests per second
+MAX_THROTTLE_RETRIES = 5
+JOB_POLL_INTERVAL = 2.0  # seconds between status checks of a batch the server accepted as an async job
+JOB_TIMEOUT = 10 * 60  # seconds to wait for one job before leaving the batch pending for the next resume
+JOB_SUCCEEDED = "successful"
+JOB_FAILED = "failed"
+JOURNAL_SUFFIX = ".journal"
+ID_COLUMN = "id"
+TITLE_COLUMN = "title"
+MULTI_VALUE_SEPARATOR = ";"  # Separates the values of multi-picker and object-set cells.
+XLSX_EPOCH = datetime(1899, 12, 30, tzinfo=timezone.utc)  # Day zero of Excel date serial numbers.
+
+_XLSX_NS = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+
+
+class UploadError(Exception):
+    """Raised when an upload cannot start, e.g. an unreadable file or a journal from a different run."""
+
+
+class XlsxNumber(str):
+    """The text of a numeric XLSX cell, kept apart from typed text so a date column reads it as a serial number."""
+
+
+class RateLimiter:
+    """
+    Spaces calls at least 1/rate seconds apart across all threads.
+    """
+
+    def __init__(self, rate_per_second):
+        self.interval = 1.0 / rate_per_second if rate_per_second else 0
+        self._lock = threading.Lock()
+        self._next_slot = 0.0
+
+    def acquire(self):
+        if not self.interval: return
+        with self._lock:
+            now = time.monotonic()
+            wait_for = self._next_slot - now
+            self._next_slot = max(now, self._next_slot) + self.interval
+        if wait_for > 0:
+            time.sleep(wait_for)
+
+
+# --- Reading filled-in templates ---
+
+def _iter_xlsx_rows(path):
+    """
+    Streams rows of the first worksheet as lists of strings, resolving shared and inline strings.
+    Numeric cells come back as XlsxNumber.
+    """
+    with zipfile.ZipFile(path) as zf:
+        shared = []
+        if 'xl/sharedStrings.xml' in zf.namelist():
+            with zf.open('xl/sharedStrings.xml') as f:
+                for _, element in ET.iterparse(f):
+                    if element.tag == f'{_XLSX_NS}si':
+                        shared.append(''.join(t.text or '' for t in element.iter(f'{_XLSX_NS}t')))
+                        element.clear()
+        sheets = sorted(name for name in zf.namelist() if name.startswith('xl/worksheets/sheet'))
+        if not sheets: raise UploadError(f"{path} has no worksheets.")
+        with zf.open(sheets[0]) as f:
+            for _, element in ET.iterparse(f):
+                if element.tag != f'{_XLSX_NS}row': continue
+                values = {}
+                for cell in element.iter(f'{_XLSX_NS}c'):
+                    ref = ''.join(ch for ch in cell.get('r', '') if ch.isalpha())
+                    column = 0
+                    for ch in ref: column = column * 26 + ord(ch) - 64
+                    cell_type = cell.get('t')
+                    if cell_type == 'inlineStr':
+                        value = ''.join(t.text or '' for t in cell.iter(f'{_XLSX_NS}t'))
+                    else:
+                        value = cell.findtext(f'{_XLSX_NS}v') or ''
+                        if cell_type == 's' and value: value = shared[int(value)]
+                        elif cell_type in (None, 'n') and value: value = XlsxNumber(value)
+                    values[column - 1 if column else len(values)] = value
+                element.clear()
+                yield [values.get(i, '') for i in range(max(values) + 1)] if values else []
+
+
+def iter_rows(path):
+    """
+    Yields each data row of a filled-in CSV or XLSX upload template as a {header: value} dict.
+    """
+    for _, row in iter_numbered_rows(path):
+        yield row
+
+
+def iter_numbered_rows(path):
+    """
+    Like iter_rows, but yields (row_number, row) where row_number is the row in the file (the header is row 1).
+    """
+    if path.lower().endswith('.xlsx'):
+        rows = _iter_xlsx_rows(path)
+        header = next(rows, None)
+        if header is None: return
+        for row_number, row in enumerate(rows, 2):
+            if any(value.strip() for value in row):
+                yield row_number, dict(zip(header, row + [''] * (len(header) - len(row))))
+    else:
+        with open(path, newline='', encoding='utf-8-sig') as f:
+            reader = csv.DictReader(f)
+            for row in reader:
+                if any((value or '').strip() for value in row.values()):
+                    yield reader.line_num, row
+
+
+def file_fingerprint(path):
+    """Returns the SHA-256 of a file's contents, so a journal can tell that its input file was edited."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+# --- Mapping rows to documents ---
+
+def build_field_map(template_details):
+    """
+    Maps lower-cased field names (as written by template_generator) to their custom field definitions
+    (id, field_type and, for pickers and object sets, options and allowed_otypes).
+    """
+    return {field['name_singular'].strip().casefold(): field
+            for field in template_details.get('fields') or [] if field.get('id') and field.get('name_singular')}
+
+
+def _split_values(text):
+    return [value.strip() for value in text.split(MULTI_VALUE_SEPARATOR) if value.strip()]
+
+
+def _iso_date(text):
+    """Parses an ISO 8601 date or date-time, including a bare year ('2024') or year-month, or returns None."""
+    try:
+        return datetime.fromisoformat(text.replace('Z', '+00:00'))
+    except ValueError:
+        pass
+    for date_format in ('%Y', '%Y-%m'):
+        try:
+            return datetime.strptime(text, date_format)
+        except ValueError:
+            pass
+    return None
+
+
+def _date_value(text, numeric=False):
+    """
+    Parses a date cell into an ISO 8601 UTC timestamp. Text is read as an ISO 8601 date first; a numeric XLSX
+    cell, or text that is not a date but a number, is read as an XLSX date serial number.
+    """
+    parsed = None if numeric else _iso_date(text)
+    if parsed is None:
+        try:
+            parsed = XLSX_EPOCH + timedelta(days=float(text))
+        except (OverflowError, ValueError):
+            raise ValueError(f"'{text}' is not a date") from None
+    if parsed.tzinfo is None: parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+def _object_reference(text, field):
+    """
+    Parses 'otype:oid' (e.g. 'user:12') into {'otype', 'oid'}. A bare ID is accepted when the field allows
+    a single object type.
+    """
+    otype, _, oid = text.rpartition(':')
+    if not otype:
+        allowed = field.get('allowed_otypes') or []
+        if len(allowed) != 1:
+            raise ValueError(f"'{text}' needs an object type, e.g. user:{text}")
+        otype = allowed[0]
+    return {'otype': otype.strip(), 'oid': int(oid)}
+
+
+def field_value(field, text, numeric=False):
+    """
+    Converts a cell to the value shape the document API expects for the field's type: a list for
+    multi-pickers, an ISO 8601 timestamp for dates, [{'otype', 'oid'}] for object sets and the text otherwise.
+    numeric marks a numeric XLSX cell, which a date field reads as a serial number.
+    Raises ValueError if the cell does not fit the field.
+    """
+    field_type = (field.get('field_type') or '').upper()
+    if field_type in ('PICKER', 'MULTI_PICKER'):
+        values = _split_values(text) if field_type == 'MULTI_PICKER' else [text]
+        options = field.get('options')
+        invalid = [value for value in values if options and value not in options]
+        if invalid: raise ValueError(f"{', '.join(invalid)} not among the options of {field['name_singular']}")
+        return values if field_type == 'MULTI_PICKER' else text
+    if field_type == 'DATE':
+        return _date_value(text, numeric)
+    if field_type == 'OBJECT_SET':
+        return [_object_reference(value, field) for value in _split_values(text)]
+    return text
+
+
+def row_to_document(row, field_map, template_id, folder_id, hub_id):
+    """
+    Converts one template row to a v2 document payload. Rows with an 'id' column are updates.
+    Empty cells are left out so they do not blank existing values. Raises ValueError for a cell that does not
+    fit its column (a non-numeric id, an unknown picker option, an unparseable date).
+    """
+    document = {'template_id': template_id, 'document_hub_id': hub_id, 'folder_ids': [folder_id],
+                'custom_fields': []}
+    for column, value in row.items():
+        if column is None or value is None: continue
+        numeric = isinstance(value, XlsxNumber)
+        key, value = column.strip().casefold(), value.strip()
+        if not value: continue
+        try:
+            if key == ID_COLUMN:
+                document['id'] = int(float(value))  # XLSX stores numbers as e.g. '42.0'
+            elif key == TITLE_COLUMN:
+                document['title'] = value
+            elif key in field_map:
+                field = field_map[key]
+                document['custom_fields'].append({'field_id': field['id'], 'value': field_value(field, value, numeric)})
+        except ValueError as e:
+            raise ValueError(f"column '{column.strip()}': {e}") from None
+    return document
+
+
+def _iter_batches(documents, batch_size):
+    """
+    Groups documents into batches of creates and batches of updates, keyed e.g. 'create-0', 'update-3'.
+    Keys depend only on the input order, so they are stable across resumes.
+    """
+    buffers, counters = {'create': [], 'update': []}, {'create': 0, 'update': 0}
+    for document in documents:
+        kind = 'update' if 'id' in document else 'create'
+        buffers[kind].append(document)
+        if len(buffers[kind]) == batch_size:
+            yield f"{kind}-{counters[kind]}", buffers[kind]
+            buffers[kind], counters[kind] = [], counters[kind] + 1
+    for kind, batch in buffers.items():
+        if batch:
+            yield f"{kind}-{counters[kind]}", batch
+
+
+# --- Checkpoint journal ---
+
+class UploadJournal:
+    """
+    Append-only JSON-lines log of batch outcomes. The first line describes the run (input file and its SHA-256,
+    template and a hash of its fields, folder, batch size) so a resume can refuse a journal that belongs to another
+    upload, to an earlier version of the file or to an earlier version of the template. A batch the server accepted as an async job is 'pending' until the job
+    finishes, then 'committed' or 'failed'.
+    """
+
+    def __init__(self, path, run_info):
+        self.path = path
+        self.committed = set()
+        self.pending = {}  # batch key -> job ID
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                lines = [json.loads(line) for line in f if line.strip()]
+            recorded = (lines[0].get('run') or {}) if lines else run_info
+            if recorded != run_info:
+                if _without_fingerprints(recorded) == _without_fingerprints(run_info):
+                    changed = (f"{run_info.get('file')} has" if recorded.get('sha256') != run_info.get('sha256')
+                               else f"The fields of template {run_info.get('template_id')} have")
+                    raise UploadError(f"{changed} changed since journal {path} was written, so its committed "
+                                      f"batches no longer match. Delete the journal to start over.")
+                raise UploadError(f"Journal {path} belongs to a different upload. Delete it to start over.")
+            for entry in lines[1:]:
+                key, status = entry.get('batch'), entry.get('status')
+                if status == 'committed':
+                    self.committed.add(key)
+                if status == 'pending':
+                    self.pending[key] = entry.get('job_id')
+                else:
+                    self.pending.pop(key, None)
+            self._file = open(path, 'a', encoding='utf-8')
+            if not lines: self._write({'run': run_info})
+        else:
+            self._file = open(path, 'w', encoding='utf-8')
+            self._write({'run': run_info})
+
+    def _write(self, entry):
+        with self._lock:
+            self._file.write(json.dumps(entry) + "\n")
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def record(self, batch_key, status, **details):
+        """Appends a batch outcome; safe to call from the upload threads."""
+        self._write(dict({'batch': batch_key, 'status': status, 'at': time.time()}, **details))
+        if status == 'committed': self.committed.add(batch_key)
+
+    def close(self):
+        self._file.close()
+
+
+def _without_fingerprints(run_info):
+    return {key: value for key, value in run_info.items() if key not in ('sha256', 'fields')}
+
+
+def field_map_fingerprint(field_map):
+    """Returns the SHA-256 of the fields rows are mapped to (names, ids, types, options), for the journal."""
+    fields = [[name, field.get('id'), field.get('field_type'), field.get('options'), field.get('allowed_otypes')]
+              for name, field in sorted(field_map.items())]
+    return hashlib.sha256(json.dumps(fields, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+# --- Upload ---
+
+def _send_batch(alation_url, documents, update, rate_limiter):
+    """
+    Sends one batch, waiting out 429s. 5xx responses are not retried because the write may have been applied;
+    the batch stays uncommitted in the journal so a later resume can retry it deliberately.
+    """
+    for attempt in range(MAX_THROTTLE_RETRIES + 1):
+        rate_limiter.acquire()
+        response = alation_api.send_documents(alation_url, documents, update=update)
+        if response.status_code != 429 or attempt == MAX_THROTTLE_RETRIES:
+            return response
+        time.sleep(float(response.headers.get('Retry-After') or 2 ** attempt))
+
+
+def _job_id(response):
+    """Returns the async job ID the document API answers with, if any."""
+    try:
+        payload = response.json()
+    except ValueError:
+        return None
+    return payload.get('job_id') if isinstance(payload, dict) else None
+
+
+def _wait_for_job(alation_url, job_id, should_stop=None):
+    """
+    Polls an upload job until it finishes. Returns ('committed' | 'failed', job dict), or ('pending', None)
+    if it is still running after JOB_TIMEOUT or the upload is stopped; a resume polls it again.
+    """
+    deadline = time.monotonic() + JOB_TIMEOUT
+    while True:
+        job = alation_api.get_job_status(alation_url, job_id)
+        status = (job or {}).get('status')
+        if status == JOB_SUCCEEDED:
+            return 'committed', job
+        if status == JOB_FAILED:
+            return 'failed', job
+        if time.monotonic() >= deadline or (should_stop and should_stop()):
+            return 'pending', None
+        time.sleep(JOB_POLL_INTERVAL)
+
+
+def upload_documents(alation_url, path, template_details, template_id, folder_id, hub_id,
+                     batch_size=DEFAULT_BATCH_SIZE, concurrency=DEFAULT_CONCURRENCY, rate_limit=DEFAULT_RATE_LIMIT,
+                     journal_path=None, field_map=None, on_progress=None, should_stop=None):
+    """
+    Streams a filled-in template into the chosen folder, creating rows without an id and updating rows with one.
+    Work is split into fixed-size batches of creates and of updates. A batch counts as committed once the server
+    has applied it: on a 200/201, or on a 202 once its job has succeeded. Every outcome is written to the journal,
+    and a resume skips committed batches and re-polls pending jobs, so an interrupted load resumes where it stopped.
+    Rows that cannot be converted are left out and listed in the summary's 'invalid_rows' as (row, error).
+    field_map, if given, is build_field_map(template_details) already computed by the caller.
+    Returns a summary dict with batch and document counts.
+    """
+    field_map = field_map if field_map is not None else build_field_map(template_details)
+    journal_path = journal_path or path + JOURNAL_SUFFIX
+    run_info = {'file': os.path.abspath(path), 'sha256': file_fingerprint(path), 'template_id': template_id,
+                'fields': field_map_fingerprint(field_map), 'folder_id': folder_id, 'hub_id': hub_id,
+                'batch_size': batch_size}
+    journal = UploadJournal(journal_path, run_info)
+    rate_limiter = RateLimiter(rate_limit)
+    summary = {'batches': 0, 'skipped': 0, 'committed': 0, 'failed': [], 'pending': [], 'documents': 0,
+               'invalid_rows': []}
+
+    def documents():
+        for row_number, row in iter_numbered_rows(path):
+            try:
+                yield row_to_document(row, field_map, template_id, folder_id, hub_id)
+            except ValueError as e:
+                summary['invalid_rows'].append((row_number, str(e)))
+                logger.error(f"Row {row_number} of {os.path.basename(path)} left out: {e}")
+
+    def batches():
+        for key, batch in _iter_batches(documents(), batch_size):
+            summary['batches'] += 1
+            if key in journal.committed:
+                summary['skipped'] += 1
+                continue
+            if should_stop and should_stop(): return
+            yield key, batch
+
+    def send(item):
+        """Returns (outcome, journal details) for one batch, polling its job if the server answers 202."""
+        key, batch = item
+        job_id = journal.pending.get(key)
+        if job_id is not None:
+            outcome, job = _wait_for_job(alation_url, job_id, should_stop)
+            if outcome != 'failed': return outcome, {'job_id': job_id}
+            logger.warning(f"Job {job_id} of batch {key} failed ({job.get('msg')}); sending the batch again.")
+        response = _send_batch(alation_url, batch, key.startswith('update'), rate_limiter)
+        if response.status_code not in (200, 201, 202):
+            return 'failed', {'http_status': response.status_code, 'response': response.text[:500]}
+        job_id = _job_id(response)
+        if response.status_code != 202 or job_id is None:
+            return 'committed', {'job_id': job_id}
+        journal.record(key, 'pending', job_id=job_id)
+        outcome, job = _wait_for_job(alation_url, job_id, should_stop)
+        details = {'job_id': job_id}
+        if outcome == 'failed': details.update(job_status=job.get('status'), response=str(job.get('msg'))[:500])
+        return outcome, details
+
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            for (key, batch), future in jobs.completed_in_window(executor, send, batches(), concurrency * 2):
+                try:
+                    outcome, details = future.result()
+                except Exception as e:
+                    outcome, details = 'failed', {'error': str(e)}
+                if outcome == 'committed':
+                    journal.record(key, 'committed', documents=len(batch), **details)
+                    summary['committed'] += 1
+                    summary['documents'] += len(batch)
+                elif outcome == 'pending':
+                    summary['pending'].append(key)
+                    logger.warning(f"Batch {key} is still being processed by job {details['job_id']}; "
+                                   f"upload the same file again to check on it.")
+                else:
+                    journal.record(key, 'failed', **details)
+                    summary['failed'].append(key)
+                    logger.error(f"Batch {key} failed: {details.get('error') or details}")
+                if on_progress: on_progress(summary)
+    finally:
+        journal.close()
+    return summary
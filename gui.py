@@ -1,8 +1,16 @@
 # gui.py
 import tkinter as tk
-from tkinter import scrolledtext, Toplevel, Frame, Button, Label, Entry, messagebox
-from tkinter.ttk import Combobox, Treeview
+from tkinter import scrolledtext, Toplevel, Frame, Button, Label, Entry, messagebox, filedialog
+from tkinter.ttk import Combobox, Treeview, Progressbar
+import app_logging
 import app_logic
+import instrumentation
+import jobs
+import services
+
+LOG_POLL_INTERVAL_MS = 100
+LOG_MAX_LINES = 5000  # Older lines are dropped from the top of the log pane.
+METRICS_REFRESH_MS = 2000
 
 
 class MainWindow(Frame):
@@ -21,9 +29,17 @@ class MainWindow(Frame):
         self.parent.config(menu=self.menu_bar)
         self.file_menu = tk.Menu(self.menu_bar, tearoff=0)
         self.file_menu.add_command(label="Settings", command=self.open_settings_window)
+        self.file_menu.add_command(label="Full Re-fetch", command=lambda: app_logic.refetch_cache(self, full=True))
+        self.profile_menu = tk.Menu(self.file_menu, tearoff=0, postcommand=self._fill_profile_menu)
+        self.profile_var = tk.StringVar(self.parent)
+        self.file_menu.add_cascade(label="Profile", menu=self.profile_menu)
+        self.file_menu.add_command(label="Refresh All Profiles", command=lambda: app_logic.refresh_all_profiles(self))
         self.file_menu.add_separator()
         self.file_menu.add_command(label="Exit", command=self.parent.quit)
         self.menu_bar.add_cascade(label="File", menu=self.file_menu)
+        self.view_menu = tk.Menu(self.menu_bar, tearoff=0)
+        self.view_menu.add_command(label="API Metrics", command=self.open_metrics_window)
+        self.menu_bar.add_cascade(label="View", menu=self.view_menu)
 
         # --- Main Frames ---
         top_frame = Frame(self.parent, borderwidth=2, relief="groove")
@@ -41,33 +57,107 @@ class MainWindow(Frame):
         self.btn_refetch_cache.pack(side="left", padx=5, pady=5)
         self.btn_refetch_cache.config(state="disabled")
 
+        # --- In-flight indicator for background jobs ---
+        self.busy_label = Label(top_frame, text="")
+        self.busy_label.pack(side="right", padx=5, pady=5)
+        self.busy_bar = Progressbar(top_frame, mode="indeterminate", length=120)
+        self.busy_bar.pack(side="right", padx=5, pady=5)
+        self._busy = False
+        self.jobs = jobs.JobScheduler(self.parent, on_busy_changed=self.set_busy)
+
         # --- Selection Frame Widgets ---
         Label(selection_frame, text="Document Hub ID:").grid(row=0, column=0, padx=5, pady=5, sticky="w")
         self.hub_combobox = Combobox(selection_frame, state="readonly")
         self.hub_combobox.grid(row=0, column=1, padx=5, pady=5, sticky="ew")
         self.hub_combobox.bind("<<ComboboxSelected>>", lambda event: app_logic.on_hub_selected(self, event))
 
-        Label(selection_frame, text="Folder:").grid(row=1, column=0, padx=5, pady=5, sticky="nw")
+        Label(selection_frame, text="Find Folder:").grid(row=1, column=0, padx=5, pady=5, sticky="w")
+        search_frame = Frame(selection_frame)
+        search_frame.grid(row=1, column=1, padx=5, pady=5, sticky="ew")
+        self.folder_search_entry = Entry(search_frame)
+        self.folder_search_entry.pack(side="left", fill="x", expand=True)
+        self.folder_search_entry.bind("<Return>", lambda event: app_logic.find_folder(self))
+        Button(search_frame, text="Find", command=lambda: app_logic.find_folder(self)).pack(side="left", padx=(5, 0))
+
+        Label(selection_frame, text="Folder:").grid(row=2, column=0, padx=5, pady=5, sticky="nw")
         self.folder_tree = Treeview(selection_frame, selectmode="browse", height=5)
-        self.folder_tree.grid(row=1, column=1, padx=5, pady=5, sticky="ew")
+        self.folder_tree.grid(row=2, column=1, padx=5, pady=5, sticky="ew")
         self.folder_tree.bind("<<TreeviewSelect>>", lambda event: app_logic.on_folder_selected(self, event))
+        self.folder_tree.bind("<<TreeviewOpen>>", lambda event: app_logic.on_folder_opened(self, event))
 
-        Label(selection_frame, text="Template:").grid(row=2, column=0, padx=5, pady=5, sticky="w")
+        Label(selection_frame, text="Template:").grid(row=3, column=0, padx=5, pady=5, sticky="w")
         self.template_combobox = Combobox(selection_frame, state="disabled")
-        self.template_combobox.grid(row=2, column=1, padx=5, pady=5, sticky="ew")
+        self.template_combobox.grid(row=3, column=1, padx=5, pady=5, sticky="ew")
         # --- NEW: Bind event to template selection ---
         self.template_combobox.bind("<<ComboboxSelected>>", lambda event: app_logic.on_template_selected(self, event))
 
         # --- NEW: Link command to the generate button ---
-        self.btn_generate = Button(selection_frame, text="Generate Template", state="disabled",
+        export_frame = Frame(selection_frame)
+        export_frame.grid(row=4, column=1, padx=5, pady=10, sticky="e")
+        self.btn_export_hub = Button(export_frame, text="Export Hub Templates", state="disabled",
+                                     command=lambda: app_logic.export_hub_templates(self))
+        self.btn_export_hub.pack(side="left", padx=(0, 5))
+        self.btn_export_folder = Button(export_frame, text="Export Folder Templates", state="disabled",
+                                        command=lambda: app_logic.export_folder_templates(self))
+        self.btn_export_folder.pack(side="left", padx=(0, 5))
+        self.btn_generate = Button(export_frame, text="Generate Template", state="disabled",
                                    command=lambda: app_logic.generate_template(self))
-        self.btn_generate.grid(row=3, column=1, padx=5, pady=10, sticky="e")
+        self.btn_generate.pack(side="left")
+        self.btn_upload = Button(export_frame, text="Upload Documents...", state="disabled",
+                                 command=lambda: app_logic.upload_documents(self))
+        self.btn_upload.pack(side="left", padx=(5, 0))
 
         # --- Log Frame Widgets ---
         log_label = Label(log_frame, text="Activity Log:")
         log_label.pack(side="top", anchor="w", padx=5)
         self.log_text = scrolledtext.ScrolledText(log_frame, wrap=tk.WORD, state='disabled')
         self.log_text.pack(fill="both", expand=True, padx=5, pady=5)
+        self.log_queue = None
+
+    def _fill_profile_menu(self):
+        """Lists the profiles of config.json each time the menu opens, so edits show up without a restart."""
+        self.profile_menu.delete(0, 'end')
+        self.profile_var.set(services.active_profile or '')
+        for name in services.profile_names(services.load_settings() or {}):
+            self.profile_menu.add_radiobutton(label=name, value=name, variable=self.profile_var,
+                                              command=lambda name=name: app_logic.switch_profile(self, name))
+
+    def attach_log_queue(self, log_queue):
+        """
+        Shows records from log_queue in the log pane. Records are drained in batches from root.after,
+        so worker threads never touch the widget and a burst of log lines costs one insert per tick.
+        """
+        self.log_queue = log_queue
+        self.parent.after(LOG_POLL_INTERVAL_MS, self._drain_log)
+
+    def _drain_log(self):
+        lines = app_logging.drain(self.log_queue)
+        if lines:
+            at_bottom = self.log_text.yview()[1] >= 0.999
+            self.log_text.config(state='normal')
+            self.log_text.insert('end', "\n".join(lines) + "\n")
+            line_count = int(self.log_text.index('end-1c').split('.')[0])
+            if line_count > LOG_MAX_LINES:
+                self.log_text.delete('1.0', f"{line_count - LOG_MAX_LINES + 1}.0")
+            self.log_text.config(state='disabled')
+            if at_bottom: self.log_text.see('end')
+        self.parent.after(LOG_POLL_INTERVAL_MS, self._drain_log)
+
+    def set_busy(self, in_flight):
+        if in_flight:
+            self.busy_label.config(text=f"Working... ({in_flight} in flight)")
+            if not self._busy: self.busy_bar.start(10)
+        else:
+            self.busy_label.config(text="")
+            self.busy_bar.stop()
+        self._busy = bool(in_flight)
+
+    def ask_output_directory(self):
+        return filedialog.askdirectory(parent=self.parent, title="Choose a folder for the upload templates")
+
+    def ask_upload_file(self):
+        return filedialog.askopenfilename(parent=self.parent, title="Choose a filled-in upload template",
+                                          filetypes=[("Upload templates", "*.csv *.xlsx"), ("All files", "*.*")])
 
     def open_settings_window(self):
         # This method remains unchanged
@@ -78,6 +168,64 @@ class MainWindow(Frame):
             self.settings_frame = SettingsWindow(self.settings_window)
             self.settings_frame.pack(fill="both", expand=True)
 
+    def open_metrics_window(self):
+        if hasattr(self, 'metrics_window') and self.metrics_window.winfo_exists():
+            self.metrics_window.lift()
+        else:
+            self.metrics_window = Toplevel(self.parent)
+            MetricsWindow(self.metrics_window).pack(fill="both", expand=True)
+
+
+class MetricsWindow(Frame):
+    """
+    Live per-endpoint view of instrumentation.registry: calls, errors, latency percentiles, bytes and retries.
+    """
+    COLUMNS = (("calls", "Calls", 60), ("errors", "Errors", 60), ("p50", "p50 ms", 70), ("p90", "p90 ms", 70),
+               ("p99", "p99 ms", 70), ("max", "Max ms", 70), ("kb", "KB", 80), ("retries", "Retries", 60))
+
+    def __init__(self, parent, *args, **kwargs):
+        Frame.__init__(self, parent, *args, **kwargs)
+        self.parent = parent
+        self.parent.title("API Metrics")
+        self.parent.geometry("900x300")
+        self.table = Treeview(self, columns=[key for key, _, _ in self.COLUMNS])
+        self.table.heading("#0", text="Endpoint")
+        self.table.column("#0", width=300)
+        for key, title, width in self.COLUMNS:
+            self.table.heading(key, text=title)
+            self.table.column(key, width=width, anchor="e")
+        self.table.pack(side="top", fill="both", expand=True, padx=5, pady=5)
+        button_frame = Frame(self)
+        button_frame.pack(side="top", pady=5)
+        Button(button_frame, text="Reset", command=self.reset).pack(side="left", padx=5)
+        Button(button_frame, text="Save JSON...", command=lambda: self.save("json")).pack(side="left", padx=5)
+        Button(button_frame, text="Save Prometheus...",
+               command=lambda: self.save("prometheus")).pack(side="left", padx=5)
+        self.refresh()
+
+    def refresh(self):
+        if not self.winfo_exists(): return
+        self.table.delete(*self.table.get_children())
+        for (method, endpoint), stats in instrumentation.registry.snapshot():
+            milliseconds = lambda seconds: f"{seconds * 1000:.1f}" if seconds is not None else ""
+            self.table.insert('', 'end', text=f"{method} {endpoint}", values=(
+                stats['calls'], stats['errors'], milliseconds(stats['p50_s']), milliseconds(stats['p90_s']),
+                milliseconds(stats['p99_s']), milliseconds(stats['duration_max_s']), f"{stats['bytes'] / 1024:.1f}",
+                stats['retries']))
+        self.after(METRICS_REFRESH_MS, self.refresh)
+
+    def reset(self):
+        instrumentation.registry.reset()
+        self.table.delete(*self.table.get_children())
+
+    def save(self, metrics_format):
+        extension = ".json" if metrics_format == "json" else ".prom"
+        path = filedialog.asksaveasfilename(parent=self.parent, defaultextension=extension,
+                                            initialfile=f"apt2_metrics{extension}")
+        if not path: return
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(instrumentation.dump(metrics_format))
+
 
 class SettingsWindow(Frame):
     # This class remains unchanged
@@ -102,15 +250,16 @@ class SettingsWindow(Frame):
         self.load_existing_settings()
 
     def load_existing_settings(self):
-        settings = app_logic.load_settings()
+        settings = services.load_settings()
         if settings:
+            settings = services.profile_settings(settings, services.active_profile)
             self.url_entry.insert(0, settings.get("alation_url", ""));
             self.token_entry.insert(0, settings.get("refresh_token", ""));
             self.user_id_entry.insert(0, settings.get("user_id", ""))
 
     def save_and_close(self):
         url, token, user_id = self.url_entry.get(), self.token_entry.get(), self.user_id_entry.get()
-        if app_logic.save_settings(url, token, user_id):
+        if services.save_settings(url, token, user_id):
             messagebox.showinfo("Success", "Settings saved successfully.");
             self.parent.destroy()
         else:
@@ -0,0 +1,244 @@
+# instrumentation.py
+"""
+Per-request metrics for the Alation API client and an opt-in cProfile hook for the Tk handlers.
+alation_api records every call here; the GUI metrics panel and `python -m apt2 --metrics ...` read the registry.
+"""
+import cProfile
+import functools
+import json
+import os
+import pstats
+import re
+import threading
+from urllib.parse import urlparse
+
+import app_logging
+
+logger = app_logging.get_logger("instrumentation")
+
+# Upper bounds (seconds) of the latency histogram buckets; the last bucket is +Inf.
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+NETWORK_ERROR = "error"  # Status recorded when no response arrived at all.
+METRIC_PREFIX = "apt2_api"
+
+_ID_SEGMENT = re.compile(r'/\d+(?=/|$)')
+
+
+def endpoint_of(url):
+    """Turns a request URL into a low-cardinality label: host and query dropped, numeric IDs replaced by {id}."""
+    return _ID_SEGMENT.sub('/{id}', urlparse(url).path) or '/'
+
+
+class EndpointStats:
+    """
+    Aggregates for one (method, endpoint): call and status counts, bytes, retries and a latency histogram.
+    """
+    __slots__ = ('calls', 'statuses', 'bytes', 'retries', 'duration_sum', 'duration_max', 'buckets')
+
+    def __init__(self):
+        self.calls = 0
+        self.statuses = {}
+        self.bytes = 0
+        self.retries = 0
+        self.duration_sum = 0.0
+        self.duration_max = 0.0
+        self.buckets = [0] * (len(DURATION_BUCKETS) + 1)
+
+    def add(self, status, duration, size, retries):
+        self.calls += 1
+        self.statuses[status] = self.statuses.get(status, 0) + 1
+        self.bytes += size
+        self.retries += retries
+        self.duration_sum += duration
+        self.duration_max = max(self.duration_max, duration)
+        for index, bound in enumerate(DURATION_BUCKETS):
+            if duration <= bound:
+                self.buckets[index] += 1
+                break
+        else:
+            self.buckets[-1] += 1
+
+    @property
+    def errors(self):
+        return sum(count for status, count in self.statuses.items()
+                   if status == NETWORK_ERROR or int(status) >= 400)
+
+    def quantile(self, q):
+        """Estimates a latency quantile (seconds) by interpolating inside the histogram bucket that holds it."""
+        if not self.calls: return None
+        rank, seen, lower = q * self.calls, 0, 0.0
+        for index, count in enumerate(self.buckets):
+            upper = DURATION_BUCKETS[index] if index < len(DURATION_BUCKETS) else self.duration_max
+            if count and seen + count >= rank:
+                return min(lower + (upper - lower) * (rank - seen) / count, self.duration_max)
+            seen += count
+            lower = upper
+        return self.duration_max
+
+    def as_dict(self):
+        return {'calls': self.calls, 'errors': self.errors, 'statuses': {str(k): v for k, v in self.statuses.items()},
+                'bytes': self.bytes, 'retries': self.retries, 'duration_sum_s': round(self.duration_sum, 6),
+                'duration_max_s': round(self.duration_max, 6),
+                'p50_s': _rounded(self.quantile(0.5)), 'p90_s': _rounded(self.quantile(0.9)),
+                'p99_s': _rounded(self.quantile(0.99)),
+                'buckets': {str(bound): count for bound, count in zip(DURATION_BUCKETS + ('+Inf',), self.buckets)}}
+
+
+def _rounded(value):
+    return round(value, 6) if value is not None else None
+
+
+class Registry:
+    """Thread-safe map of (method, endpoint) -> EndpointStats."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def record(self, method, url, status, duration, size=0, retries=0):
+        key = (method.upper(), endpoint_of(url))
+        with self._lock:
+            stats = self._stats.get(key)
+            if stats is None:
+                stats = self._stats[key] = EndpointStats()
+            stats.add(status, duration, size, retries)
+        logger.debug(f"{key[0]} {key[1]} -> {status} in {duration * 1000:.1f} ms, {size} bytes, {retries} retries")
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+    def snapshot(self):
+        """Returns [((method, endpoint), stats dict), ...] sorted by total time spent, most first."""
+        with self._lock:
+            items = [(key, stats.as_dict()) for key, stats in self._stats.items()]
+        return sorted(items, key=lambda item: -item[1]['duration_sum_s'])
+
+    def to_json(self):
+        return {'endpoints': [dict(stats, method=method, endpoint=endpoint)
+                              for (method, endpoint), stats in self.snapshot()]}
+
+    def to_prometheus(self):
+        """Renders the registry in the Prometheus text exposition format."""
+        lines = [f"# HELP {METRIC_PREFIX}_request_duration_seconds Alation API request latency.",
+                 f"# TYPE {METRIC_PREFIX}_request_duration_seconds histogram"]
+        snapshot = self.snapshot()
+        for (method, endpoint), stats in snapshot:
+            labels = f'method="{method}",endpoint="{endpoint}"'
+            cumulative = 0
+            for bound, count in stats['buckets'].items():
+                cumulative += count
+                lines.append(f'{METRIC_PREFIX}_request_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f"{METRIC_PREFIX}_request_duration_seconds_sum{{{labels}}} {stats['duration_sum_s']}")
+            lines.append(f"{METRIC_PREFIX}_request_duration_seconds_count{{{labels}}} {stats['calls']}")
+        for name, help_text, field in (("requests_total", "Alation API responses by status.", None),
+                                       ("response_bytes_total", "Alation API response body bytes.", 'bytes'),
+                                       ("retries_total", "Alation API retries (transport and 401 refresh).",
+                                        'retries')):
+            lines += [f"# HELP {METRIC_PREFIX}_{name} {help_text}", f"# TYPE {METRIC_PREFIX}_{name} counter"]
+            for (method, endpoint), stats in snapshot:
+                labels = f'method="{method}",endpoint="{endpoint}"'
+                if field is None:
+                    lines += [f'{METRIC_PREFIX}_{name}{{{labels},status="{status}"}} {count}'
+                              for status, count in sorted(stats['statuses'].items())]
+                else:
+                    lines.append(f"{METRIC_PREFIX}_{name}{{{labels}}} {stats[field]}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+
+def record_response(method, url, response, duration, extra_retries=0):
+    """Records a completed requests.Response, including urllib3 transport retries."""
+    retry_state = getattr(getattr(response, 'raw', None), 'retries', None)
+    retries = len(getattr(retry_state, 'history', None) or ()) + extra_retries
+    content = getattr(response, 'content', None)
+    registry.record(method, url, response.status_code, duration, len(content) if content else 0, retries)
+
+
+def record_failure(method, url, duration, extra_retries=0):
+    registry.record(method, url, NETWORK_ERROR, duration, 0, extra_retries)
+
+
+def dump(metrics_format):
+    """Returns the registry as JSON or Prometheus text."""
+    if metrics_format == "prometheus":
+        return registry.to_prometheus()
+    return json.dumps(registry.to_json(), indent=2) + "\n"
+
+
+# --- Opt-in profiling of Tk handlers ---
+
+_profile_dir = None
+_profile_stats = {}
+_profile_lock = threading.Lock()
+_profiling = threading.local()  # .profile: the profiler running on this thread, if any
+_UNSAFE_PROFILE_CHARS = re.compile(r'[^\w.-]+')
+
+
+def enable_profiling(output_dir, what="UI handlers"):
+    """
+    Turns on the cProfile hook: every call to a @profiled handler is profiled and the stats accumulated per
+    handler in output_dir/<module>.<handler>.prof (open with pstats or snakeviz). Pass None to turn it off.
+    what names the profiled code in the log line.
+    """
+    global _profile_dir
+    if output_dir: os.makedirs(output_dir, exist_ok=True)
+    _profile_dir = output_dir
+    if output_dir: logger.info(f"Profiling {what} into {output_dir}")
+
+
+def profile_name(handler):
+    """
+    Returns a file-name-safe label for a handler: module and qualified name, plus the line for lambdas,
+    e.g. app_logic.on_hub_selected or app_logic._lambda_.L120.
+    """
+    target = getattr(handler, 'func', handler)  # functools.partial
+    module = getattr(target, '__module__', None) or 'unknown'
+    name = f"{module}.{getattr(target, '__qualname__', None) or type(target).__name__}"
+    code = getattr(target, '__code__', None)
+    if '<lambda>' in name and code is not None: name += f".L{code.co_firstlineno}"
+    return _UNSAFE_PROFILE_CHARS.sub('_', name)
+
+
+def profiled(handler, name=None):
+    """
+    Decorator for Tk handlers and jobs; free unless enable_profiling() was called. A call made while this
+    thread is already profiling (one handler calling another) is counted in the outer handler's profile.
+    name overrides the stats file name, which is profile_name(handler) by default.
+    """
+
+    @functools.wraps(handler)
+    def wrapper(*args, **kwargs):
+        if not _profile_dir or getattr(_profiling, 'profile', None) is not None:
+            return handler(*args, **kwargs)
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Python 3.12+ allows one active profiler per process; another thread holds it.
+            return handler(*args, **kwargs)
+        _profiling.profile = profile
+        try:
+            return handler(*args, **kwargs)
+        finally:
+            profile.disable()
+            _profiling.profile = None
+            _save_profile(name or profile_name(handler), profile)
+
+    return wrapper
+
+
+def _save_profile(name, profile):
+    """Adds a finished profile to the handler's accumulated stats file; never raises into the handler."""
+    try:
+        with _profile_lock:
+            stats = _profile_stats.get(name)
+            if stats is None:
+                stats = _profile_stats[name] = pstats.Stats(profile)
+            else:
+                stats.add(profile)
+            stats.dump_stats(os.path.join(_profile_dir, f"{name}.prof"))
+    except Exception as e:
+        logger.warning(f"Could not save profile for {name}: {e}")
@@ -0,0 +1,144 @@
+# jobs.py
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+import app_logging
+import instrumentation
+
+logger = app_logging.get_logger("jobs")
+
+DEFAULT_WORKERS = 4
+POLL_INTERVAL_MS = 50
+
+
+class Job:
+    """
+    Handle for one unit of background work. Work functions receive their Job as the first
+    argument so they can stop early once cancelled and post intermediate results to the Tk thread.
+    """
+
+    def __init__(self, scheduler, key=None):
+        self.key = key
+        self._scheduler = scheduler
+        self._cancelled = threading.Event()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def cancel(self):
+        self._cancelled.set()
+
+    def post(self, callback, *args):
+        """
+        Queues callback(*args) to run on the Tk thread; dropped if the job is cancelled first.
+        """
+        self._scheduler._results.put((self, False, callback, args))
+
+
+class JobScheduler:
+    """
+    Runs blocking work on a thread pool and delivers results on the Tk thread.
+    Results are handed over through a queue that is drained from root.after, so callbacks may touch widgets.
+    Submitting a job with the key of a job still in flight cancels the older one and discards its results.
+    """
+
+    def __init__(self, root, max_workers=DEFAULT_WORKERS, on_busy_changed=None, poll_interval_ms=POLL_INTERVAL_MS):
+        self.root = root
+        self.on_busy_changed = on_busy_changed
+        self.poll_interval_ms = poll_interval_ms
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="apt2-job")
+        self._results = queue.Queue()
+        self._jobs_by_key = {}
+        self._in_flight = 0
+        self._closed = False
+        self.root.after(self.poll_interval_ms, self._drain)
+
+    @property
+    def in_flight(self):
+        return self._in_flight
+
+    def submit(self, fn, *args, key=None, on_success=None, on_error=None):
+        """
+        Runs fn(job, *args) on a worker. on_success(result) or on_error(exception) is called on the Tk thread
+        unless the job was cancelled. Must be called from the Tk thread.
+        """
+        if key is not None:
+            self.cancel(key)
+        job = Job(self, key)
+        if key is not None:
+            self._jobs_by_key[key] = job
+        self._set_in_flight(self._in_flight + 1)
+        self._executor.submit(self._run, job, fn, args, on_success, on_error)
+        return job
+
+    def cancel(self, key):
+        job = self._jobs_by_key.pop(key, None)
+        if job is not None:
+            job.cancel()
+
+    def shutdown(self):
+        self._closed = True
+        for job in list(self._jobs_by_key.values()):
+            job.cancel()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _run(self, job, fn, args, on_success, on_error):
+        if job.cancelled:
+            self._results.put((job, True, None, ()))
+            return
+        try:
+            result = instrumentation.profiled(fn)(job, *args)
+        except Exception as e:
+            self._results.put((job, True, on_error or _report_error, (e,)))
+        else:
+            self._results.put((job, True, on_success, (result,)))
+
+    def _drain(self):
+        if self._closed:
+            return
+        try:
+            while True:
+                job, finished, callback, args = self._results.get_nowait()
+                if finished:
+                    self._set_in_flight(self._in_flight - 1)
+                    if self._jobs_by_key.get(job.key) is job:
+                        del self._jobs_by_key[job.key]
+                if callback is not None and not job.cancelled:
+                    try:
+                        callback(*args)
+                    except Exception as e:
+                        _report_error(e)
+        except queue.Empty:
+            pass
+        self.root.after(self.poll_interval_ms, self._drain)
+
+    def _set_in_flight(self, count):
+        self._in_flight = count
+        if self.on_busy_changed:
+            self.on_busy_changed(count)
+
+
+def completed_in_window(executor, fn, items, window):
+    """
+    Yields (item, future) as calls complete, keeping at most `window` calls in flight so
+    finished-but-unconsumed results cannot pile up in memory.
+    """
+    items = iter(items)
+    pending = {}
+    for item in items:
+        pending[executor.submit(fn, item)] = item
+        if len(pending) >= window:
+            break
+    while pending:
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            yield pending.pop(future), future
+            for item in items:
+                pending[executor.submit(fn, item)] = item
+                break
+
+
+def _report_error(error):
+    logger.error(f"Background job failed: {error}")
@@ -1,26 +1,12 @@
 # main.py
+import os
 import tkinter as tk
 import gui
+import app_logging
 import app_logic
-import sys
-from tkinter import scrolledtext
+import instrumentation
 
-
-class TextRedirector:
-    """A class to redirect stdout to a tkinter Text widget."""
-
-    def __init__(self, widget, tag="stdout"):
-        self.widget = widget
-        self.tag = tag
-
-    def write(self, str):
-        self.widget.config(state='normal')
-        self.widget.insert('end', str, (self.tag,))
-        self.widget.see('end')  # Scroll to the end
-        self.widget.config(state='disabled')
-
-    def flush(self):
-        pass  # Required for file-like object
+PROFILE_DIR_ENV = "APT2_PROFILE_DIR"  # Set to a directory to cProfile every UI handler and background job.
 
 
 def main():
@@ -30,7 +16,9 @@ def main():
     main_window.pack(side="top", fill="both", expand=True)
 
     # --- Setup Logging to UI ---
-    sys.stdout = TextRedirector(main_window.log_text, "stdout")
+    app_logging.configure()
+    main_window.attach_log_queue(app_logging.attach_queue())
+    instrumentation.enable_profiling(os.environ.get(PROFILE_DIR_ENV))
 
     # --- Run App Initialization Logic ---
     # MODIFIED: Pass the main_window object to the function
@@ -38,6 +26,7 @@ def main():
 
     # --- Start the GUI Main Loop ---
     root.mainloop()
+    main_window.jobs.shutdown()
 
 
 if __name__ == "__main__":
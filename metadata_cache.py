@@ -0,0 +1,172 @@
+# metadata_cache.py
+import json
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+
+FOLDERS_TTL = 15 * 60
+DOCUMENTS_TTL = 15 * 60
+TEMPLATE_TTL = 24 * 60 * 60
+
+KIND_DOCUMENTS = "documents"
+KIND_TEMPLATE_TITLE = "template_title"
+KIND_TEMPLATE_DETAILS = "template_details"
+
+CacheEntry = namedtuple("CacheEntry", ["payload", "etag", "last_modified", "fetched_at"])
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS folders (
+    id INTEGER PRIMARY KEY,
+    title TEXT,
+    document_hub_id INTEGER,
+    parent_folder_id INTEGER
+);
+CREATE TABLE IF NOT EXISTS entries (
+    kind TEXT NOT NULL,
+    key TEXT NOT NULL,
+    payload TEXT,
+    etag TEXT,
+    last_modified TEXT,
+    fetched_at REAL NOT NULL,
+    PRIMARY KEY (kind, key)
+);
+"""
+
+
+class MetadataCache:
+    """
+    SQLite-backed store for folders, per-folder documents and template metadata of one Alation instance.
+    Safe to share between the Tk thread and background refresh threads.
+    """
+
+    def __init__(self, path, alation_url):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+        if self._get_meta("alation_url") != alation_url:
+            # Cached data from a different instance is useless; start over.
+            self.clear()
+            self._set_meta("alation_url", alation_url)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def clear(self):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM folders")
+            self._conn.execute("DELETE FROM entries")
+            self._conn.execute("DELETE FROM meta")
+
+    def _get_meta(self, key):
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, key, value):
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, str(value)))
+
+    # --- Folders ---
+
+    def folders_fetched_at(self):
+        value = self._get_meta("folders_fetched_at")
+        return float(value) if value else None
+
+    def folders_are_fresh(self, ttl=FOLDERS_TTL):
+        fetched_at = self.folders_fetched_at()
+        return fetched_at is not None and time.time() - fetched_at < ttl
+
+    def load_folders(self):
+        """
+        Returns the cached folders as API-shaped dicts, or an empty list if nothing is cached.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, title, document_hub_id, parent_folder_id FROM folders ORDER BY id").fetchall()
+        return [{'id': r[0], 'title': r[1], 'document_hub_id': r[2], 'parent_folder_id': r[3]} for r in rows]
+
+    def folder_ids(self):
+        with self._lock:
+            return {row[0] for row in self._conn.execute("SELECT id FROM folders")}
+
+    def replace_folders(self, folders, sync_marks=None):
+        """
+        Atomically replaces the cached folder list and stamps it as freshly fetched.
+        sync_marks ({hub_id: timestamp}) replaces the per-hub high-water marks used by incremental syncs.
+        """
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM folders")
+            self._write_folders(folders, sync_marks)
+
+    def apply_folder_changes(self, upserts, deleted_ids, sync_marks):
+        """
+        Atomically upserts changed folders, drops deleted ones and their cached documents, and
+        merges sync_marks into the stored high-water marks.
+        """
+        deleted_ids = list(deleted_ids)
+        with self._lock, self._conn:
+            self._conn.executemany("DELETE FROM folders WHERE id = ?", [(folder_id,) for folder_id in deleted_ids])
+            self._conn.executemany("DELETE FROM entries WHERE kind = ? AND key = ?",
+                                   [(KIND_DOCUMENTS, str(folder_id)) for folder_id in deleted_ids])
+            self._write_folders(upserts, {**self._sync_marks_locked(), **sync_marks})
+
+    def _write_folders(self, folders, sync_marks):
+        rows = ((f['id'], f.get('title'), f.get('document_hub_id'), f.get('parent_folder_id')) for f in folders)
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO folders (id, title, document_hub_id, parent_folder_id) VALUES (?, ?, ?, ?)",
+            rows)
+        self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('folders_fetched_at', ?)",
+                           (str(time.time()),))
+        if sync_marks is not None:
+            self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('sync_marks', ?)",
+                               (json.dumps({str(hub_id): mark for hub_id, mark in sync_marks.items()}),))
+
+    def load_sync_marks(self):
+        """
+        Returns {hub_id: timestamp} of the last sync of each hub, or {} if none was recorded.
+        """
+        with self._lock:
+            return self._sync_marks_locked()
+
+    def _sync_marks_locked(self):
+        row = self._conn.execute("SELECT value FROM meta WHERE key = 'sync_marks'").fetchone()
+        return {int(hub_id): mark for hub_id, mark in json.loads(row[0]).items()} if row else {}
+
+    # --- Generic entries (documents per folder, template titles and details) ---
+
+    def get_entry(self, kind, key):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT payload, etag, last_modified, fetched_at FROM entries WHERE kind = ? AND key = ?",
+                (kind, str(key))).fetchone()
+        if not row:
+            return None
+        return CacheEntry(json.loads(row[0]), row[1], row[2], row[3])
+
+    def put_entry(self, kind, key, payload, etag=None, last_modified=None):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entries (kind, key, payload, etag, last_modified, fetched_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (kind, str(key), json.dumps(payload), etag, last_modified, time.time()))
+
+    def touch_entry(self, kind, key):
+        """
+        Marks an entry as revalidated (e.g. after a 304) without rewriting its payload.
+        """
+        with self._lock, self._conn:
+            self._conn.execute("UPDATE entries SET fetched_at = ? WHERE kind = ? AND key = ?",
+                               (time.time(), kind, str(key)))
+
+    def delete_entries(self, kind, keys):
+        with self._lock, self._conn:
+            self._conn.executemany("DELETE FROM entries WHERE kind = ? AND key = ?", [(kind, str(key)) for key in keys])
+
+    @staticmethod
+    def is_fresh(entry, ttl):
+        return entry is not None and time.time() - entry.fetched_at < ttl
@@ -0,0 +1,1022 @@
+# services.py
+"""
+Data/service layer shared by the Tk GUI (app_logic) and the headless CLI (apt2.py).
+Nothing here may import tkinter or touch widgets; long-running calls take optional
+on_page/on_progress callbacks and a should_stop() hook instead.
+"""
+import asyncio
+import json
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from datetime import datetime, timedelta, timezone
+
+import alation_api
+import alation_async
+import app_logging
+import document_uploader
+import jobs
+import metadata_cache
+import template_generator
+import template_registry
+
+logger = app_logging.get_logger("services")
+
+CONFIG_FILE = "config.json"
+CACHE_FILE = "apt2_cache.sqlite3"  # Created next to CONFIG_FILE; named profiles get apt2_cache.<profile>.sqlite3.
+# Connection profile of a config.json without a "profiles" section (the original single-instance layout).
+DEFAULT_PROFILE = "default"
+CONNECTION_KEYS = ("alation_url", "user_id", "refresh_token")
+PROFILE_WORKERS = 4  # Instances refreshed or compared at once.
+_UNSAFE_FILENAME_CHARS = re.compile(r'[^\w.-]')
+# Optional config.json keys passed through to alation_api.AlationClient.
+HTTP_SETTING_KEYS = ("pool_size", "timeout", "retries", "backoff_factor")
+TEMPLATE_NAME_WORKERS = 8
+# Optional config.json keys passed through to document_uploader.upload_documents.
+UPLOAD_SETTING_KEYS = ("batch_size", "concurrency", "rate_limit")
+# Incremental syncs re-read this much before each hub's high-water mark to absorb clock skew with the server.
+SYNC_OVERLAP = timedelta(minutes=5)
+# Hub template crawl on hub selection: off unless config.json sets prefetch_hub_templates to true;
+# prefetch_concurrency and prefetch_rate_limit override the limits.
+PREFETCH_HUB_TEMPLATES = False
+PREFETCH_CONCURRENCY = 4
+PREFETCH_RATE_LIMIT = 5.0  # HTTP requests per second, counting every page of every folder
+# Hub template crawls and template exports use the asyncio client (needs httpx) when config.json sets async_http
+# to true; async_concurrency overrides alation_async.DEFAULT_CONCURRENCY for them.
+ASYNC_HTTP = False
+app_settings = {}
+active_profile = None
+
+
+class FolderRecord:
+    """
+    Compact stand-in for a folder JSON dict, keeping only the fields the app reads.
+    """
+    __slots__ = ('id', 'title', 'hub_id', 'parent_id')
+
+    def __init__(self, folder_id, title, hub_id, parent_id):
+        self.id = folder_id
+        self.title = title or 'Untitled Folder'
+        self.hub_id = hub_id
+        self.parent_id = parent_id
+
+    @classmethod
+    def from_api(cls, folder):
+        return cls(folder['id'], folder.get('title'), folder.get('document_hub_id'), folder.get('parent_folder_id'))
+
+    def as_api_dict(self):
+        return {'id': self.id, 'title': self.title, 'document_hub_id': self.hub_id, 'parent_folder_id': self.parent_id}
+
+
+class AppData:
+    """
+    Folder indexes built once per refresh: id -> record, hub -> folders, (hub, parent) -> children, id -> title.
+    The hub and children indexes are insertion-ordered {folder id: record} dicts, so removing a folder is O(1).
+    """
+
+    def __init__(self):
+        self.folders_by_id = {}
+        self.folders_by_hub = {}
+        self.children_by_parent = {}
+        self.id_to_title_map = {}
+        self.doc_hubs = {}
+        self.template_title_to_id_map = {}
+        self.template_usage_by_folder = {}  # folder_id -> {template_id: document count}
+        self.version = 0  # Bumped whenever a folder is added or removed, so derived state can tell it is stale.
+
+    def add_folders(self, folders):
+        """
+        Indexes an iterable of FolderRecords or API folder dicts. Returns the hub IDs it introduced.
+        """
+        new_hub_ids = set()
+        for folder in folders:
+            record = folder if isinstance(folder, FolderRecord) else FolderRecord.from_api(folder)
+            if record.id in self.folders_by_id: continue
+            self.version += 1
+            self.folders_by_id[record.id] = record
+            self.id_to_title_map[record.id] = record.title
+            if record.hub_id:
+                if record.hub_id not in self.folders_by_hub:
+                    self.folders_by_hub[record.hub_id] = {}
+                    self.doc_hubs[record.hub_id] = f"Hub ID: {record.hub_id}"
+                    new_hub_ids.add(record.hub_id)
+                self.folders_by_hub[record.hub_id][record.id] = record
+            self.children_by_parent.setdefault((record.hub_id, record.parent_id), {})[record.id] = record
+        return new_hub_ids
+
+    def remove_folder(self, record):
+        self.version += 1
+        del self.folders_by_id[record.id]
+        self.id_to_title_map.pop(record.id, None)
+        if record.hub_id:
+            hub_folders = self.folders_by_hub[record.hub_id]
+            del hub_folders[record.id]
+            if not hub_folders:
+                del self.folders_by_hub[record.hub_id]
+                del self.doc_hubs[record.hub_id]
+        siblings = self.children_by_parent[(record.hub_id, record.parent_id)]
+        del siblings[record.id]
+        if not siblings: del self.children_by_parent[(record.hub_id, record.parent_id)]
+
+    def apply_changes(self, upserts, deleted_ids):
+        """
+        Patches the indexes in place with changed FolderRecords and deleted folder IDs.
+        Upserts identical to the indexed record are ignored. Returns what actually changed:
+        {'added': [record], 'updated': [(old, new)], 'deleted': [old], 'new_hub_ids', 'removed_hub_ids'}.
+        """
+        hubs_before = set(self.folders_by_hub)
+        changes = {'added': [], 'updated': [], 'deleted': []}
+        for folder_id in deleted_ids:
+            record = self.folders_by_id.get(folder_id)
+            if record is not None:
+                self.remove_folder(record)
+                changes['deleted'].append(record)
+        for record in upserts:
+            old = self.folders_by_id.get(record.id)
+            if old is None:
+                changes['added'].append(record)
+            elif (old.title, old.hub_id, old.parent_id) == (record.title, record.hub_id, record.parent_id):
+                continue
+            else:
+                self.remove_folder(old)
+                changes['updated'].append((old, record))
+            self.add_folders([record])
+        changes['new_hub_ids'] = set(self.folders_by_hub) - hubs_before
+        changes['removed_hub_ids'] = hubs_before - set(self.folders_by_hub)
+        return changes
+
+    def children(self, hub_id, parent_id):
+        """Returns a view of the child FolderRecords of parent_id (None for the hub's top level), in insertion order."""
+        return self.children_by_parent.get((hub_id, parent_id), {}).values()
+
+    def find_folders(self, hub_id, query):
+        """
+        Returns the IDs of the folders in hub_id whose title contains query (case-insensitive), or [query]
+        if it is the ID of any known folder.
+        """
+        if query.isdigit() and int(query) in self.folders_by_id:
+            return [int(query)]
+        needle = query.casefold()
+        return [folder.id for folder in self.folders_by_hub.get(hub_id, {}).values()
+                if needle in folder.title.casefold()]
+
+    def set_template_usage(self, folder_id, documents):
+        """Records how many of a folder's documents use each template; documents without one count under None."""
+        usage = {}
+        for doc in documents:
+            template_id = doc.get('template_id') or None
+            usage[template_id] = usage.get(template_id, 0) + 1
+        self.template_usage_by_folder[folder_id] = usage
+
+    def forget_template_usage(self, folder_ids):
+        for folder_id in folder_ids:
+            self.template_usage_by_folder.pop(folder_id, None)
+
+    def template_usage(self, hub_id, folder_id=None):
+        """
+        Returns {template_id: document count} summed over folder_id and every folder beneath it
+        (the whole hub if folder_id is None). Folders that have not been indexed yet count as empty.
+        """
+        if folder_id is None:
+            folder_ids = list(self.folders_by_hub.get(hub_id, {}))
+        else:
+            folder_ids, stack = set(), [folder_id]
+            while stack:
+                current = stack.pop()
+                if current in folder_ids: continue
+                folder_ids.add(current)
+                stack.extend(child.id for child in self.children(hub_id, current))
+        usage = {}
+        for current in folder_ids:
+            for template_id, count in self.template_usage_by_folder.get(current, {}).items():
+                if template_id is not None: usage[template_id] = usage.get(template_id, 0) + count
+        return usage
+
+    @property
+    def folder_count(self):
+        return len(self.folders_by_id)
+
+
+app_data = AppData()
+cache = None
+# Active instance's template titles/details in memory (config.json keys template_cache_size, template_cache_ttl).
+registry = template_registry.TemplateRegistry()
+
+
+# --- Settings and connection ---
+
+def profile_names(settings):
+    """Returns the connection profile names of a loaded config.json, in file order."""
+    return list(settings.get("profiles") or {}) or [DEFAULT_PROFILE]
+
+
+def profile_name(settings, name=None):
+    """Resolves name (default: the config's active_profile, else its first profile). Raises ValueError if unknown."""
+    names = profile_names(settings)
+    name = name or settings.get("active_profile") or names[0]
+    if name not in names: raise ValueError(f"No profile named '{name}' in {CONFIG_FILE}.")
+    return name
+
+
+def profile_settings(settings, name=None):
+    """
+    Returns the effective settings of one connection profile: the top-level keys of config.json, which all
+    profiles share (HTTP, upload and prefetch options), overridden by the profile's own keys.
+    """
+    name = profile_name(settings, name)
+    if not settings.get("profiles"): return dict(settings)
+    shared = {key: value for key, value in settings.items() if key not in ("profiles", "active_profile")}
+    shared.update(settings["profiles"][name])
+    return shared
+
+
+def _write_settings(settings):
+    try:
+        with open(CONFIG_FILE, 'w') as f:
+            json.dump(settings, f, indent=4)
+        logger.info(f"Settings successfully saved to {CONFIG_FILE}")
+        return True
+    except Exception as e:
+        logger.error(f"Could not save settings to {CONFIG_FILE}. Error: {e}"); return False
+
+
+def save_settings(url, token, user_id, profile=None):
+    """
+    Saves the connection fields of one profile (default: the active one), keeping the rest of config.json.
+    """
+    settings = load_settings() or {}
+    connection = {"alation_url": url, "refresh_token": token, "user_id": user_id}
+    if settings.get("profiles"):
+        profile = profile or active_profile or profile_name(settings)
+        settings["profiles"].setdefault(profile, {}).update(connection)
+    else:
+        settings.update(connection)
+    if not _write_settings(settings): return False
+    global app_settings;
+    app_settings = profile_settings(settings, profile)
+    return True
+
+
+def save_active_profile(name):
+    """Makes name the profile used at the next start (and by prepare_connection without an explicit profile)."""
+    settings = load_settings() or {}
+    settings["active_profile"] = profile_name(settings, name)
+    return _write_settings(settings)
+
+
+def load_settings():
+    try:
+        with open(CONFIG_FILE, 'r') as f:
+            settings = json.load(f); logger.info(f"Settings loaded from {CONFIG_FILE}"); return settings
+    except FileNotFoundError:
+        logger.info(f"{CONFIG_FILE} not found. No settings loaded."); return None
+    except Exception as e:
+        logger.error(f"Could not load settings from {CONFIG_FILE}. Error: {e}"); return None
+
+
+def cache_path(profile=None):
+    """Returns the metadata cache file of a profile; each profile (instance) has its own."""
+    name = CACHE_FILE
+    if profile and profile != DEFAULT_PROFILE:
+        root, extension = os.path.splitext(CACHE_FILE)
+        name = f"{root}.{_UNSAFE_FILENAME_CHARS.sub('_', profile)}{extension}"
+    return os.path.join(os.path.dirname(os.path.abspath(CONFIG_FILE)), name)
+
+
+def open_cache(url):
+    """
+    Opens (or reopens for a different URL) the active profile's on-disk metadata cache next to the config file.
+    The previous cache is not closed here: jobs started before a profile switch may still be using it, and its
+    connection closes once the last of them lets go of it.
+    """
+    global cache
+    path = cache_path(active_profile)
+    try:
+        cache = metadata_cache.MetadataCache(path, url)
+    except Exception as e:
+        logger.warning(f"Could not open metadata cache {path}. Continuing without it. Error: {e}")
+        cache = None
+    return cache
+
+
+def prepare_connection(profile=None):
+    """
+    Loads config.json and makes profile (default: its active_profile) the active connection: configures its
+    API client, opens its cache and clears the in-memory indexes, without touching the network.
+    Returns False (after logging why) if the settings are missing or incomplete.
+    """
+    global app_settings, active_profile, app_data, registry;
+    settings = load_settings()
+    if not settings: logger.info("No saved credentials found. Please configure via File -> Settings."); return False
+    try:
+        name = profile_name(settings, profile)
+    except ValueError as e:
+        logger.error(f"{e}"); return False
+    app_settings = profile_settings(settings, name)
+    url, user_id, refresh_token = app_settings.get("alation_url"), app_settings.get("user_id"), app_settings.get(
+        "refresh_token")
+    if not all([url, user_id, refresh_token]): logger.error(
+        f"Incomplete settings for profile '{name}' in {CONFIG_FILE}. Please save settings again."); return False
+    if name != DEFAULT_PROFILE: logger.info(f"Using connection profile '{name}' ({url}).")
+    active_profile = name
+    http_options = {key: app_settings[key] for key in HTTP_SETTING_KEYS if key in app_settings}
+    alation_api.configure_client(url, **http_options)
+    open_cache(url)
+    app_data = AppData()
+    # A fresh registry: template IDs are only unique within one instance.
+    registry = template_registry.TemplateRegistry(
+        app_settings.get("template_cache_size", template_registry.DEFAULT_MAX_ENTRIES),
+        app_settings.get("template_cache_ttl", template_registry.DEFAULT_TTL))
+    return True
+
+
+def authenticate():
+    return alation_api.refresh_api_token(app_settings.get("alation_url"), app_settings.get("user_id"),
+                                         app_settings.get("refresh_token"))
+
+
+def current_profile():
+    """
+    Captures the active connection as a Profile: its settings, API client, cache, folder indexes and template
+    registry. Background jobs take it when they are submitted and pass it as profile=, so a job still running
+    after a profile switch keeps reading and writing the instance it was started for.
+    """
+    profile = Profile(active_profile or DEFAULT_PROFILE, app_settings)
+    url = app_settings.get("alation_url")
+    profile.client = alation_api.get_client(url) if url else None
+    profile.cache, profile.app_data, profile.registry = cache, app_data, registry
+    return profile
+
+
+# --- Folders ---
+
+def _cache_of(profile):
+    """The metadata cache to use: profile's when given, otherwise the active connection's."""
+    return profile.cache if profile is not None else cache
+
+
+def _app_data_of(profile):
+    return profile.app_data if profile is not None else app_data
+
+
+def _registry_of(profile):
+    return profile.registry if profile is not None else registry
+
+
+def _settings_of(profile):
+    return profile.settings if profile is not None else app_settings
+
+
+def _api_of(url, profile):
+    """What to hand alation_api for url: profile's own client when given, otherwise the active connection's."""
+    return profile.client if profile is not None and profile.client is not None else url
+
+
+def load_cached_folders(profile=None):
+    """
+    Rebuilds app_data (or profile's indexes) from the on-disk cache. Returns the number of cached folders (0 if none).
+    """
+    folder_cache = _cache_of(profile)
+    if folder_cache is None: return 0
+    folders = folder_cache.load_folders()
+    if not folders: return 0
+    if profile is None:
+        reset_app_data(folders)
+    else:
+        profile.app_data = AppData()
+        profile.app_data.add_folders(folders)
+    return len(folders)
+
+
+def reset_app_data(records=(), keep_template_map=False):
+    """
+    Replaces app_data with fresh indexes over records, optionally keeping the current folder's template map.
+    """
+    global app_data;
+    template_map = app_data.template_title_to_id_map
+    app_data = AppData()
+    if keep_template_map: app_data.template_title_to_id_map = template_map
+    app_data.add_folders(records)
+    return app_data
+
+
+def fetch_all_folders(url, on_page=None, should_stop=None, profile=None):
+    """
+    Pages through every folder, passing each page of FolderRecords to on_page. Raw JSON pages are dropped
+    as soon as they are projected. Writes the complete list and fresh per-hub sync marks to the cache and
+    returns it, or returns None if should_stop() turned true before the last page.
+    """
+    started = _utc_now()
+    records = []
+    for page in alation_api.iter_folder_pages(_api_of(url, profile)):
+        if should_stop and should_stop(): return None
+        page_records = [FolderRecord.from_api(folder) for folder in page]
+        records.extend(page_records)
+        if on_page: on_page(page_records)
+    folder_cache = _cache_of(profile)
+    if folder_cache is not None:
+        folder_cache.replace_folders((record.as_api_dict() for record in records),
+                                     sync_marks={record.hub_id: started for record in records if record.hub_id})
+    return records
+
+
+def _utc_now():
+    return datetime.now(timezone.utc).isoformat(timespec='seconds')
+
+
+def _parse_timestamp(value):
+    """Parses an ISO 8601 timestamp (naive ones are taken as UTC). Returns None if it cannot."""
+    try:
+        parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except (AttributeError, ValueError):
+        return None
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+def _changed_since_mark(item, marks):
+    """
+    True unless the item's ts_updated is at or before its own hub's mark (less SYNC_OVERLAP).
+    Items without a usable timestamp or from hubs without a mark always count as changed.
+    """
+    updated = _parse_timestamp(item.get('ts_updated'))
+    mark = _parse_timestamp(marks.get(item.get('document_hub_id')))
+    return updated is None or mark is None or updated > mark - SYNC_OVERLAP
+
+
+def can_sync_incrementally(profile=None):
+    folder_cache = _cache_of(profile)
+    return folder_cache is not None and bool(folder_cache.load_sync_marks())
+
+
+def fetch_folder_changes(url, sweep_deletions=False, should_stop=None, profile=None):
+    """
+    Worker half of an incremental sync. Asks for folders and documents modified since the oldest per-hub
+    high-water mark (less SYNC_OVERLAP) and keeps those newer than their own hub's mark. Changed folders go
+    into the cache, and cached document lists of folders with changed documents are dropped.
+    The filter cannot see deletions, so with sweep_deletions the full folder list is paged instead and
+    cached folders missing from it are deleted. If any stored mark cannot be parsed, the sync falls back to
+    such a sweep and drops every cached document list, since changes in that hub cannot be bounded.
+    Returns the changes for apply_folder_changes, or None if should_stop() turned true.
+    """
+    cache = _cache_of(profile)
+    marks = cache.load_sync_marks()
+    started = _utc_now()
+    parsed_marks = [_parse_timestamp(mark) for mark in marks.values()]
+    if not parsed_marks or None in parsed_marks:
+        logger.warning("Some sync marks are missing or unreadable; sweeping every folder instead of syncing changes.")
+        return _sweep_folder_changes(_api_of(url, profile), cache, started, should_stop)
+    since = min(parsed_marks) - SYNC_OVERLAP
+    since_params = {alation_api.MODIFIED_SINCE_PARAM: since.isoformat(timespec='seconds')}
+    upserts, seen_ids = [], set()
+    api = _api_of(url, profile)
+    for page in alation_api.iter_folder_pages(api, None if sweep_deletions else since_params):
+        if should_stop and should_stop(): return None
+        seen_ids.update(folder['id'] for folder in page)
+        upserts.extend(FolderRecord.from_api(folder) for folder in page if _changed_since_mark(folder, marks))
+    deleted_ids = cache.folder_ids() - seen_ids if sweep_deletions else set()
+
+    changed_documents, stale_folder_ids = 0, set()
+    for page in alation_api.iter_document_pages(api, params=since_params):
+        if should_stop and should_stop(): return None
+        for document in page:
+            if not _changed_since_mark(document, marks): continue
+            changed_documents += 1
+            stale_folder_ids.update(document.get('folder_ids') or [document.get('parent_folder_id')])
+    stale_folder_ids.discard(None)
+    cache.delete_entries(metadata_cache.KIND_DOCUMENTS, stale_folder_ids)
+
+    hub_ids = set(marks) | {record.hub_id for record in upserts if record.hub_id}
+    cache.apply_folder_changes([record.as_api_dict() for record in upserts], deleted_ids,
+                               sync_marks={hub_id: started for hub_id in hub_ids})
+    return {'upserts': upserts, 'deleted_ids': deleted_ids, 'documents_changed': changed_documents,
+            'stale_folder_ids': stale_folder_ids}
+
+
+def _sweep_folder_changes(url, cache, started, should_stop=None):
+    """
+    fetch_folder_changes without sync marks: pages every folder, replaces the cached folders and their marks
+    with the result, and drops all cached document lists.
+    """
+    upserts = []
+    for page in alation_api.iter_folder_pages(url):
+        if should_stop and should_stop(): return None
+        upserts.extend(FolderRecord.from_api(folder) for folder in page)
+    cached_ids = cache.folder_ids()
+    deleted_ids = cached_ids - {record.id for record in upserts}
+    cache.delete_entries(metadata_cache.KIND_DOCUMENTS, cached_ids)
+    cache.replace_folders((record.as_api_dict() for record in upserts),
+                          sync_marks={record.hub_id: started for record in upserts if record.hub_id})
+    return {'upserts': upserts, 'deleted_ids': deleted_ids, 'documents_changed': 0, 'stale_folder_ids': cached_ids}
+
+
+def apply_folder_changes(changes, profile=None):
+    """
+    Patches app_data (or profile's indexes) with the result of fetch_folder_changes. Returns the
+    AppData.apply_changes diff plus a 'counts' dict for reporting.
+    """
+    data = _app_data_of(profile)
+    diff = data.apply_changes(changes['upserts'], changes['deleted_ids'])
+    data.forget_template_usage(changes['stale_folder_ids'] | changes['deleted_ids'])
+    diff['counts'] = {'added': len(diff['added']), 'updated': len(diff['updated']), 'deleted': len(diff['deleted']),
+                      'documents_changed': changes['documents_changed'],
+                      'document_lists_invalidated': len(changes['stale_folder_ids'])}
+    return diff
+
+
+def sync_folders(url, sweep_deletions=False, should_stop=None, profile=None):
+    """
+    Incremental sync for callers without a UI thread: fetches, caches and applies changes in one go.
+    Returns the delta counts, or None if stopped.
+    """
+    changes = fetch_folder_changes(url, sweep_deletions, should_stop, profile)
+    return apply_folder_changes(changes, profile)['counts'] if changes is not None else None
+
+
+def refresh_folders(url, force=False, full=False, sweep_deletions=False, profile=None):
+    """
+    Brings the folder indexes up to date the cheapest way available: straight from a fresh cache (unless force),
+    by an incremental sync, or by downloading every folder (always with full).
+    Returns {'mode': 'cache' | 'incremental' | 'full', 'delta': sync counts or None}.
+    """
+    folder_cache = _cache_of(profile)
+    if not force and folder_cache is not None and folder_cache.folders_are_fresh():
+        load_cached_folders(profile)
+        return {'mode': "cache", 'delta': None}
+    if not full and can_sync_incrementally(profile):
+        load_cached_folders(profile)
+        return {'mode': "incremental", 'delta': sync_folders(url, sweep_deletions, profile=profile)}
+    records = fetch_all_folders(url, profile=profile)
+    if profile is None:
+        reset_app_data(records)
+    else:
+        profile.app_data = AppData()
+        profile.app_data.add_folders(records)
+    return {'mode': "full", 'delta': None}
+
+
+# --- Documents and templates ---
+
+def folder_documents(url, hub_id, folder_id, rate_limiter=None, profile=None):
+    """
+    Returns the documents of a folder, served from the cache while within DOCUMENTS_TTL.
+    Only the fields the app reads are persisted. rate_limiter, if given, is charged once per HTTP request
+    (every page), so cache hits are free.
+    """
+    cache = _cache_of(profile)
+    entry = cache.get_entry(metadata_cache.KIND_DOCUMENTS, folder_id) if cache else None
+    if metadata_cache.MetadataCache.is_fresh(entry, metadata_cache.DOCUMENTS_TTL):
+        return entry.payload
+    documents = alation_api.get_documents(_api_of(url, profile), hub_id, folder_id, rate_limiter=rate_limiter)
+    return _store_documents(cache, folder_id, documents, entry)
+
+
+def _store_documents(cache, folder_id, documents, entry):
+    """Trims and caches a freshly fetched document list; on a failed fetch (None) falls back to entry."""
+    if documents is None:
+        if entry: logger.warning("Using stale cached documents for this folder.")
+        return entry.payload if entry else None
+    documents = [{'id': d.get('id'), 'title': d.get('title'), 'template_id': d.get('template_id')} for d in documents]
+    if cache: cache.put_entry(metadata_cache.KIND_DOCUMENTS, folder_id, documents)
+    return documents
+
+
+def _revalidated_entry(kind, key, url, path, project=None, profile=None, revalidate=False):
+    """
+    Returns (payload, modification marker) from the cache, revalidating it with a conditional request once
+    TEMPLATE_TTL expires, or right away with revalidate. project, if given, trims a fresh payload before it is
+    stored. Falls back to a stale entry if the server cannot be reached. Returns (None, None) if nothing is available.
+    """
+    cache = _cache_of(profile)
+    entry = cache.get_entry(kind, key) if cache else None
+
+    def cached():
+        if entry is None: return None, None
+        return entry.payload, template_registry.marker_of(entry.payload, entry.etag, entry.last_modified)
+
+    if not revalidate and metadata_cache.MetadataCache.is_fresh(entry, metadata_cache.TEMPLATE_TTL):
+        return cached()
+    result = alation_api.get_json_conditional(_api_of(url, profile), path, etag=entry.etag if entry else None,
+                                              last_modified=entry.last_modified if entry else None)
+    if result is None:
+        return cached()
+    status, payload, etag, last_modified = result
+    if status == 304 and entry:
+        cache.touch_entry(kind, key)
+        return cached()
+    if status != 200:
+        return cached()
+    if project: payload = project(payload)
+    if cache: cache.put_entry(kind, key, payload, etag, last_modified)
+    return payload, template_registry.marker_of(payload, etag, last_modified)
+
+
+def cached_template_name(url, template_id, profile=None):
+    """
+    Returns a template's title from the registry (filled by either endpoint), else from visual_config.
+    """
+    registry = _registry_of(profile)
+    info = registry.get(template_id)
+    if info is not None and info.title: return info.title
+    title, marker = _revalidated_entry(metadata_cache.KIND_TEMPLATE_TITLE, template_id, url,
+                                       f"/integration/visual_config/{template_id}/",
+                                       project=lambda p: {'title': p.get('title')}, profile=profile,
+                                       revalidate=registry.is_stale(template_id, template_registry.SOURCE_TITLE))
+    if not title or not title.get('title'): return f"ID: {template_id}"  # Fallbacks are never registered.
+    return registry.record(template_id, template_registry.SOURCE_TITLE, title, marker).title
+
+
+def resolve_template_names(url, template_ids, max_workers=TEMPLATE_NAME_WORKERS, profile=None):
+    """
+    Resolves template titles concurrently with a bounded thread pool; titles already in the registry cost nothing.
+    Returns [(template_id, title), ...] sorted by template ID, whatever order the requests finish in.
+    """
+    template_ids = sorted(set(template_ids))
+    registry = _registry_of(profile)
+    names = {}
+    for t_id in template_ids:
+        info = registry.get(t_id)
+        if info is not None and info.title: names[t_id] = info.title
+    missing = [t_id for t_id in template_ids if t_id not in names]
+    if missing:
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(missing))) as executor:
+            for t_id, name in zip(missing, executor.map(lambda t_id: cached_template_name(url, t_id, profile), missing)):
+                names[t_id] = name
+    return [(t_id, names[t_id]) for t_id in template_ids]
+
+
+def template_info(url, template_id, profile=None):
+    """
+    Returns the registry entry of a template with its details (title, fields, field_map, field_types),
+    fetching custom_template only when it is not already in memory. Returns None if it cannot be fetched.
+    """
+    registry = _registry_of(profile)
+    info = registry.get(template_id, need_details=True)
+    if info is not None: return info
+    details, marker = _revalidated_entry(metadata_cache.KIND_TEMPLATE_DETAILS, template_id, url,
+                                         f"/integration/v1/custom_template/{template_id}/", profile=profile,
+                                         revalidate=registry.is_stale(template_id, template_registry.SOURCE_DETAILS))
+    if details is None: return None
+    return registry.record(template_id, template_registry.SOURCE_DETAILS, details, marker)
+
+
+def cached_template_details(url, template_id, profile=None):
+    info = template_info(url, template_id, profile)
+    return info.details if info is not None else None
+
+
+def folder_templates(url, hub_id, folder_id, should_stop=None, profile=None):
+    """
+    Returns (documents, [(template_id, title), ...]) for the templates used by a folder's documents.
+    """
+    documents = folder_documents(url, hub_id, folder_id, profile=profile)
+    if documents is not None: _app_data_of(profile).set_template_usage(folder_id, documents)
+    if not documents or (should_stop and should_stop()):
+        return documents, []
+    template_ids = set()
+    for doc in documents:
+        if doc.get('template_id'):
+            template_ids.add(doc.get('template_id'))
+    if template_ids:
+        logger.info(f"Found {len(template_ids)} unique template IDs from documents.")
+    return documents, resolve_template_names(url, template_ids, profile=profile)
+
+
+def memoized_template_names(template_ids):
+    """
+    Returns [(template_id, title), ...] sorted by ID from the registry only, or None if any title is missing.
+    """
+    titles = registry.titles(template_ids)
+    return sorted(titles.items()) if titles is not None else None
+
+
+def indexed_folder_templates(folder_id):
+    """
+    Answers a folder click from memory: returns (document_count, [(template_id, title), ...]) if the folder
+    has been indexed and all its template titles are known, otherwise None.
+    """
+    usage = app_data.template_usage_by_folder.get(folder_id)
+    if usage is None: return None
+    templates = memoized_template_names([t_id for t_id in usage if t_id is not None])
+    return (sum(usage.values()), templates) if templates is not None else None
+
+
+def _async_enabled(use_async=None, profile=None):
+    """Resolves a use_async argument (None: the async_http setting), falling back to threads without httpx."""
+    if use_async is None: use_async = _settings_of(profile).get("async_http", ASYNC_HTTP)
+    if use_async and not alation_async.available():
+        logger.warning("async_http is set but httpx is not installed; using threads.")
+        return False
+    return bool(use_async)
+
+
+def _run_async(url, work, profile=None):
+    """
+    Runs work(client) on a new event loop with an async client for url (async_concurrency requests at once),
+    then hands the client's token back to the synchronous client. Returns what work returned.
+    """
+    concurrency = _settings_of(profile).get("async_concurrency", alation_async.DEFAULT_CONCURRENCY)
+    sync_client = alation_api.get_client(_api_of(url, profile))
+
+    async def run():
+        async with alation_async.client_for(sync_client, concurrency) as client:
+            try:
+                return await work(client)
+            finally:
+                if client.access_token: sync_client.set_access_token(client.access_token)
+
+    return asyncio.run(run())
+
+
+def _crawl_documents_async(url, hub_id, folder_ids, rate_limit, on_documents, should_stop, profile=None):
+    """
+    Async half of crawl_hub_templates: answers folders from fresh cache entries, then fetches the rest as
+    asyncio tasks on one event loop, calling on_documents(folder_id, documents or None) for each folder.
+    """
+    cache = _cache_of(profile)
+    entries, to_fetch = {}, []
+    for folder_id in folder_ids:
+        entry = entries[folder_id] = cache.get_entry(metadata_cache.KIND_DOCUMENTS, folder_id) if cache else None
+        if metadata_cache.MetadataCache.is_fresh(entry, metadata_cache.DOCUMENTS_TTL):
+            on_documents(folder_id, entry.payload)
+        else:
+            to_fetch.append(folder_id)
+    if to_fetch:
+        store = lambda f_id, documents: on_documents(f_id, _store_documents(cache, f_id, documents, entries[f_id]))
+        _run_async(url, lambda client: alation_async.crawl_folder_documents(
+            client, hub_id, to_fetch, rate_limit, should_stop=should_stop, on_result=store), profile)
+
+
+def _unseen_templates(cache, kind, template_ids):
+    """The template IDs with nothing about them in the cache, whose lookups have nothing to revalidate."""
+    return [t_id for t_id in template_ids if not (cache and cache.get_entry(kind, t_id))]
+
+
+def _fetch_template_names_async(url, template_ids, profile=None):
+    """
+    Fetches the titles of templates never seen on this instance with the async client and records them like
+    cached_template_name does; the rest are left to it.
+    """
+    cache, registry = _cache_of(profile), _registry_of(profile)
+    missing = _unseen_templates(cache, metadata_cache.KIND_TEMPLATE_TITLE,
+                                [t_id for t_id in template_ids if registry.get(t_id) is None])
+    if not missing: return
+    titles = _run_async(url, lambda client: alation_async.fetch_template_names(client, missing), profile)
+    for t_id, title in titles.items():
+        if not title: continue
+        payload = {'title': title}
+        if cache: cache.put_entry(metadata_cache.KIND_TEMPLATE_TITLE, t_id, payload)
+        registry.record(t_id, template_registry.SOURCE_TITLE, payload, template_registry.marker_of(payload))
+
+
+def _fetch_template_details_async(url, template_ids, should_stop=None, profile=None):
+    """
+    Fetches the custom_template details of templates never seen on this instance with the async client and
+    records them like template_info does, so the export that follows finds them in memory.
+    """
+    cache, registry = _cache_of(profile), _registry_of(profile)
+    missing = _unseen_templates(cache, metadata_cache.KIND_TEMPLATE_DETAILS,
+                                [t_id for t_id in template_ids if registry.get(t_id, need_details=True) is None])
+    if not missing: return
+    details = _run_async(url, lambda client: alation_async.fetch_template_details(client, missing,
+                                                                                 should_stop=should_stop), profile)
+    for t_id, payload in details.items():
+        if payload is None: continue
+        if cache: cache.put_entry(metadata_cache.KIND_TEMPLATE_DETAILS, t_id, payload)
+        registry.record(t_id, template_registry.SOURCE_DETAILS, payload, template_registry.marker_of(payload))
+
+
+def crawl_hub_templates(url, hub_id, max_workers=PREFETCH_CONCURRENCY, rate_limit=PREFETCH_RATE_LIMIT,
+                        on_progress=None, should_stop=None, use_async=None, profile=None):
+    """
+    Fetches the documents of every not-yet-indexed folder in a hub concurrently, at most max_workers at a time
+    and rate_limit requests per second (fresh cached lists are free), and records each folder's template usage
+    in app_data. The titles of all templates found are resolved at the end, so later folder clicks are answered
+    by indexed_folder_templates. on_progress(done, total) follows each folder.
+    With use_async (None: the async_http setting; needs httpx) the folders and then the titles are fetched by
+    the asyncio client instead of a thread pool, up to the async_concurrency setting at a time.
+    Returns {'folders': indexed, 'failed': [folder_id], 'templates': count}, or None if stopped.
+    """
+    data = _app_data_of(profile)
+    folder_ids = [folder_id for folder_id in data.folders_by_hub.get(hub_id, {})
+                  if folder_id not in data.template_usage_by_folder]
+    failed = []
+    use_async = _async_enabled(use_async, profile)
+    done = 0
+
+    def indexed(folder_id, documents):
+        nonlocal done
+        done += 1
+        if documents is None:
+            failed.append(folder_id)
+        else:
+            data.set_template_usage(folder_id, documents)
+        if on_progress: on_progress(done, len(folder_ids))
+
+    if use_async:
+        _crawl_documents_async(url, hub_id, folder_ids, rate_limit, indexed, should_stop, profile)
+    else:
+        _crawl_documents_threaded(url, hub_id, folder_ids, max_workers, rate_limit, indexed, should_stop, profile)
+    if should_stop and should_stop(): return None
+    template_ids = data.template_usage(hub_id)
+    if use_async: _fetch_template_names_async(url, template_ids, profile)
+    resolve_template_names(url, template_ids, profile=profile)
+    return {'folders': len(folder_ids) - len(failed), 'failed': failed, 'templates': len(template_ids)}
+
+
+def _crawl_documents_threaded(url, hub_id, folder_ids, max_workers, rate_limit, indexed, should_stop, profile=None):
+    rate_limiter = document_uploader.RateLimiter(rate_limit)
+
+    def pending():
+        for folder_id in folder_ids:
+            if should_stop and should_stop(): return
+            yield folder_id
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        fetch = lambda folder_id: folder_documents(url, hub_id, folder_id, rate_limiter, profile)
+        for folder_id, future in jobs.completed_in_window(executor, fetch, pending(), max_workers * 2):
+            try:
+                documents = future.result()
+            except Exception as e:
+                logger.error(f"Could not fetch documents for folder {folder_id}: {e}")
+                documents = None
+            indexed(folder_id, documents)
+
+
+def hub_template_ids(url, hub_id, should_stop=None, profile=None):
+    """
+    Scans every document in a hub (paged) and returns the sorted template IDs in use, or None if stopped.
+    """
+    template_ids = set()
+    for page in alation_api.iter_document_pages(_api_of(url, profile), hub_id=hub_id):
+        if should_stop and should_stop(): return None
+        template_ids.update(doc['template_id'] for doc in page if doc.get('template_id'))
+    return sorted(template_ids)
+
+
+# --- Export and upload ---
+
+def export_templates(url, template_ids, output_dir, formats=template_generator.FORMATS, on_progress=None,
+                     should_stop=None, use_async=None, profile=None):
+    """
+    Writes upload templates for template_ids into output_dir (see template_generator.export_templates).
+    With use_async (None: the async_http setting) the details of templates never fetched before are first
+    fetched together by the asyncio client.
+    """
+    if _async_enabled(use_async, profile): _fetch_template_details_async(url, template_ids, should_stop, profile)
+    return template_generator.export_templates(template_ids, output_dir,
+                                               lambda t_id: cached_template_details(url, t_id, profile), formats=formats,
+                                               on_progress=on_progress, should_stop=should_stop)
+
+
+def upload_documents(url, path, template_id, folder_id, hub_id, on_progress=None, should_stop=None, profile=None,
+                     **options):
+    """
+    Uploads a filled-in template as documents of template_id into folder_id. Upload options from config.json
+    are used unless overridden by keyword. Raises document_uploader.UploadError if the template is unknown.
+    """
+    info = template_info(url, template_id, profile)
+    if info is None:
+        raise document_uploader.UploadError(f"Could not fetch details for template ID {template_id}.")
+    settings = _settings_of(profile)
+    upload_options = {key: settings[key] for key in UPLOAD_SETTING_KEYS if key in settings}
+    upload_options.update({key: value for key, value in options.items() if value is not None})
+    return document_uploader.upload_documents(_api_of(url, profile), path, info.details, template_id, folder_id, hub_id,
+                                              field_map=info.field_map, on_progress=on_progress,
+                                              should_stop=should_stop, **upload_options)
+
+
+# --- Several instances at once ---
+
+class Profile:
+    """
+    A connection profile opened next to the active one, with its own settings, API client (alation_api keeps
+    one per instance URL and user, each with its own token), metadata cache, folder indexes and template registry.
+    Every services function that takes profile= reads and writes these instead of the active connection's.
+    """
+
+    def __init__(self, name, settings):
+        self.name = name
+        self.settings = settings
+        self.url = settings.get("alation_url")
+        self.client = None
+        self.cache = None
+        self.app_data = AppData()
+        self.registry = template_registry.TemplateRegistry(
+            settings.get("template_cache_size", template_registry.DEFAULT_MAX_ENTRIES),
+            settings.get("template_cache_ttl", template_registry.DEFAULT_TTL))
+
+    def open(self):
+        if not all(self.settings.get(key) for key in CONNECTION_KEYS):
+            raise ValueError(f"Profile '{self.name}' is missing one of {', '.join(CONNECTION_KEYS)}.")
+        # Its own client, keyed by user: the active profile's may be busy on another thread, or log in as someone else.
+        self.client = alation_api.get_client(self.url, self.settings["user_id"],
+                                             **{key: self.settings[key] for key in HTTP_SETTING_KEYS
+                                                if key in self.settings})
+        self.cache = metadata_cache.MetadataCache(cache_path(self.name), self.url)
+        return self
+
+    def authenticate(self):
+        if alation_api.has_access_token(self.client): return True
+        return alation_api.refresh_api_token(self.client, self.settings["user_id"], self.settings["refresh_token"])
+
+    def close(self):
+        if self.cache is not None: self.cache.close()
+        self.cache = None
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _selected_profiles(names=None):
+    settings = load_settings() or {}
+    return [(name, profile_settings(settings, name)) for name in names or profile_names(settings)]
+
+
+def refresh_profiles(names=None, force=False, full=False, sweep_deletions=False, max_workers=PROFILE_WORKERS):
+    """
+    Refreshes the folder caches of several profiles (default: every profile in config.json) concurrently,
+    each through its own client, token and cache. One failing instance does not stop the others.
+    Returns {profile: {'mode', 'delta', 'folders', 'hubs'} or {'error': message}}.
+    """
+    selected = _selected_profiles(names)
+
+    def refresh(item):
+        name, settings = item
+        try:
+            with Profile(name, settings) as profile:
+                if not profile.authenticate(): return {'error': "Authentication failed."}
+                result = refresh_folders(profile.url, force, full, sweep_deletions, profile=profile)
+                data = profile.app_data
+                logger.info(f"Profile '{name}': {data.folder_count} folders in {len(data.doc_hubs)} Document Hubs "
+                            f"({result['mode']}).")
+                return dict(result, folders=data.folder_count, hubs=len(data.doc_hubs))
+        except Exception as e:
+            logger.error(f"Refreshing profile '{name}' failed: {e}")
+            return {'error': f"{type(e).__name__}: {e}"}
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(selected)))) as executor:
+        return dict(zip([name for name, _ in selected], executor.map(refresh, selected)))
+
+
+def diff_template_fields(details_by_profile):
+    """
+    Compares one template across profiles ({profile: template details or None}). Fields are matched by name,
+    since field IDs differ between instances. Returns {'titles': {profile: title}, 'absent': [profiles without
+    the template], 'missing': {profile: [field names only other profiles have]},
+    'type_mismatches': {field name: {profile: field_type}}, 'identical': bool}.
+    """
+    fields_by_profile = {name: {field['name_singular'].strip(): field.get('field_type')
+                                for field in details.get('fields') or [] if field.get('name_singular')}
+                         for name, details in details_by_profile.items() if details}
+    all_fields = set().union(*fields_by_profile.values())
+    missing = {name: sorted(all_fields - set(fields)) for name, fields in fields_by_profile.items()
+               if all_fields - set(fields)}
+    type_mismatches = {}
+    for field in sorted(all_fields):
+        types = {name: fields[field] for name, fields in fields_by_profile.items() if field in fields}
+        if len(set(types.values())) > 1: type_mismatches[field] = types
+    titles = {name: details.get('title') for name, details in details_by_profile.items() if details}
+    absent = [name for name, details in details_by_profile.items() if not details]
+    return {'titles': titles, 'absent': absent, 'missing': missing, 'type_mismatches': type_mismatches,
+            'identical': not (absent or missing or type_mismatches or len(set(titles.values())) > 1)}
+
+
+def compare_templates(template_ids, names=None, max_workers=TEMPLATE_NAME_WORKERS):
+    """
+    Diffs the fields of each template ID across profiles (default: all). Every (profile, template) lookup runs
+    in one thread pool and is answered from that profile's cache while fresh, so nothing is fetched serially.
+    Returns {'profiles': [compared], 'errors': {profile: message}, 'templates': [dict(diff, id=template_id)]}.
+    """
+    errors = {}
+
+    def authenticate(profile):
+        try:
+            return profile.authenticate()
+        except Exception as e:
+            errors[profile.name] = f"{type(e).__name__}: {e}"
+            return False
+
+    with ExitStack() as stack, ThreadPoolExecutor(max_workers=max_workers) as executor:
+        profiles = []
+        for name, settings in _selected_profiles(names):
+            # One broken profile (e.g. missing credentials) is reported, like refresh_profiles does.
+            try:
+                profiles.append(stack.enter_context(Profile(name, settings)))
+            except Exception as e:
+                logger.error(f"Opening profile '{name}' failed: {e}")
+                errors[name] = f"{type(e).__name__}: {e}"
+        ready = [profile for profile, ok in zip(profiles, executor.map(authenticate, profiles)) if ok]
+        for profile in profiles:
+            if profile not in ready: errors.setdefault(profile.name, "Authentication failed.")
+        lookups = [(profile, t_id) for t_id in template_ids for profile in ready]
+        details = executor.map(lambda lookup: cached_template_details(lookup[0].url, lookup[1], profile=lookup[0]),
+                               lookups)
+        by_template = {t_id: {} for t_id in template_ids}
+        for (profile, t_id), template in zip(lookups, details):
+            by_template[t_id][profile.name] = template
+    return {'profiles': [profile.name for profile in ready], 'errors': errors,
+            'templates': [dict(diff_template_fields(by_template[t_id]), id=t_id) for t_id in template_ids]}
@@ -1 +1,158 @@
 #/template_generator.py
+import csv
+import os
+import re
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from xml.sax.saxutils import escape
+
+import app_logging
+import jobs
+
+logger = app_logging.get_logger("template_generator")
+
+TITLE_FIELD = {'name_singular': 'Title', 'field_type': 'TEXT'}
+FORMATS = ('csv', 'xlsx')
+DEFAULT_WORKERS = 8
+MANIFEST_FILE = "template_fields.csv"
+MANIFEST_HEADER = ['template_id', 'template_title', 'field_id', 'field_name', 'field_type', 'file']
+
+
+def template_fields(template_details):
+    """
+    Returns the upload columns for a template: Title followed by the template's own fields.
+    """
+    return [TITLE_FIELD] + list(template_details.get('fields') or [])
+
+
+def safe_filename(text):
+    return re.sub(r'[^A-Za-z0-9._-]+', '_', str(text)).strip('_') or 'template'
+
+
+def write_csv_template(path, fields):
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        csv.writer(f).writerow([field.get('name_singular') for field in fields])
+
+
+def write_xlsx_template(path, fields):
+    with XlsxWriter(path) as writer:
+        writer.write_row([field.get('name_singular') for field in fields])
+
+
+def _column_letter(index):
+    letters = ''
+    index += 1
+    while index:
+        index, remainder = divmod(index - 1, 26)
+        letters = chr(65 + remainder) + letters
+    return letters
+
+
+class XlsxWriter:
+    """
+    Minimal single-sheet XLSX writer using inline strings. Rows are streamed straight into the
+    zip entry, so memory does not grow with the number of rows.
+    """
+
+    _CONTENT_TYPES = (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '</Types>')
+    _ROOT_RELS = (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+        'Target="xl/workbook.xml"/></Relationships>')
+    _WORKBOOK = (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        '<sheets><sheet name="{sheet}" sheetId="1" r:id="rId1"/></sheets></workbook>')
+    _WORKBOOK_RELS = (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+        'Target="worksheets/sheet1.xml"/></Relationships>')
+
+    def __init__(self, path, sheet_name="Upload"):
+        self._zip = zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED)
+        self._zip.writestr('[Content_Types].xml', self._CONTENT_TYPES)
+        self._zip.writestr('_rels/.rels', self._ROOT_RELS)
+        self._zip.writestr('xl/workbook.xml', self._WORKBOOK.format(sheet=escape(sheet_name[:31])))
+        self._zip.writestr('xl/_rels/workbook.xml.rels', self._WORKBOOK_RELS)
+        self._sheet = self._zip.open('xl/worksheets/sheet1.xml', 'w')
+        self._sheet.write(b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                          b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+                          b'<sheetData>')
+        self._row = 0
+
+    def write_row(self, values):
+        self._row += 1
+        cells = ''.join(
+            f'<c r="{_column_letter(i)}{self._row}" t="inlineStr"><is><t xml:space="preserve">'
+            f'{escape("" if value is None else str(value))}</t></is></c>'
+            for i, value in enumerate(values))
+        self._sheet.write(f'<row r="{self._row}">{cells}</row>'.encode('utf-8'))
+
+    def close(self):
+        self._sheet.write(b'</sheetData></worksheet>')
+        self._sheet.close()
+        self._zip.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def export_templates(template_ids, output_dir, fetch_details, formats=FORMATS, max_workers=DEFAULT_WORKERS,
+                     on_progress=None, should_stop=None):
+    """
+    Fetches template details concurrently and writes one upload template per template and format.
+    A manifest of every template field is streamed to MANIFEST_FILE as each template completes.
+    fetch_details(template_id) returns the custom_template JSON or None. on_progress(done, total) and
+    should_stop() are optional hooks for callers running this in the background.
+    Returns {'written': [paths], 'failed': [template_ids]}.
+    """
+    unknown = set(formats) - set(FORMATS)
+    if unknown: raise ValueError(f"Unsupported template format(s): {', '.join(sorted(unknown))}")
+    template_ids = list(dict.fromkeys(template_ids))
+    os.makedirs(output_dir, exist_ok=True)
+    result = {'written': [], 'failed': []}
+    with open(os.path.join(output_dir, MANIFEST_FILE), 'w', newline='', encoding='utf-8') as manifest_file, \
+            ThreadPoolExecutor(max_workers=max_workers) as executor:
+        manifest = csv.writer(manifest_file)
+        manifest.writerow(MANIFEST_HEADER)
+        for done, (template_id, future) in enumerate(
+                jobs.completed_in_window(executor, fetch_details, template_ids, max_workers * 2), start=1):
+            try:
+                details = future.result()
+            except Exception as e:
+                logger.error(f"Could not fetch template {template_id}: {e}")
+                details = None
+            if not details:
+                result['failed'].append(template_id)
+            else:
+                fields = template_fields(details)
+                title = details.get('title') or f"ID {template_id}"
+                base_path = os.path.join(output_dir, f"{safe_filename(title)}_{template_id}")
+                for file_format in formats:
+                    path = f"{base_path}.{file_format}"
+                    (write_xlsx_template if file_format == 'xlsx' else write_csv_template)(path, fields)
+                    result['written'].append(path)
+                for field in fields:
+                    manifest.writerow([template_id, title, field.get('id', ''), field.get('name_singular'),
+                                       field.get('field_type'), os.path.basename(base_path)])
+            if on_progress: on_progress(done, len(template_ids))
+            if should_stop and should_stop():
+                break
+    return result
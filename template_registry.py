@@ -0,0 +1,144 @@
+# template_registry.py
+"""
+In-memory store of template metadata (title, fields, field types and the upload field map) shared by folder
+clicks, export and upload. Entries are evicted least recently used beyond max_entries and go stale after ttl
+seconds. Each entry remembers the modification marker of every endpoint it was filled from (visual_config for
+the title, custom_template for the details); a changed marker from either one drops everything derived
+from the template, since both describe the same object, and makes the other endpoint revalidate on next use.
+"""
+import json
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+import app_logging
+import document_uploader
+
+logger = app_logging.get_logger("template_registry")
+
+DEFAULT_MAX_ENTRIES = 2000
+DEFAULT_TTL = 10 * 60  # Seconds before an entry is revalidated with a conditional request.
+SOURCE_TITLE = "visual_config"
+SOURCE_DETAILS = "custom_template"
+
+
+def marker_of(payload, etag=None, last_modified=None):
+    """Returns a response's modification marker: its ETag, else Last-Modified, else a hash of the payload."""
+    if etag or last_modified: return etag or last_modified
+    return f"crc:{zlib.crc32(json.dumps(payload, sort_keys=True).encode()):x}"
+
+
+class TemplateInfo:
+    """
+    What is known about one template. details is None until custom_template has been fetched;
+    field_map and field_types are derived from it on first use and kept.
+    """
+    __slots__ = ('id', 'title', 'details', 'markers', 'revalidate', 'loaded_at', '_field_map', '_field_types')
+
+    def __init__(self, template_id, loaded_at):
+        self.id = template_id
+        self.title = None
+        self.details = None
+        self.markers = {}  # source -> marker
+        self.revalidate = set()  # sources whose on-disk copies predate a detected change
+        self.loaded_at = loaded_at
+        self._field_map = None
+        self._field_types = None
+
+    @property
+    def field_map(self):
+        """Lower-cased field name -> custom field definition, as document_uploader matches upload columns."""
+        if self._field_map is None and self.details is not None:
+            self._field_map = document_uploader.build_field_map(self.details)
+        return self._field_map
+
+    @property
+    def field_types(self):
+        """Field name -> field_type."""
+        if self._field_types is None and self.details is not None:
+            self._field_types = {field['name_singular']: field.get('field_type')
+                                 for field in self.details.get('fields') or [] if field.get('name_singular')}
+        return self._field_types
+
+
+class TemplateRegistry:
+    """
+    Thread-safe LRU of TemplateInfo keyed by template ID, with hit/miss/invalidation counters.
+    """
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, ttl=DEFAULT_TTL, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.stats = {'hits': 0, 'misses': 0, 'invalidations': 0, 'evictions': 0}
+
+    def _fresh(self, info):
+        return info is not None and self._clock() - info.loaded_at < self.ttl
+
+    def get(self, template_id, need_details=False):
+        """Returns the template's fresh entry (one with details if need_details), or None."""
+        with self._lock:
+            info = self._entries.get(template_id)
+            if self._fresh(info) and (info.details is not None or not need_details):
+                self._entries.move_to_end(template_id)
+                self.stats['hits'] += 1
+                return info
+            self.stats['misses'] += 1
+            return None
+
+    def is_stale(self, template_id, source):
+        """
+        True if the next fetch from source should revalidate with the server rather than trust the on-disk
+        cache: the entry is past its TTL, or a change was seen through the other endpoint.
+        """
+        with self._lock:
+            info = self._entries.get(template_id)
+            return info is not None and (not self._fresh(info) or source in info.revalidate)
+
+    def titles(self, template_ids):
+        """Returns {template_id: title} from fresh entries only, or None if any title is missing."""
+        with self._lock:
+            infos = [self._entries.get(t_id) for t_id in template_ids]
+            if not all(self._fresh(info) and info.title for info in infos): return None
+            return {info.id: info.title for info in infos}
+
+    def record(self, template_id, source, payload, marker):
+        """
+        Stores a payload from source (SOURCE_TITLE: {'title': ...}; SOURCE_DETAILS: custom_template JSON) and
+        returns the entry. If source's marker differs from the one on record, the whole entry is replaced first.
+        """
+        with self._lock:
+            now = self._clock()
+            info = self._entries.pop(template_id, None)
+            changed = info is not None and info.markers.get(source) not in (None, marker)
+            if changed:
+                logger.info(f"Template {template_id} changed on the server; dropping its cached metadata.")
+                self.stats['invalidations'] += 1
+            if info is None or changed:
+                info = TemplateInfo(template_id, now)
+                if changed: info.revalidate = {SOURCE_TITLE, SOURCE_DETAILS} - {source}
+            info.markers[source] = marker
+            info.revalidate.discard(source)
+            info.loaded_at = now
+            if payload.get('title'): info.title = payload['title']
+            if source == SOURCE_DETAILS:
+                info.details, info._field_map, info._field_types = payload, None, None
+            self._entries[template_id] = info
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats['evictions'] += 1
+            return info
+
+    def invalidate(self, template_id):
+        with self._lock:
+            if self._entries.pop(template_id, None) is not None: self.stats['invalidations'] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,13 @@
+#/tests/conftest.py
+import pytest
+
+
+@pytest.fixture
+def folder():
+    """Factory for API folder dicts, as the folders endpoints return them."""
+
+    def make(folder_id, title, hub_id=1, parent_id=None, ts_updated=None):
+        return {'id': folder_id, 'title': title, 'document_hub_id': hub_id, 'parent_folder_id': parent_id,
+                'ts_updated': ts_updated}
+
+    return make
@@ -1 +1,149 @@
-# /tests/test_alation_api.py
\ No newline at end of file
+#/tests/test_alation_api.py
+import json
+
+import alation_api
+
+
+class FakeResponse:
+    def __init__(self, status_code, payload=None, headers=None):
+        self.status_code = status_code
+        self._payload = payload
+        self.headers = headers or {}
+        self.text = str(payload)
+        self.content = json.dumps(payload).encode()
+
+    def json(self):
+        return self._payload
+
+
+def make_client(monkeypatch, responses, token_responses=()):
+    client = alation_api.AlationClient("https://alation.example.com/", user_id="7", refresh_token="refresh",
+                                       access_token="old-token")
+    calls = []
+
+    def fake_request(method, url, **kwargs):
+        calls.append((method, url, client.session.headers.get('Token')))
+        return responses.pop(0)
+
+    def fake_post(url, **kwargs):
+        calls.append(('POST', url, kwargs.get('json')))
+        return token_responses[len([c for c in calls if c[0] == 'POST']) - 1]
+
+    monkeypatch.setattr(client.session, "request", fake_request)
+    monkeypatch.setattr(client.session, "post", fake_post)
+    return client, calls
+
+
+def test_client_strips_trailing_slash_and_sets_token_header():
+    client = alation_api.AlationClient("https://alation.example.com/", access_token="abc")
+    assert client.alation_url == "https://alation.example.com"
+    assert client.session.headers['Token'] == "abc"
+
+
+def test_request_refreshes_once_on_401_and_replays(monkeypatch):
+    client, calls = make_client(monkeypatch, [FakeResponse(401), FakeResponse(200, [])],
+                                [FakeResponse(201, {'api_access_token': 'new-token'})])
+    response = client.get("/integration/v2/folder/")
+    assert response.status_code == 200
+    assert [c[0] for c in calls] == ['GET', 'POST', 'GET']
+    assert calls[0][2] == "old-token"
+    assert calls[2][2] == "new-token"
+
+
+def test_request_does_not_loop_when_refresh_fails(monkeypatch):
+    client, calls = make_client(monkeypatch, [FakeResponse(401)], [FakeResponse(400, {})])
+    response = client.get("/integration/v2/folder/")
+    assert response.status_code == 401
+    assert [c[0] for c in calls] == ['GET', 'POST']
+    assert client.access_token is None
+
+
+def test_clients_are_kept_per_instance_and_user(monkeypatch):
+    monkeypatch.setattr(alation_api, "_clients", {})
+    url = "https://alation.example.com/"
+    active, alice, bob = alation_api.get_client(url), alation_api.get_client(url, "1"), alation_api.get_client(url, 2)
+    assert len({id(active), id(alice), id(bob)}) == 3 and alation_api.get_client(url.rstrip('/'), 1) is alice
+    assert alation_api.get_client(alice) is alice  # A client can stand in for a URL.
+    alice.set_access_token("a")
+    assert alation_api.has_access_token(alice) and not alation_api.has_access_token(url)
+
+
+def test_iter_pages_stops_on_a_short_page_after_a_full_one(monkeypatch):
+    pages = [FakeResponse(200, [{'id': 1}, {'id': 2}]), FakeResponse(200, [{'id': 3}])]
+    client, calls = make_client(monkeypatch, pages)
+    seen_params = []
+    original = client.session.request
+    monkeypatch.setattr(client.session, "request",
+                        lambda method, url, **kwargs: seen_params.append(kwargs['params']) or original(method, url))
+    acquired = []
+    limiter = type('Limiter', (), {'acquire': lambda self: acquired.append(len(seen_params))})()
+    result = list(alation_api._iter_pages(client, "/integration/v2/folder/", {'document_hub_id': 4}, page_size=2,
+                                          rate_limiter=limiter))
+    assert result == [[{'id': 1}, {'id': 2}], [{'id': 3}]]
+    assert [p['skip'] for p in seen_params] == [0, 2]
+    assert acquired == [0, 1]  # The rate limiter is charged before every request, not once per fetch.
+    assert all(p['limit'] == 2 and p['document_hub_id'] == 4 for p in seen_params)
+
+
+def test_iter_pages_learns_a_server_page_cap_below_the_limit(monkeypatch):
+    pages = [FakeResponse(200, [{'id': 1}, {'id': 2}]), FakeResponse(200, [{'id': 3}, {'id': 4}]),
+             FakeResponse(200, [{'id': 5}]), FakeResponse(200, [{'id': 6}])]
+    client, calls = make_client(monkeypatch, pages)
+    # A short first page might be the server's cap; the second page proves it, so the short third page is the last.
+    assert [len(page) for page in alation_api._iter_pages(client, "/x/", None, page_size=5)] == [2, 2, 1]
+    assert client.paging.page_cap == 2 and len(calls) == 3
+    # Once the cap is known, a short page is the last one.
+    assert list(alation_api._iter_pages(client, "/x/", None, page_size=5)) == [[{'id': 6}]]
+    assert len(calls) == 4
+
+
+def test_single_page_results_take_one_request_once_the_server_sent_a_next_page_header(monkeypatch):
+    pages = [FakeResponse(200, [{'id': 1}], {'X-Next-Page': '/integration/v2/document/?limit=5&skip=1'}),
+             FakeResponse(200, [{'id': 2}]), FakeResponse(200, [{'id': 3}, {'id': 4}])]
+    client, calls = make_client(monkeypatch, pages)
+    assert len(list(alation_api._iter_pages(client, "/integration/v2/document/", None, page_size=5))) == 2
+    assert list(alation_api._iter_pages(client, "/integration/v2/document/", None, page_size=5)) == [
+        [{'id': 3}, {'id': 4}]]
+    assert len(calls) == 3
+
+
+def test_iter_pages_follows_next_page_header(monkeypatch):
+    pages = [FakeResponse(200, [{'id': 1}], {'X-Next-Page': '/integration/v2/folder/?limit=1&skip=1'}),
+             FakeResponse(200, [{'id': 2}])]
+    client, calls = make_client(monkeypatch, pages)
+    seen_params = []
+    original = client.session.request
+    monkeypatch.setattr(client.session, "request",
+                        lambda method, url, **kwargs: seen_params.append((url, kwargs['params'])) or original(method, url))
+    result = list(alation_api._iter_pages(client, "/integration/v2/folder/", None, page_size=1))
+    assert result == [[{'id': 1}], [{'id': 2}]]
+    # The second response has no header, so it is the last page: no skip-based request follows.
+    assert seen_params == [("https://alation.example.com/integration/v2/folder/", {'limit': 1, 'skip': 0}),
+                           ("https://alation.example.com/integration/v2/folder/?limit=1&skip=1", None)]
+
+
+def test_iter_pages_stops_when_the_server_ignores_skip(monkeypatch):
+    client, calls = make_client(monkeypatch, [FakeResponse(200, [{'id': 1}]) for _ in range(3)])
+    assert list(alation_api._iter_pages(client, "/integration/v2/folder/", None, page_size=1)) == [[{'id': 1}]]
+    assert len(calls) == 2
+
+
+def test_iter_pages_raises_on_error_status(monkeypatch):
+    client, calls = make_client(monkeypatch, [FakeResponse(500, None)])
+    try:
+        list(alation_api._iter_pages(client, "/integration/v2/folder/", None, page_size=10))
+    except alation_api.AlationAPIError:
+        pass
+    else:
+        raise AssertionError("expected AlationAPIError")
+
+
+def test_pages_are_projected_with_either_json_backend(monkeypatch):
+    for backend in (alation_api.orjson, None):
+        monkeypatch.setattr(alation_api, "orjson", backend)
+        pages = [FakeResponse(200, [{'id': 1, 'title': 'A', 'description': 'x' * 100, 'document_hub_id': 3}]),
+                 FakeResponse(200, [])]
+        client, calls = make_client(monkeypatch, pages)
+        assert list(alation_api._iter_pages(client, "/integration/v2/folder/", None, 10,
+                                            alation_api.FOLDER_FIELDS)) == [[{'id': 1, 'title': 'A',
+                                                                              'document_hub_id': 3}]]
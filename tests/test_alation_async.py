@@ -0,0 +1,121 @@
+#/tests/test_alation_async.py
+import asyncio
+import json
+import time
+
+import pytest
+
+import alation_api
+import alation_async
+import metadata_cache
+import services
+import template_registry
+from benchmarks.mock_alation import MockAlation
+
+
+def test_rate_limiter_spaces_concurrent_tasks():
+    async def run():
+        limiter = alation_async.AsyncRateLimiter(50)
+        started = time.monotonic()
+        await asyncio.gather(*(limiter.acquire() for _ in range(5)))
+        return time.monotonic() - started
+
+    assert asyncio.run(run()) >= 0.07
+
+
+def test_concurrent_401s_share_one_token_refresh():
+    httpx = pytest.importorskip("httpx")
+    token_posts = []
+
+    def handler(request):
+        if request.url.path.endswith("createAPIAccessToken/"):
+            token_posts.append(json.loads(request.content))
+            return httpx.Response(201, json={'api_access_token': "new"})
+        if request.headers.get('Token') != "new":
+            return httpx.Response(401, json={})
+        folder_id = int(request.url.params['parent_folder_id'])
+        skip = int(request.url.params['skip'])
+        return httpx.Response(200, json=[{'id': folder_id, 'template_id': 9, 'extra': 'x'}] if not skip else [])
+
+    async def run():
+        async with alation_async.AsyncAlationClient("https://a.example.com", "1", "refresh", "old", concurrency=8,
+                                                    transport=httpx.MockTransport(handler)) as client:
+            return await alation_async.crawl_folder_documents(client, 1, range(1, 41))
+
+    documents = asyncio.run(run())
+    assert len(token_posts) == 1
+    assert documents[40] == [{'id': 40, 'template_id': 9}]
+    assert all(documents[folder_id] for folder_id in range(1, 41))
+
+
+def test_pages_share_the_sync_paging_rules_and_are_each_rate_limited():
+    httpx = pytest.importorskip("httpx")
+    requests_seen = []
+
+    def handler(request):
+        requests_seen.append(str(request.url))
+        folder_id = int(request.url.params.get('parent_folder_id', 0))
+        if folder_id == 1:  # header paging: the page without the header is the last one
+            page = int(request.url.params.get('page', 0))
+            next_page = f"https://a.example.com/integration/v2/document/?parent_folder_id=1&page={page + 1}"
+            headers = {'X-Next-Page': next_page} if page < 2 else {}
+            return httpx.Response(200, json=[{'id': page}], headers=headers)
+        return httpx.Response(200, json=[{'id': 7}])
+
+    class CountingLimiter(alation_async.AsyncRateLimiter):
+        calls = 0
+
+        async def acquire(self):
+            CountingLimiter.calls += 1
+
+    async def run():
+        async with alation_async.AsyncAlationClient("https://a.example.com", access_token="t",
+                                                    transport=httpx.MockTransport(handler)) as client:
+            limiter = CountingLimiter(None)
+            return (await client.get_documents(1, 1, rate_limiter=limiter),
+                    await client.get_documents(1, 2, rate_limiter=limiter))
+
+    header_paged, single_page = asyncio.run(run())
+    assert [document['id'] for document in header_paged] == [0, 1, 2]
+    assert [document['id'] for document in single_page] == [7]
+    # Folder 1 showed that the server sends the header, so folder 2's page is known to be its last.
+    assert CountingLimiter.calls == len(requests_seen) == 4
+
+
+def test_template_operations_and_document_sends():
+    httpx = pytest.importorskip("httpx")
+
+    def handler(request):
+        path = request.url.path
+        if path == "/integration/v2/document/":
+            return httpx.Response(202 if request.method == 'PUT' else 201, json={'job_id': 5})
+        template_id = int(path.rstrip('/').rsplit('/', 1)[1])
+        if template_id == 9: return httpx.Response(404, json={})
+        if path.startswith("/integration/visual_config/"): return httpx.Response(200, json={'title': f"T{template_id}"})
+        return httpx.Response(200, json={'id': template_id, 'fields': []})
+
+    async def run():
+        async with alation_async.AsyncAlationClient("https://a.example.com", access_token="t",
+                                                    transport=httpx.MockTransport(handler)) as client:
+            return (await alation_async.fetch_template_names(client, [1, 9]),
+                    await alation_async.fetch_template_details(client, [2, 9]),
+                    (await client.send_documents([{'title': 'x'}])).status_code,
+                    (await client.send_documents([{'id': 1}], update=True)).status_code)
+
+    assert asyncio.run(run()) == ({1: "T1", 9: None}, {2: {'id': 2, 'fields': []}, 9: None}, 201, 202)
+
+
+def test_async_export_fetches_unseen_template_details_together(tmp_path, monkeypatch):
+    pytest.importorskip("httpx")
+    monkeypatch.setattr(alation_api, "_clients", {})
+    monkeypatch.setattr(services, "registry", template_registry.TemplateRegistry())
+    monkeypatch.setattr(services, "app_settings", {"async_http": True})
+    with MockAlation(folders=10, hubs=1, templates=4) as mock:
+        monkeypatch.setattr(services, "cache", metadata_cache.MetadataCache(str(tmp_path / "c.sqlite3"), mock.url))
+        assert alation_api.refresh_api_token(mock.url, "1", "refresh")
+        services.template_info(mock.url, 1)  # Already known: neither client asks for it again.
+        result = services.export_templates(mock.url, [1, 2, 3, 4], str(tmp_path / "out"), formats=('csv',))
+        alation_api.close_client(mock.url)
+    assert len(result['written']) == 4 and not result['failed']
+    assert services.registry.get(3, need_details=True).title == "Template 3"
+    assert mock.requests["GET integration/v1/custom_template/{id}"] == 4
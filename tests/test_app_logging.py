@@ -0,0 +1,29 @@
+#/tests/test_app_logging.py
+import logging
+
+import app_logging
+
+
+def test_queued_records_are_drained_in_batches():
+    app_logging.configure()
+    log_queue = app_logging.attach_queue()
+    logger = app_logging.get_logger("test")
+    for i in range(5):
+        logger.info(f"line {i}")
+    logger.error("boom")
+    assert app_logging.drain(log_queue, max_records=4) == ["INFO: line 0", "INFO: line 1", "INFO: line 2",
+                                                           "INFO: line 3"]
+    assert app_logging.drain(log_queue) == ["INFO: line 4", "ERROR: boom"]
+    assert app_logging.drain(log_queue) == []
+    app_logging.configure()
+
+
+def test_file_handler_rotates(tmp_path):
+    log_file = tmp_path / "apt2.log"
+    app_logging.configure(level=logging.DEBUG, log_file=str(log_file), max_bytes=200, backup_count=2)
+    logger = app_logging.get_logger("test")
+    for i in range(20):
+        logger.debug(f"message number {i}")
+    app_logging.configure()
+    assert (tmp_path / "apt2.log.1").exists() and not (tmp_path / "apt2.log.3").exists()
+    assert "message number 19" in log_file.read_text()
@@ -0,0 +1,86 @@
+#/tests/test_app_logic.py
+from types import SimpleNamespace
+
+import app_logic
+import services
+
+
+class FakeTree:
+    """The slice of ttk.Treeview the folder handlers use."""
+
+    def __init__(self):
+        self.items = {'': {'children': [], 'text': None}}
+        self.focused = None
+
+    def insert(self, parent, index, iid, text):
+        self.items[iid] = {'parent': parent, 'children': [], 'text': text}
+        self.items[parent]['children'].append(iid)
+        return iid
+
+    def exists(self, iid):
+        return iid in self.items
+
+    def delete(self, iid):
+        for child in list(self.items[iid]['children']):
+            self.delete(child)
+        self.items[self.items[iid]['parent']]['children'].remove(iid)
+        del self.items[iid]
+
+    def item(self, iid, **options):
+        self.items[iid].update(options)
+
+    def selection_set(self, iid):
+        self.selected = iid
+
+    def focus(self, iid=None):
+        if iid is None: return self.focused
+        self.focused = iid
+
+    def see(self, iid):
+        pass
+
+
+def hub_tree(hub_id=1):
+    """A tree showing the top level of a hub, as on_hub_selected leaves it."""
+    tree = FakeTree()
+    app_logic.build_folder_tree(tree, '', hub_id, None)
+    return tree
+
+
+def make_window(query, hub_id=1):
+    return SimpleNamespace(folder_tree=hub_tree(hub_id), folder_search_entry=SimpleNamespace(get=lambda: query),
+                           hub_combobox=SimpleNamespace(get=lambda: str(hub_id)))
+
+
+def test_tree_materialises_one_level_and_reveals_only_ancestors(folder, monkeypatch):
+    monkeypatch.setattr(services, "app_data", services.AppData())
+    services.app_data.add_folders([folder(1, 'Root'), folder(2, 'Mid', parent_id=1), folder(3, 'Leaf', parent_id=2),
+                                   folder(4, 'Sibling', parent_id=1), folder(5, 'Other root')])
+    window = make_window("")
+    tree = window.folder_tree
+    assert tree.items['']['children'] == [1, 5]
+    assert tree.items[1]['children'] == [f"{app_logic.PLACEHOLDER_PREFIX}1"]
+    app_logic.reveal_folder(window, 3)
+    assert tree.items[1]['children'] == [2, 4] and tree.items[2]['children'] == [3]
+    assert not tree.exists(f"{app_logic.PLACEHOLDER_PREFIX}2") and tree.focused == 3
+
+
+def test_find_folder_follows_refetches_and_syncs(folder, monkeypatch):
+    monkeypatch.setattr(app_logic, "_search_state", dict(app_logic._search_state))
+    monkeypatch.setattr(services, "app_data", services.AppData())
+    services.app_data.add_folders([folder(1, 'Sales'), folder(2, 'Sales EU')])
+    window = make_window("sales")
+    app_logic.find_folder(window)
+    app_logic.find_folder(window)
+    assert window.folder_tree.focused == 2
+    # A re-fetch drops folder 2; the same search must not look it up again.
+    services.reset_app_data([services.FolderRecord.from_api(folder(1, 'Sales'))])
+    window.folder_tree = hub_tree()
+    app_logic.find_folder(window)
+    assert window.folder_tree.focused == 1
+    # A sync adds a matching folder; the next search finds it.
+    services.app_data.apply_changes([services.FolderRecord.from_api(folder(3, 'Sales US'))], [])
+    window.folder_tree = hub_tree()
+    app_logic.find_folder(window)
+    app_logic.find_folder(window)
+    assert window.folder_tree.focused == 3
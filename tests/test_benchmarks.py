@@ -0,0 +1,34 @@
+#/tests/test_benchmarks.py
+import alation_api
+from benchmarks import run
+from benchmarks.mock_alation import MockAlation
+
+
+def test_mock_pages_through_capped_limits_and_next_page_headers(monkeypatch):
+    monkeypatch.setattr(alation_api, "_clients", {})
+    for next_page_header in (False, True):
+        with MockAlation(folders=95, hubs=3, page_cap=20, next_page_header=next_page_header) as mock:
+            assert alation_api.refresh_api_token(mock.url, "1", "refresh")
+            ids = [f['id'] for page in alation_api.iter_folder_pages(mock.url, page_size=50) for f in page]
+            hub_docs = alation_api.get_documents(mock.url, 2, 5)
+            alation_api.close_client(mock.url)
+        assert ids == list(range(1, 96))
+        assert [d['folder_ids'] for d in hub_docs] == [[5]] * 3
+        assert mock.folder(5)['parent_folder_id'] == 2 and mock.folder(2)['parent_folder_id'] is None
+
+
+def test_harness_reports_every_scenario_and_flags_regressions(monkeypatch):
+    for name in ("CONFIG_FILE", "app_settings", "app_data", "cache"):
+        monkeypatch.setattr(run.services, name, getattr(run.services, name))
+    monkeypatch.setattr(alation_api, "_clients", {})
+    args = run.build_parser().parse_args(["--folders", "200", "--repeat", "1", "--clicks", "3", "--templates", "3",
+                                          "--changed", "5"])
+    report = run.run(args)
+    assert set(report['results']) - {'hub_crawl_async'} == {
+        'refresh', 'delta_sync', 'hub_switch', 'folder_click_cold', 'folder_click_warm', 'hub_crawl_threads',
+        'template_export', 'decode_page', 'decode_page_baseline'}
+    assert report['results']['refresh']['throughput'] > 0
+    slower = {'results': {name: dict(result, p50_ms=result['p50_ms'] * 2 + 1)
+                          for name, result in report['results'].items()}}
+    assert run.compare(report, report, 0.2) == []
+    assert [r['scenario'] for r in run.compare(slower, report, 0.2)] == list(report['results'])
@@ -0,0 +1,43 @@
+#/tests/test_cli.py
+import json
+import subprocess
+import sys
+
+import apt2
+
+
+def test_cli_never_imports_tkinter():
+    code = "import sys, apt2; sys.exit('tkinter' in sys.modules)"
+    assert subprocess.run([sys.executable, "-c", code]).returncode == 0
+
+
+def test_missing_config_reports_json_error(tmp_path, capsys, monkeypatch):
+    monkeypatch.setattr(apt2.services, "CONFIG_FILE", apt2.services.CONFIG_FILE)
+    exit_code = apt2.main(["--config", str(tmp_path / "missing.json"), "hubs"])
+    result = json.loads(capsys.readouterr().out)
+    assert exit_code == apt2.EXIT_NOT_CONFIGURED
+    assert result['command'] == "hubs" and "missing" in result['error']
+
+
+def test_hubs_are_listed_from_the_cache(tmp_path, capsys, monkeypatch):
+    config = tmp_path / "config.json"
+    config.write_text(json.dumps({"alation_url": "https://a.example.com", "user_id": "1", "refresh_token": "t"}))
+    monkeypatch.setattr(apt2.services, "CONFIG_FILE", str(config))
+    apt2.services.prepare_connection()
+    apt2.services.cache.replace_folders([{'id': 1, 'title': 'A', 'document_hub_id': 3, 'parent_folder_id': None},
+                                         {'id': 2, 'title': 'B', 'document_hub_id': 3, 'parent_folder_id': 1}])
+    capsys.readouterr()
+    assert apt2.main(["--config", str(config), "hubs"]) == apt2.EXIT_OK
+    assert json.loads(capsys.readouterr().out) == {'hubs': [{'id': 3, 'folders': 2}], 'command': 'hubs'}
+
+
+def test_profiled_commands_are_saved_under_the_command_name(tmp_path, capsys, monkeypatch):
+    config = tmp_path / "config.json"
+    config.write_text(json.dumps({"alation_url": "https://a.example.com", "user_id": "1", "refresh_token": "t"}))
+    monkeypatch.setattr(apt2.services, "CONFIG_FILE", str(config))
+    monkeypatch.setattr(apt2.instrumentation, "_profile_stats", {})
+    apt2.services.prepare_connection()
+    apt2.services.cache.replace_folders([{'id': 1, 'title': 'A', 'document_hub_id': 3, 'parent_folder_id': None}])
+    assert apt2.main(["--config", str(config), "--profile", str(tmp_path / "prof"), "hubs"]) == apt2.EXIT_OK
+    assert [profile.name for profile in (tmp_path / "prof").iterdir()] == ["hubs.prof"]
+    assert apt2.instrumentation._profile_dir is None
@@ -0,0 +1,176 @@
+#/tests/test_document_uploader.py
+import csv
+import zipfile
+
+import alation_api
+import document_uploader
+import template_generator
+
+DETAILS = {'title': 'Term', 'fields': [{'id': 11, 'name_singular': 'Owner'}, {'id': 12, 'name_singular': 'Notes'}]}
+
+
+class FakeResponse:
+    def __init__(self, status_code, payload=None):
+        self.status_code = status_code
+        self._payload = payload
+        self.headers = {}
+        self.text = str(payload)
+
+    def json(self):
+        return self._payload
+
+
+def write_csv(path, rows):
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(['Title', 'Owner', 'Notes', 'id'])
+        writer.writerows(rows)
+
+
+def test_row_to_document_maps_fields_and_skips_blanks():
+    field_map = document_uploader.build_field_map(DETAILS)
+    document = document_uploader.row_to_document({'Title': ' A ', 'owner': 'me', 'Notes': '', 'id': '7.0'},
+                                                 field_map, 5, 9, 1)
+    assert document == {'template_id': 5, 'document_hub_id': 1, 'folder_ids': [9], 'id': 7, 'title': 'A',
+                        'custom_fields': [{'field_id': 11, 'value': 'me'}]}
+
+
+def test_cells_are_converted_by_field_type():
+    field_map = document_uploader.build_field_map({'fields': [
+        {'id': 1, 'name_singular': 'Status', 'field_type': 'PICKER', 'options': ['Draft', 'Approved']},
+        {'id': 2, 'name_singular': 'Tags', 'field_type': 'MULTI_PICKER'},
+        {'id': 3, 'name_singular': 'Review', 'field_type': 'DATE'},
+        {'id': 4, 'name_singular': 'Stewards', 'field_type': 'OBJECT_SET', 'allowed_otypes': ['user']}]})
+    document = document_uploader.row_to_document(
+        {'Status': 'Approved', 'Tags': 'pii; finance;', 'Review': '45658', 'Stewards': '12; groupprofile:3'},
+        field_map, 5, 9, 1)
+    assert document['custom_fields'] == [
+        {'field_id': 1, 'value': 'Approved'}, {'field_id': 2, 'value': ['pii', 'finance']},
+        {'field_id': 3, 'value': '2025-01-01T00:00:00Z'},
+        {'field_id': 4, 'value': [{'otype': 'user', 'oid': 12}, {'otype': 'groupprofile', 'oid': 3}]}]
+    assert document_uploader.field_value(field_map['review'], '2025-01-01') == '2025-01-01T00:00:00Z'
+    for column, value in (('Status', 'Retired'), ('Review', 'soon'), ('Stewards', 'ann')):
+        try:
+            document_uploader.row_to_document({column: value}, field_map, 5, 9, 1)
+        except ValueError as e:
+            assert column in str(e)
+        else:
+            raise AssertionError(f"expected ValueError for {column}={value}")
+
+
+def test_xlsx_rows_round_trip_through_template_writer(tmp_path):
+    path = str(tmp_path / "upload.xlsx")
+    with template_generator.XlsxWriter(path) as writer:
+        writer.write_row(['Title', 'Owner'])
+        writer.write_row(['First', 'ann'])
+        writer.write_row(['', ''])
+        writer.write_row(['Second'])
+    assert list(document_uploader.iter_rows(path)) == [{'Title': 'First', 'Owner': 'ann'},
+                                                       {'Title': 'Second', 'Owner': ''}]
+
+
+def test_dates_are_read_as_serials_only_from_numeric_cells_or_non_dates(tmp_path):
+    path = str(tmp_path / "upload.xlsx")
+    ns = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'
+    with zipfile.ZipFile(path, 'w') as zf:
+        zf.writestr('xl/worksheets/sheet1.xml', f'<worksheet xmlns="{ns}"><sheetData>'
+                    '<row r="1"><c r="A1" t="inlineStr"><is><t>Review</t></is></c></row>'
+                    '<row r="2"><c r="A2"><v>45658</v></c></row>'
+                    '<row r="3"><c r="A3" t="inlineStr"><is><t>2024</t></is></c></row></sheetData></worksheet>')
+    field_map = document_uploader.build_field_map({'fields': [{'id': 3, 'name_singular': 'Review',
+                                                                'field_type': 'DATE'}]})
+    values = [document_uploader.row_to_document(row, field_map, 5, 9, 1)['custom_fields'][0]['value']
+              for row in document_uploader.iter_rows(path)]
+    assert values == ['2025-01-01T00:00:00Z', '2024-01-01T00:00:00Z']
+    assert document_uploader.field_value(field_map['review'], '2024-05') == '2024-05-01T00:00:00Z'
+    assert document_uploader.field_value(field_map['review'], '45658.5') == '2025-01-01T12:00:00Z'
+
+
+def test_upload_batches_and_resumes_from_journal(tmp_path, monkeypatch):
+    path = str(tmp_path / "upload.csv")
+    write_csv(path, [[f'Doc {i}', 'ann', '', ''] for i in range(5)] + [['Existing', 'bob', 'n', '42']])
+    sent = []
+
+    def failing_send(url, documents, update=False):
+        sent.append((update, [d.get('title') for d in documents]))
+        return FakeResponse(500 if documents[0]['title'] == 'Doc 2' else 202, {'job_id': len(sent)})
+
+    monkeypatch.setattr(alation_api, "send_documents", failing_send)
+    monkeypatch.setattr(alation_api, "get_job_status", lambda url, job_id: {'status': "successful"})
+    summary = document_uploader.upload_documents("https://a.example.com", path, DETAILS, 5, 9, 1,
+                                                 batch_size=2, concurrency=2, rate_limit=0)
+    assert summary['batches'] == 4 and summary['committed'] == 3 and summary['failed'] == ['create-1']
+    assert (True, ['Existing']) in sent
+
+    sent.clear()
+    monkeypatch.setattr(alation_api, "send_documents",
+                        lambda url, documents, update=False: sent.append(documents) or FakeResponse(201, {}))
+    summary = document_uploader.upload_documents("https://a.example.com", path, DETAILS, 5, 9, 1,
+                                                 batch_size=2, concurrency=2, rate_limit=0)
+    assert summary['skipped'] == 3 and summary['committed'] == 1 and not summary['failed']
+    assert [[d['title'] for d in batch] for batch in sent] == [['Doc 2', 'Doc 3']]
+
+
+def test_journal_from_another_run_is_refused(tmp_path):
+    journal_path = str(tmp_path / "upload.csv.journal")
+    document_uploader.UploadJournal(journal_path, {'file': 'a'}).close()
+    try:
+        document_uploader.UploadJournal(journal_path, {'file': 'b'})
+    except document_uploader.UploadError:
+        pass
+    else:
+        raise AssertionError("expected UploadError")
+
+
+def test_bad_rows_are_reported_and_202_jobs_are_committed_only_when_they_succeed(tmp_path, monkeypatch):
+    path = str(tmp_path / "upload.csv")
+    write_csv(path, [['Doc 0', 'ann', '', ''], ['Bad', 'bob', '', 'abc'], ['Doc 1', 'cy', '', '']])
+    monkeypatch.setattr(document_uploader, "JOB_POLL_INTERVAL", 0)
+    monkeypatch.setattr(document_uploader, "JOB_TIMEOUT", 0)
+    jobs, sent = {}, []
+
+    def send(url, documents, update=False):
+        sent.append([d['title'] for d in documents])
+        return FakeResponse(202, {'job_id': len(sent)})
+
+    monkeypatch.setattr(alation_api, "send_documents", send)
+    monkeypatch.setattr(alation_api, "get_job_status", lambda url, job_id: {'status': jobs.get(job_id, "running")})
+    upload = lambda: document_uploader.upload_documents("https://a.example.com", path, DETAILS, 5, 9, 1,
+                                                        batch_size=10, concurrency=1, rate_limit=0)
+    summary = upload()
+    assert [row for row, error in summary['invalid_rows']] == [3] and "'id'" in summary['invalid_rows'][0][1]
+    assert summary['pending'] == ['create-0'] and summary['committed'] == 0 and sent == [['Doc 0', 'Doc 1']]
+
+    jobs[1] = "failed"  # The resume polls the pending job, finds it failed and sends the batch again.
+    jobs[2] = "successful"
+    summary = upload()
+    assert summary['committed'] == 1 and not summary['pending'] and len(sent) == 2
+    assert upload()['skipped'] == 1 and len(sent) == 2
+
+
+def test_journal_of_an_edited_file_is_refused(tmp_path, monkeypatch):
+    path = str(tmp_path / "upload.csv")
+    write_csv(path, [['Doc 0', 'ann', '', '']])
+    monkeypatch.setattr(alation_api, "send_documents", lambda url, documents, update=False: FakeResponse(201, {}))
+    document_uploader.upload_documents("https://a.example.com", path, DETAILS, 5, 9, 1, rate_limit=0)
+    write_csv(path, [['Doc 0', 'changed', '', '']])
+    try:
+        document_uploader.upload_documents("https://a.example.com", path, DETAILS, 5, 9, 1, rate_limit=0)
+    except document_uploader.UploadError as e:
+        assert "has changed" in str(e)
+    else:
+        raise AssertionError("expected UploadError")
+
+
+def test_journal_of_a_changed_template_is_refused(tmp_path, monkeypatch):
+    path = str(tmp_path / "upload.csv")
+    write_csv(path, [['Doc 0', 'ann', '', '']])
+    monkeypatch.setattr(alation_api, "send_documents", lambda url, documents, update=False: FakeResponse(201, {}))
+    document_uploader.upload_documents("https://a.example.com", path, DETAILS, 5, 9, 1, rate_limit=0)
+    changed = {'fields': [dict(DETAILS['fields'][0], field_type='PICKER', options=['ann']), DETAILS['fields'][1]]}
+    try:
+        document_uploader.upload_documents("https://a.example.com", path, changed, 5, 9, 1, rate_limit=0)
+    except document_uploader.UploadError as e:
+        assert "fields of template 5 have changed" in str(e)
+    else:
+        raise AssertionError("expected UploadError")
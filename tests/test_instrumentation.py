@@ -0,0 +1,74 @@
+#/tests/test_instrumentation.py
+import json
+import pstats
+
+import instrumentation
+from test_alation_api import FakeResponse, make_client
+
+
+def test_endpoints_are_normalised_and_aggregated():
+    registry = instrumentation.Registry()
+    registry.record("get", "https://a.example.com/integration/v1/custom_template/12/?x=1", 200, 0.02, 100)
+    registry.record("GET", "/integration/v1/custom_template/7/", 503, 0.3, 10, retries=2)
+    registry.record("GET", "/integration/v1/custom_template/7/", instrumentation.NETWORK_ERROR, 40.0)
+    [((method, endpoint), stats)] = registry.snapshot()
+    assert (method, endpoint) == ("GET", "/integration/v1/custom_template/{id}/")
+    assert (stats['calls'], stats['errors'], stats['bytes'], stats['retries']) == (3, 2, 110, 2)
+    assert stats['statuses'] == {'200': 1, '503': 1, 'error': 1}
+    assert stats['buckets']['0.025'] == 1 and stats['buckets']['+Inf'] == 1
+    assert 0.01 < stats['p50_s'] <= 0.5 and stats['p99_s'] <= 40.0
+    prometheus = registry.to_prometheus()
+    labels = 'method="GET",endpoint="/integration/v1/custom_template/{id}/"'
+    assert f'apt2_api_request_duration_seconds_bucket{{{labels},le="+Inf"}} 3' in prometheus
+    assert f'apt2_api_requests_total{{{labels},status="503"}} 1' in prometheus
+    assert json.loads(json.dumps(registry.to_json()))['endpoints'][0]['calls'] == 3
+
+
+def test_client_records_calls_and_counts_401_replays_as_retries(monkeypatch):
+    monkeypatch.setattr(instrumentation, "registry", instrumentation.Registry())
+    client, calls = make_client(monkeypatch, [FakeResponse(401), FakeResponse(200, [])],
+                                [FakeResponse(201, {'api_access_token': 'new-token'})])
+    client.get("/integration/v2/folder/")
+    stats = {key: value for key, value in instrumentation.registry.snapshot()}
+    folder = stats[("GET", "/integration/v2/folder/")]
+    assert folder['statuses'] == {'401': 1, '200': 1} and folder['retries'] == 1
+    assert stats[("POST", "/integration/v1/createAPIAccessToken/")]['calls'] == 1
+
+
+def test_profiled_handlers_accumulate_stats_only_when_enabled(tmp_path, monkeypatch):
+    monkeypatch.setattr(instrumentation, "_profile_stats", {})
+
+    @instrumentation.profiled
+    def handler(value):
+        return value * 2
+
+    assert handler(1) == 2 and not list(tmp_path.iterdir())
+    instrumentation.enable_profiling(str(tmp_path))
+    try:
+        handler(2); handler(3)
+    finally:
+        instrumentation.enable_profiling(None)
+    [profile] = tmp_path.iterdir()
+    assert profile.name.endswith("handler.prof")
+    assert pstats.Stats(str(profile)).total_calls >= 2
+
+
+def test_nested_profiled_calls_are_profiled_once_and_named_safely(tmp_path, monkeypatch):
+    monkeypatch.setattr(instrumentation, "_profile_stats", {})
+    inner = instrumentation.profiled(lambda value: value + 1)
+
+    @instrumentation.profiled
+    def outer(value):
+        return inner(value) * 2
+
+    instrumentation.enable_profiling(str(tmp_path))
+    try:
+        assert outer(1) == 4 and inner(1) == 2
+        monkeypatch.setattr(instrumentation, "_profile_dir", str(tmp_path / "missing"))
+        assert outer(2) == 6  # A profile that cannot be written is logged, not raised.
+    finally:
+        instrumentation.enable_profiling(None)
+    prefix = "test_instrumentation.test_nested_profiled_calls_are_profiled_once_and_named_safely._locals_."
+    line = inner.__wrapped__.__code__.co_firstlineno
+    assert sorted(profile.name for profile in tmp_path.iterdir()) == [f"{prefix}_lambda_.L{line}.prof",
+                                                                       f"{prefix}outer.prof"]
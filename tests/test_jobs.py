@@ -0,0 +1,58 @@
+#/tests/test_jobs.py
+import threading
+
+import jobs
+
+
+class FakeRoot:
+    """Stands in for Tk: after() callbacks run only when pump() is called."""
+
+    def __init__(self):
+        self.pending = []
+
+    def after(self, ms, callback):
+        self.pending.append(callback)
+
+    def pump(self):
+        pending, self.pending = self.pending, []
+        for callback in pending:
+            callback()
+
+
+def run_until_idle(root, scheduler):
+    for _ in range(200):
+        root.pump()
+        if not scheduler.in_flight:
+            return
+        threading.Event().wait(0.01)
+    raise AssertionError("jobs did not finish")
+
+
+def test_results_and_errors_are_delivered_on_drain():
+    root, busy, results = FakeRoot(), [], []
+    scheduler = jobs.JobScheduler(root, on_busy_changed=busy.append)
+    scheduler.submit(lambda job, x: x * 2, 21, on_success=results.append)
+    scheduler.submit(lambda job: 1 / 0, on_error=lambda e: results.append(type(e).__name__))
+    run_until_idle(root, scheduler)
+    assert sorted(map(str, results)) == ['42', 'ZeroDivisionError']
+    assert busy[0] == 1 and busy[-1] == 0
+    scheduler.shutdown()
+
+
+def test_resubmitting_a_key_cancels_the_stale_job():
+    root, results = FakeRoot(), []
+    release = threading.Event()
+    scheduler = jobs.JobScheduler(root)
+
+    def first(job):
+        release.wait(1)
+        job.post(results.append, 'stale progress')
+        return 'stale'
+
+    stale = scheduler.submit(first, key='folder', on_success=results.append)
+    scheduler.submit(lambda job: 'fresh', key='folder', on_success=results.append)
+    release.set()
+    run_until_idle(root, scheduler)
+    assert stale.cancelled
+    assert results == ['fresh']
+    scheduler.shutdown()
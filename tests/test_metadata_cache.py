@@ -0,0 +1,39 @@
+#/tests/test_metadata_cache.py
+import metadata_cache
+
+
+def test_folders_round_trip_and_freshness(tmp_path):
+    cache = metadata_cache.MetadataCache(str(tmp_path / "cache.sqlite3"), "https://a.example.com")
+    assert cache.load_folders() == []
+    assert not cache.folders_are_fresh()
+    cache.replace_folders([{'id': 2, 'title': 'B', 'document_hub_id': 1, 'parent_folder_id': None, 'extra': 'x'},
+                           {'id': 1, 'title': 'A', 'document_hub_id': 1, 'parent_folder_id': 2}])
+    assert cache.load_folders() == [{'id': 1, 'title': 'A', 'document_hub_id': 1, 'parent_folder_id': 2},
+                                    {'id': 2, 'title': 'B', 'document_hub_id': 1, 'parent_folder_id': None}]
+    assert cache.folders_are_fresh()
+    assert not cache.folders_are_fresh(ttl=0)
+
+
+def test_entries_keep_validators_and_are_cleared_for_another_instance(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    cache = metadata_cache.MetadataCache(path, "https://a.example.com")
+    cache.put_entry(metadata_cache.KIND_TEMPLATE_TITLE, 5, {'title': 'T'}, etag='"v1"')
+    entry = cache.get_entry(metadata_cache.KIND_TEMPLATE_TITLE, 5)
+    assert entry.payload == {'title': 'T'} and entry.etag == '"v1"'
+    assert metadata_cache.MetadataCache.is_fresh(entry, ttl=60)
+    cache.close()
+
+    other = metadata_cache.MetadataCache(path, "https://b.example.com")
+    assert other.get_entry(metadata_cache.KIND_TEMPLATE_TITLE, 5) is None
+
+
+def test_folder_changes_merge_sync_marks_and_drop_deleted_documents(tmp_path):
+    cache = metadata_cache.MetadataCache(str(tmp_path / "cache.sqlite3"), "https://a.example.com")
+    cache.replace_folders([{'id': 1, 'title': 'A', 'document_hub_id': 1}, {'id': 2, 'title': 'B', 'document_hub_id': 2}],
+                          sync_marks={1: "2026-01-01T00:00:00+00:00", 2: "2026-01-01T00:00:00+00:00"})
+    cache.put_entry(metadata_cache.KIND_DOCUMENTS, 2, [{'id': 9}])
+    cache.apply_folder_changes([{'id': 1, 'title': 'A2', 'document_hub_id': 1}], [2],
+                               sync_marks={1: "2026-02-01T00:00:00+00:00"})
+    assert cache.load_folders() == [{'id': 1, 'title': 'A2', 'document_hub_id': 1, 'parent_folder_id': None}]
+    assert cache.get_entry(metadata_cache.KIND_DOCUMENTS, 2) is None
+    assert cache.load_sync_marks() == {1: "2026-02-01T00:00:00+00:00", 2: "2026-01-01T00:00:00+00:00"}
@@ -0,0 +1,162 @@
+#/tests/test_services.py
+import json
+
+import metadata_cache
+import services
+import template_registry
+
+
+def test_folder_records_are_slotted_and_indexed_by_hub_and_parent(folder):
+    record = services.FolderRecord.from_api({'id': 9, 'title': None, 'document_hub_id': 2, 'parent_folder_id': 1,
+                                             'description': 'dropped'})
+    assert not hasattr(record, '__dict__') and record.title == 'Untitled Folder'
+    assert record.as_api_dict() == {'id': 9, 'title': 'Untitled Folder', 'document_hub_id': 2, 'parent_folder_id': 1}
+
+    app_data = services.AppData()
+    assert app_data.add_folders([folder(1, 'Root'), folder(2, 'Child', parent_id=1), record]) == {1, 2}
+    assert app_data.add_folders([folder(1, 'Duplicate'), folder(3, 'Sibling', parent_id=1)]) == set()
+    assert app_data.id_to_title_map == {1: 'Root', 2: 'Child', 9: 'Untitled Folder', 3: 'Sibling'}
+    assert list(app_data.folders_by_hub[1]) == [1, 2, 3] and app_data.doc_hubs[2] == "Hub ID: 2"
+    assert [f.id for f in app_data.children(1, 1)] == [2, 3] and [f.id for f in app_data.children(2, 1)] == [9]
+    assert not app_data.children(1, 2) and app_data.folder_count == 4
+
+    version = app_data.version
+    app_data.remove_folder(record)
+    assert app_data.version == version + 1 and app_data.folder_count == 3
+    assert 2 not in app_data.folders_by_hub and 2 not in app_data.doc_hubs and (2, 1) not in app_data.children_by_parent
+
+
+def test_apply_changes_patches_indexes_in_place(folder):
+    app_data = services.AppData()
+    app_data.add_folders([folder(1, 'Root'), folder(2, 'Child', parent_id=1), folder(3, 'Other', hub_id=2)])
+    records = [services.FolderRecord.from_api(f) for f in (folder(2, 'Moved'), folder(1, 'Root'), folder(4, 'New'))]
+    diff = app_data.apply_changes(records, deleted_ids=[3])
+    assert [r.id for r in diff['added']] == [4] and [r.id for r in diff['deleted']] == [3]
+    assert [(old.title, new.title) for old, new in diff['updated']] == [('Child', 'Moved')]
+    assert diff['removed_hub_ids'] == {2} and 2 not in app_data.doc_hubs
+    assert not app_data.children(1, 1) and (1, 1) not in app_data.children_by_parent
+    assert [f.id for f in app_data.children(1, None)] == [1, 2, 4]
+
+
+def test_incremental_sync_filters_by_hub_mark_and_invalidates_documents(folder, tmp_path, monkeypatch):
+    cache = metadata_cache.MetadataCache(str(tmp_path / "cache.sqlite3"), "https://a.example.com")
+    cache.replace_folders([folder(1, 'A'), folder(2, 'B')], sync_marks={1: "2026-03-01T12:00:00+00:00"})
+    cache.put_entry(metadata_cache.KIND_DOCUMENTS, 1, [])
+    monkeypatch.setattr(services, "cache", cache)
+    monkeypatch.setattr(services, "app_data", services.AppData())
+    services.load_cached_folders()
+    requested = []
+
+    def folder_pages(url, params=None):
+        requested.append(params)
+        yield [folder(1, 'A', ts_updated="2026-03-01T10:00:00Z"), folder(3, 'C', ts_updated="2026-03-01T13:00:00Z")]
+
+    def document_pages(url, params=None):
+        yield [{'id': 7, 'document_hub_id': 1, 'folder_ids': [1], 'ts_updated': "2026-03-01T12:30:00Z"}]
+
+    monkeypatch.setattr(services.alation_api, "iter_folder_pages", folder_pages)
+    monkeypatch.setattr(services.alation_api, "iter_document_pages", document_pages)
+    counts = services.sync_folders("https://a.example.com", sweep_deletions=True)
+    assert requested == [None]
+    assert counts == {'added': 1, 'updated': 0, 'deleted': 1, 'documents_changed': 1, 'document_lists_invalidated': 1}
+    assert sorted(services.app_data.folders_by_id) == [1, 3]
+    assert cache.get_entry(metadata_cache.KIND_DOCUMENTS, 1) is None
+    assert [f['id'] for f in cache.load_folders()] == [1, 3]
+
+    services.sync_folders("https://a.example.com")
+    assert list(requested[1]) == [services.alation_api.MODIFIED_SINCE_PARAM]
+
+
+def test_unreadable_sync_mark_falls_back_to_a_sweep(folder, tmp_path, monkeypatch):
+    cache = metadata_cache.MetadataCache(str(tmp_path / "cache.sqlite3"), "https://a.example.com")
+    cache.replace_folders([folder(1, 'A'), folder(2, 'B', hub_id=2)],
+                          sync_marks={1: "2026-03-01T12:00:00+00:00", 2: "not a timestamp"})
+    cache.put_entry(metadata_cache.KIND_DOCUMENTS, 1, [])
+    monkeypatch.setattr(services, "cache", cache)
+    monkeypatch.setattr(services, "app_data", services.AppData())
+    services.load_cached_folders()
+    requested = []
+    monkeypatch.setattr(services.alation_api, "iter_folder_pages",
+                        lambda url, params=None: requested.append(params) or iter([[folder(1, 'A2')]]))
+    counts = services.sync_folders("https://a.example.com")
+    assert requested == [None] and (counts['updated'], counts['deleted']) == (1, 1)
+    assert cache.get_entry(metadata_cache.KIND_DOCUMENTS, 1) is None
+    assert list(cache.load_sync_marks()) == [1] and services.can_sync_incrementally()
+
+
+def test_hub_crawl_indexes_folders_and_answers_clicks_from_memory(folder, monkeypatch):
+    monkeypatch.setattr(services, "cache", None)
+    monkeypatch.setattr(services, "app_data", services.AppData())
+    monkeypatch.setattr(services, "registry", services.template_registry.TemplateRegistry())
+    services.app_data.add_folders([folder(1, 'Root'), folder(2, 'Child', parent_id=1), folder(3, 'Empty')])
+    documents = {1: [{'id': 10, 'template_id': 5}], 2: [{'id': 11, 'template_id': 5}, {'id': 12, 'template_id': 6},
+                                                        {'id': 13}], 3: None}
+    monkeypatch.setattr(services.alation_api, "get_documents", lambda url, hub_id, folder_id, **kw: documents[folder_id])
+    monkeypatch.setattr(services.alation_api, "get_json_conditional",
+                        lambda url, path, **kw: (200, {'title': f"T{path.strip('/').split('/')[-1]}"}, None, None))
+
+    result = services.crawl_hub_templates("https://a.example.com", 1, max_workers=2, rate_limit=None)
+    assert result == {'folders': 2, 'failed': [3], 'templates': 2}
+    assert services.app_data.template_usage(1, 1) == {5: 2, 6: 1}
+    assert services.app_data.template_usage(1, 2) == {5: 1, 6: 1}
+    assert services.indexed_folder_templates(2) == (3, [(5, 'T5'), (6, 'T6')])
+    assert services.indexed_folder_templates(3) is None
+
+
+def test_profiles_refresh_concurrently_and_diff_templates(tmp_path, monkeypatch):
+    from benchmarks.mock_alation import MockAlation
+    monkeypatch.setattr(services.alation_api, "_clients", {})
+    with MockAlation(folders=30, hubs=2) as prod, MockAlation(folders=12, hubs=3, fields_per_template=4) as staging:
+        config = tmp_path / "config.json"
+        config.write_text(json.dumps({"retries": 1, "active_profile": "staging", "profiles": {
+            "prod": {"alation_url": prod.url, "user_id": "1", "refresh_token": "p"},
+            "staging": {"alation_url": staging.url, "user_id": "2", "refresh_token": "s"}}}))
+        monkeypatch.setattr(services, "CONFIG_FILE", str(config))
+        settings = services.load_settings()
+        assert services.profile_settings(settings) == {"retries": 1, "alation_url": staging.url, "user_id": "2",
+                                                       "refresh_token": "s"}
+
+        results = services.refresh_profiles()
+        assert {name: (r['mode'], r['folders'], r['hubs']) for name, r in results.items()} == {
+            'prod': ("full", 30, 2), 'staging': ("full", 12, 3)}
+        assert services.refresh_profiles(["prod"])['prod']['mode'] == "cache"
+        assert services.cache_path("prod") != services.cache_path("staging")
+
+        settings['profiles']['broken'] = {"alation_url": "http://127.0.0.1:9"}  # No credentials.
+        config.write_text(json.dumps(settings))
+        comparison = services.compare_templates([1])
+        template = comparison['templates'][0]
+        assert comparison['profiles'] == ['prod', 'staging'] and list(comparison['errors']) == ['broken']
+        assert template['id'] == 1 and not template['identical']
+        assert template['missing'] == {'staging': sorted(f"Field {i}" for i in range(4, 15))}
+        for mock in (prod, staging):
+            services.alation_api.close_client(mock.url)
+
+
+def test_jobs_keep_writing_to_the_profile_they_were_started_for(tmp_path, monkeypatch):
+    monkeypatch.setattr(services, "CONFIG_FILE", str(tmp_path / "config.json"))
+    monkeypatch.setattr(services.alation_api, "_clients", {})
+    old_cache = metadata_cache.MetadataCache(str(tmp_path / "old.sqlite3"), "https://old.example.com")
+    monkeypatch.setattr(services, "cache", old_cache)
+    monkeypatch.setattr(services, "app_data", services.AppData())
+    monkeypatch.setattr(services, "registry", template_registry.TemplateRegistry())
+    monkeypatch.setattr(services, "app_settings", {"alation_url": "https://old.example.com"})
+    monkeypatch.setattr(services, "active_profile", "old")
+    started = services.current_profile()
+    # The switch replaces every piece of active state before the job gets to run.
+    monkeypatch.setattr(services, "active_profile", "new")
+    services.open_cache("https://new.example.com")
+    monkeypatch.setattr(services, "app_data", services.AppData())
+    monkeypatch.setattr(services, "registry", template_registry.TemplateRegistry())
+    clients = []
+    monkeypatch.setattr(services.alation_api, "get_documents",
+                        lambda api, hub_id, folder_id, **kw: clients.append(api) or [{'id': 10, 'template_id': 5}])
+    monkeypatch.setattr(services.alation_api, "get_json_conditional",
+                        lambda api, path, **kw: clients.append(api) or (200, {'title': "Old T5"}, None, None))
+
+    assert services.folder_templates("https://old.example.com", 1, 1, profile=started)[1] == [(5, "Old T5")]
+    assert clients == [started.client] * 2 and started.client is services.alation_api.get_client("https://old.example.com")
+    assert old_cache.get_entry(metadata_cache.KIND_DOCUMENTS, 1)  # Still open after the switch.
+    assert services.cache.get_entry(metadata_cache.KIND_DOCUMENTS, 1) is None
+    assert started.app_data.template_usage_by_folder == {1: {5: 1}} and not services.app_data.template_usage_by_folder
+    assert started.registry.get(5).title == "Old T5" and services.registry.get(5) is None
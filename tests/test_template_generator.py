@@ -1 +1,68 @@
 #/tests/test_template_generator.py
+import csv
+import os
+import zipfile
+import xml.etree.ElementTree as ET
+
+import template_generator
+
+NS = {'s': 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'}
+FIELDS = [{'id': 11, 'name_singular': 'Owner', 'field_type': 'OBJECT_SET'},
+          {'id': 12, 'name_singular': 'Notes & <Links>', 'field_type': 'RICH_TEXT'}]
+
+
+def read_xlsx_rows(path):
+    with zipfile.ZipFile(path) as zf:
+        root = ET.fromstring(zf.read('xl/worksheets/sheet1.xml'))
+    return [[cell.findtext('s:is/s:t', namespaces=NS) for cell in row.findall('s:c', NS)]
+            for row in root.iter('{%s}row' % NS['s'])]
+
+
+def test_template_fields_prepends_title():
+    fields = template_generator.template_fields({'fields': FIELDS})
+    assert [f['name_singular'] for f in fields] == ['Title', 'Owner', 'Notes & <Links>']
+
+
+def test_csv_and_xlsx_templates_have_the_same_header(tmp_path):
+    fields = template_generator.template_fields({'fields': FIELDS})
+    template_generator.write_csv_template(str(tmp_path / "t.csv"), fields)
+    template_generator.write_xlsx_template(str(tmp_path / "t.xlsx"), fields)
+    with open(tmp_path / "t.csv", newline='', encoding='utf-8') as f:
+        csv_header = next(csv.reader(f))
+    assert csv_header == ['Title', 'Owner', 'Notes & <Links>']
+    assert read_xlsx_rows(str(tmp_path / "t.xlsx")) == [csv_header]
+
+
+def test_column_letters():
+    assert [template_generator._column_letter(i) for i in (0, 25, 26, 701, 702)] == ['A', 'Z', 'AA', 'ZZ', 'AAA']
+
+
+def test_xlsx_writer_streams_many_rows_with_escaping(tmp_path):
+    path = str(tmp_path / "big.xlsx")
+    with template_generator.XlsxWriter(path, sheet_name="Upload <All> & " + "x" * 40) as writer:
+        writer.write_row(['Title', 'Notes & <Links>', None])
+        for i in range(1, 5001):
+            writer.write_row([f"Doc {i}", i, ' "quoted" '])
+    rows = read_xlsx_rows(path)
+    assert len(rows) == 5001 and rows[0] == ['Title', 'Notes & <Links>', '']
+    assert rows[-1] == ['Doc 5000', '5000', ' "quoted" ']
+    with zipfile.ZipFile(path) as zf:
+        sheet = ET.fromstring(zf.read('xl/worksheets/sheet1.xml'))
+        [sheet_entry] = ET.fromstring(zf.read('xl/workbook.xml')).iter('{%s}sheet' % NS['s'])
+    assert [cell.get('r') for cell in list(sheet.iter('{%s}row' % NS['s']))[-1]] == ['A5001', 'B5001', 'C5001']
+    assert sheet_entry.get('name') == ("Upload <All> & " + "x" * 40)[:31]
+
+
+def test_export_templates_writes_files_manifest_and_reports_failures(tmp_path):
+    details = {1: {'title': 'Glossary Term', 'fields': FIELDS}, 2: {'title': 'Policy/Rule', 'fields': []}}
+    progress = []
+    result = template_generator.export_templates([2, 1, 3, 1], str(tmp_path), details.get, max_workers=2,
+                                                 on_progress=lambda done, total: progress.append((done, total)))
+    assert result['failed'] == [3]
+    assert sorted(os.path.basename(p) for p in result['written']) == [
+        'Glossary_Term_1.csv', 'Glossary_Term_1.xlsx', 'Policy_Rule_2.csv', 'Policy_Rule_2.xlsx']
+    assert progress[-1] == (3, 3)
+    with open(tmp_path / template_generator.MANIFEST_FILE, newline='', encoding='utf-8') as f:
+        rows = list(csv.DictReader(f))
+    assert sorted((r['template_id'], r['field_name']) for r in rows) == [
+        ('1', 'Notes & <Links>'), ('1', 'Owner'), ('1', 'Title'), ('2', 'Title')]
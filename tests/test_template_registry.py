@@ -0,0 +1,73 @@
+#/tests/test_template_registry.py
+import metadata_cache
+import services
+import template_registry
+from template_registry import SOURCE_DETAILS, SOURCE_TITLE
+
+
+def field_ids(field_map):
+    return {name: field['id'] for name, field in field_map.items()}
+
+
+def test_lru_eviction_ttl_and_marker_invalidation():
+    now = [0.0]
+    registry = template_registry.TemplateRegistry(max_entries=2, ttl=60, clock=lambda: now[0])
+    details = {'title': "T1", 'fields': [{'id': 11, 'name_singular': "Owner", 'field_type': "PICKER"}]}
+    registry.record(1, SOURCE_DETAILS, details, '"v1"')
+    registry.record(2, SOURCE_TITLE, {'title': "T2"}, '"a"')
+    assert field_ids(registry.get(1).field_map) == {'owner': 11} and registry.get(2, need_details=True) is None
+    registry.record(3, SOURCE_TITLE, {'title': "T3"}, '"b"')
+    assert registry.get(2) is None and registry.titles([1, 3]) == {1: "T1", 3: "T3"}
+
+    registry.record(1, SOURCE_TITLE, {'title': "T1"}, '"t1"')
+    registry.record(1, SOURCE_TITLE, {'title': "Renamed"}, '"t2"')
+    assert registry.get(1, need_details=True) is None and registry.get(1).title == "Renamed"
+    assert registry.is_stale(1, SOURCE_DETAILS) and not registry.is_stale(1, SOURCE_TITLE)
+    now[0] = 61
+    assert registry.get(3) is None and registry.is_stale(3, SOURCE_TITLE)
+    assert registry.stats['evictions'] == 1 and registry.stats['invalidations'] == 1
+
+
+def test_details_fill_titles_and_a_changed_etag_drops_the_entry(tmp_path, monkeypatch):
+    monkeypatch.setattr(services, "cache", metadata_cache.MetadataCache(str(tmp_path / "c.sqlite3"), "https://a"))
+    monkeypatch.setattr(services, "registry", template_registry.TemplateRegistry(ttl=0))
+    versions, calls = {'etag': '"v1"', 'fields': ["Owner"]}, []
+
+    def get_json_conditional(url, path, etag=None, last_modified=None):
+        calls.append((path, etag))
+        if etag == versions['etag']: return 304, None, etag, None
+        fields = [{'id': i, 'name_singular': name} for i, name in enumerate(versions['fields'], 1)]
+        return 200, {'id': 5, 'title': "Glossary", 'fields': fields}, versions['etag'], None
+
+    monkeypatch.setattr(services.alation_api, "get_json_conditional", get_json_conditional)
+    assert field_ids(services.template_info("https://a", 5).field_map) == {'owner': 1}
+    services.registry.ttl = 60
+    assert services.resolve_template_names("https://a", [5]) == [(5, "Glossary")]
+    assert services.cached_template_details("https://a", 5)['title'] == "Glossary"
+    assert len(calls) == 1
+
+    services.registry.ttl = 0
+    versions.update(etag='"v2"', fields=["Owner", "Steward"])
+    assert field_ids(services.template_info("https://a", 5).field_map) == {'owner': 1, 'steward': 2}
+    assert calls[1:] == [("/integration/v1/custom_template/5/", '"v1"')]
+    assert services.registry.stats['invalidations'] == 1
+
+
+def test_template_names_resolve_concurrently_in_id_order_and_failures_are_retried(monkeypatch):
+    monkeypatch.setattr(services, "cache", None)
+    monkeypatch.setattr(services, "registry", template_registry.TemplateRegistry(ttl=60))
+    calls, reachable = [], {3: "Policy", 7: "Term"}
+
+    def get_json_conditional(url, path, etag=None, last_modified=None):
+        template_id = int(path.rstrip('/').rsplit('/', 1)[1])
+        calls.append(template_id)
+        if template_id not in reachable: return 404, None, None, None
+        return 200, {'title': reachable[template_id], 'config': 'dropped'}, None, None
+
+    monkeypatch.setattr(services.alation_api, "get_json_conditional", get_json_conditional)
+    assert services.resolve_template_names("https://a", [7, 3, 9, 7], max_workers=3) == [
+        (3, "Policy"), (7, "Term"), (9, "ID: 9")]
+    assert sorted(calls) == [3, 7, 9]
+    reachable[9] = "Dataset"
+    assert services.resolve_template_names("https://a", [9, 3]) == [(3, "Policy"), (9, "Dataset")]
+    assert sorted(calls) == [3, 7, 9, 9]  # Known titles cost nothing; the placeholder was not remembered.